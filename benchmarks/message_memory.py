@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# Copyright (c) 2015 Sergey Bunatyan <sergey.bunatyan@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measures memory held by in-flight incoming messages.
+
+Creates N messages the way reader and preprocessor do (AMQP message with
+its own headers dict and body, then message object) and reports bytes per
+message: AMQP message, message object with its entry points, payload and
+context, excluding objects shared between messages.
+
+Usage:
+    python -m benchmarks.message_memory [-n 10000] [--decode]
+"""
+
+import argparse
+import gc
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from tavrida import messages  # noqa
+from tavrida import serialization  # noqa
+
+
+def deep_size(objects):
+    """
+    Returns total size of objects and everything reachable from them.
+    Each object is counted once, classes and modules are skipped
+    """
+    seen = set()
+    stack = list(objects)
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, (type, type(sys))):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        else:
+            if hasattr(obj, "__dict__"):
+                stack.append(obj.__dict__)
+            for cls in type(obj).__mro__:
+                for name in cls.__dict__.get("__slots__", ()):
+                    if hasattr(obj, name):
+                        stack.append(getattr(obj, name))
+    return total
+
+
+def make_amqp_message(i, codec):
+    # strings are built per message as pika does for every delivery
+    headers = {
+        "correlation_id": "correlation-%d" % i,
+        "request_id": "request-%d" % i,
+        "message_id": "message-%d" % i,
+        "message_type": "request",
+        "source": "client.%s" % "call",
+        "destination": "service.%s" % "method",
+        "reply_to": "client.%s" % "on_method",
+    }
+    body = codec.encode({"payload": {"param": i, "name": "value-%d" % i},
+                         "context": {"user": "user-%d" % i}})
+    return messages.AMQPMessage(body, headers, codec.content_type)
+
+
+def measure(count, decode):
+    codec = serialization.get_default_codec()
+    factory = messages.IncomingMessageFactory()
+    gc.collect()
+    held = []
+    for i in range(count):
+        message = factory.create(make_amqp_message(i, codec))
+        message.source, message.destination, message.reply_to
+        if decode:
+            message.payload
+        held.append(message)
+    return deep_size(held) - sys.getsizeof(held)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("-n", type=int, default=10000,
+                        help="number of in-flight messages")
+    parser.add_argument("--decode", action="store_true",
+                        help="access payload of every message")
+    args = parser.parse_args()
+    total = measure(args.n, args.decode)
+    print("messages: %d, decoded: %s" % (args.n, args.decode))
+    print("bytes per in-flight message: %.0f" % (float(total) / args.n))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# Copyright (c) 2015 Sergey Bunatyan <sergey.bunatyan@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measures throughput of message processing pipeline:
+PreProcessor -> RoutingTable -> Dispatcher -> ServiceController ->
+PostProcessor. Messages are published to in-memory driver, so only
+framework overhead is measured.
+
+For every message kind, payload size and number of service controllers
+reports messages per second, p50/p99 latency of one message, Python
+function calls per message and GC-tracked objects allocated per message.
+CPython 2 has no allocation tracer and its GC counter is decremented when
+objects are freed, so the last value counts objects that outlive the
+message (caches and leaks), while calls per message tracks the amount of
+work done in the hot path.
+
+Usage:
+    python -m benchmarks.pipeline [-n 5000] [--sizes 16,1024,65536]
+        [--controllers 1,10,100] [--kinds request,error,...]
+"""
+
+import argparse
+import gc
+import logging
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from tavrida import discovery  # noqa
+from tavrida import dispatcher  # noqa
+from tavrida import messages  # noqa
+from tavrida import postprocessor  # noqa
+from tavrida import preprocessor  # noqa
+from tavrida import router  # noqa
+from tavrida import serialization  # noqa
+from tavrida import service  # noqa
+
+CLIENT = "bench_client"
+REMOTE = "bench_remote"
+PUBLISHER = "bench_publisher_%d"
+SERVICE = "bench_%d"
+
+# message kind -> headers of incoming message for given service name
+KINDS = {
+    # call handled successfully, response is sent back
+    "request": lambda name, number: {
+        "message_type": "request",
+        "source": CLIENT + ".run",
+        "destination": name + ".echo",
+        "reply_to": CLIENT + ".on_echo",
+    },
+    # call failed in handler, error is sent back
+    "failed_request": lambda name, number: {
+        "message_type": "request",
+        "source": CLIENT + ".run",
+        "destination": name + ".fail",
+        "reply_to": CLIENT + ".on_fail",
+    },
+    "response": lambda name, number: {
+        "message_type": "response",
+        "source": REMOTE + ".call",
+        "destination": name + ".on_call",
+        "reply_to": "",
+    },
+    "error": lambda name, number: {
+        "message_type": "error",
+        "source": REMOTE + ".call",
+        "destination": name + ".on_call",
+        "reply_to": "",
+    },
+    "notification": lambda name, number: {
+        "message_type": "notification",
+        "source": PUBLISHER % number + ".event",
+        "destination": "",
+        "reply_to": "",
+    },
+}
+
+
+class FakeDriver(object):
+
+    """
+    Driver that counts published messages instead of sending them
+    """
+
+    def __init__(self):
+        super(FakeDriver, self).__init__()
+        self.published = 0
+
+    def publish_message(self, exchange, routing_key, message):
+        self.published += 1
+
+    def publish_messages(self, batch):
+        self.published += len(batch)
+
+
+def make_service_cls(number):
+    """
+    Creates and registers service controller with handlers for every
+    message kind
+    """
+    name = SERVICE % number
+
+    class BenchService(service.ServiceController):
+
+        @dispatcher.rpc_method(service=name, method="echo")
+        def echo(self, request, proxy, data):
+            return {"data": data}
+
+        @dispatcher.rpc_method(service=name, method="fail")
+        def fail(self, request, proxy, data):
+            raise ValueError("failed")
+
+        @dispatcher.rpc_response_method(service=REMOTE, method="call")
+        def on_call(self, response, proxy, data):
+            pass
+
+        @dispatcher.rpc_error_method(service=REMOTE, method="call")
+        def on_call_error(self, error, proxy):
+            pass
+
+        @dispatcher.subscription_method(service=PUBLISHER % number,
+                                        method="event")
+        def on_event(self, notification, proxy, data):
+            pass
+
+    BenchService.__name__ = "BenchService%d" % number
+    disc = discovery.LocalDiscovery()
+    disc.register_remote_service(CLIENT, "bench_client_exchange")
+    BenchService.set_discovery(disc)
+    return dispatcher.rpc_service(name)(BenchService)
+
+
+class Pipeline(object):
+
+    """
+    Server pipeline with given number of service controllers, assembled
+    the same way as server.Server does it
+    """
+
+    _service_classes = []
+
+    def __init__(self, controllers):
+        super(Pipeline, self).__init__()
+        while len(self._service_classes) < controllers:
+            self._service_classes.append(
+                make_service_cls(len(self._service_classes)))
+        self.driver = FakeDriver()
+        self.codec = serialization.get_default_codec()
+        services = []
+        for service_cls in self._service_classes[:controllers]:
+            postproc = postprocessor.PostProcessor(
+                self.driver, service_cls.get_discovery(), self.codec)
+            services.append(service_cls(postproc))
+        routing_table = router.Router().compile(services)
+        self.preprocessor = preprocessor.PreProcessor(routing_table,
+                                                      services)
+
+    def make_messages(self, kind, size, count):
+        """
+        Returns headers and body of incoming message for every controller
+        """
+        body = self.codec.encode({"payload": {"data": "x" * size},
+                                  "context": {}})
+        result = []
+        for number in range(count):
+            headers = KINDS[kind](SERVICE % number, number)
+            headers.update({"correlation_id": "correlation",
+                            "request_id": "request",
+                            "message_id": "message"})
+            result.append((headers, body))
+        return result
+
+    def process(self, headers, body):
+        # headers dict is created for every delivery as pika does
+        amqp_message = messages.AMQPMessage(body, dict(headers),
+                                            self.codec.content_type)
+        self.preprocessor.process(amqp_message)
+
+
+def percentile(sorted_values, percent):
+    index = int(round(percent / 100.0 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+def count_calls(func, *args):
+    calls = [0]
+
+    def profile(frame, event, arg):
+        if event == "call":
+            calls[0] += 1
+
+    sys.setprofile(profile)
+    try:
+        func(*args)
+    finally:
+        sys.setprofile(None)
+    return calls[0]
+
+
+def run_case(pipeline, kind, size, controllers, iterations):
+    inputs = pipeline.make_messages(kind, size, controllers)
+    timer = timeit.default_timer
+    for headers, body in inputs:
+        pipeline.process(headers, body)
+
+    calls = count_calls(pipeline.process, *inputs[0])
+
+    gc.collect()
+    gc.disable()
+    try:
+        retained = gc.get_count()[0]
+        for i in range(iterations):
+            pipeline.process(*inputs[i % len(inputs)])
+        retained = float(gc.get_count()[0] - retained) / (i + 1)
+    finally:
+        gc.enable()
+
+    latencies = []
+    started = timer()
+    for i in range(iterations):
+        headers, body = inputs[i % len(inputs)]
+        start = timer()
+        pipeline.process(headers, body)
+        latencies.append(timer() - start)
+    elapsed = timer() - started
+    latencies.sort()
+    return {
+        "kind": kind,
+        "size": size,
+        "controllers": controllers,
+        "rate": iterations / elapsed,
+        "p50": percentile(latencies, 50) * 1e6,
+        "p99": percentile(latencies, 99) * 1e6,
+        "calls": calls,
+        "retained": retained,
+    }
+
+
+ROW = ("{kind:<15} {size:>7} {controllers:>5} {rate:>10.0f} {p50:>9.1f} "
+       "{p99:>9.1f} {calls:>7} {retained:>8.1f}")
+HEADER = ("{:<15} {:>7} {:>5} {:>10} {:>9} {:>9} {:>7} {:>8}"
+          .format("kind", "size", "ctrls", "msgs/sec", "p50 us", "p99 us",
+                  "calls", "retained"))
+
+
+def parse_list(value, cast=str):
+    return [cast(item) for item in value.split(",") if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("-n", type=int, default=5000,
+                        help="messages per case")
+    parser.add_argument("--sizes", default="16,1024,65536",
+                        help="payload sizes in bytes, comma separated")
+    parser.add_argument("--controllers", default="1,10,100",
+                        help="numbers of service controllers")
+    parser.add_argument("--kinds", default=",".join(sorted(KINDS)),
+                        help="message kinds: %s" % ", ".join(sorted(KINDS)))
+    args = parser.parse_args()
+
+    # messages are logged as in production, but records are not written
+    logging.getLogger().addHandler(logging.NullHandler())
+    logging.getLogger().setLevel(logging.INFO)
+
+    print(HEADER)
+    for controllers in parse_list(args.controllers, int):
+        pipeline = Pipeline(controllers)
+        for kind in parse_list(args.kinds):
+            for size in parse_list(args.sizes, int):
+                result = run_case(pipeline, kind, size, controllers, args.n)
+                print(ROW.format(**result))
+
+
+if __name__ == "__main__":
+    main()
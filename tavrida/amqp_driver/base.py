@@ -45,6 +45,13 @@ class AbstractReader(AbstractClient):
     def stop(self):
         pass
 
+    def request_stop(self):
+        """
+        Asks reader to stop gracefully: messages that are being handled are
+        finished and acked, the rest are returned to broker
+        """
+        self.stop()
+
     @abc.abstractmethod
     def _on_message(self, message):
         pass
@@ -66,6 +73,16 @@ class AbstractWriter(AbstractClient):
     def publish_message(self, exchange, routing_key, message):
         pass
 
+    def publish_messages(self, messages):
+        """
+        Publishes several messages. Writers could redefine it to publish
+        all messages in one channel session
+
+        :param messages: list of (exchange, routing_key, message) tuples
+        :type messages: list
+        """
+        return [self.publish_message(*item) for item in messages]
+
     @abc.abstractmethod
     def create_exchange(self, exchange_name, ex_type):
         pass
@@ -77,6 +94,10 @@ class AbstractWriterFactory(object):
     def get_writer(self, config):
         pass
 
+    @abc.abstractmethod
+    def get_shared_writer(self, config):
+        pass
+
     @abc.abstractmethod
     def get_writer_by_reader(self, reader):
         pass
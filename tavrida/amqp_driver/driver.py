@@ -1,13 +1,19 @@
 import logging
 
+import memory
 import pika_async
+import pika_asyncio
 import pika_sync
 
 
 class AMQPDriver(object):
 
     def __init__(self, config):
-        if not config.async_engine:
+        if config.memory_engine:
+            self._engine = memory
+        elif config.asyncio_engine:
+            self._engine = pika_asyncio
+        elif not config.async_engine:
             self._engine = pika_sync
         else:
             self._engine = pika_async
@@ -16,6 +22,7 @@ class AMQPDriver(object):
         self._writer = None
         self.log = logging.getLogger(__name__)
         self._writer_factory = self._engine.WriterFactory()
+        self._confirming_publisher = None
 
     def create_reader(self, queue, preprocessor=None):
         return self._engine.Reader(self._config, queue, preprocessor)
@@ -23,12 +30,28 @@ class AMQPDriver(object):
     def create_writer(self):
         return self._writer_factory.get_writer(self._config)
 
+    def get_shared_writer(self):
+        return self._writer_factory.get_shared_writer(self._config)
+
     def _get_blocking_writer(self):
+        if self._config.memory_engine:
+            return memory.Writer(self._config)
         return pika_sync.Writer(self._config)
 
     def _get_blocking_reader(self, queue, preprocessor=None):
+        if self._config.memory_engine:
+            return memory.Reader(self._config, queue, preprocessor)
         return pika_sync.Reader(self._config, queue, preprocessor)
 
+    def create_reply_reader(self, queue, preprocessor):
+        """
+        Creates blocking reader of exclusive reply queue of client. The
+        queue is declared on connection of reader, whatever engine is used
+        """
+        if self._config.memory_engine:
+            return memory.ReplyReader(self._config, queue, preprocessor)
+        return pika_sync.ReplyReader(self._config, queue, preprocessor)
+
     def create_queue(self, queue):
         reader = self._get_blocking_reader(queue)
         reader.create_queue()
@@ -42,19 +65,108 @@ class AMQPDriver(object):
         reader = self._get_blocking_reader(queue)
         reader.bind_queue(exchange, routing_key)
 
-    def publish_message(self, exchange, routing_key, message):
+    def declare_topology(self, topology):
+        """
+        Declares all structures of topology over one connection
+
+        :param topology: exchanges, queues and bindings to declare
+        :type topology: topology.Topology
+        """
+        if self._config.memory_engine:
+            declarer = memory.TopologyDeclarer(self._config, topology)
+        else:
+            declarer = pika_async.TopologyDeclarer(self._config, topology)
+        declarer.declare()
+
+    def _confirms_enabled(self):
+        # in-process broker enqueues message before publish returns
+        return (self._config.publisher_confirms and
+                not self._config.memory_engine)
+
+    def _get_confirming_publisher(self):
+        if not self._confirming_publisher:
+            self._confirming_publisher = pika_async.Publisher(self._config)
+        return self._confirming_publisher
+
+    def _get_writer(self):
         if self._reader:
-            self._writer = self._writer_factory.get_writer_by_reader(
-                self._reader)
+            return self._writer_factory.get_writer_by_reader(self._reader)
         else:
-            self._writer = self.create_writer()
+            return self.get_shared_writer()
+
+    def publish_message(self, exchange, routing_key, message, callback=None):
+        """
+        Publishes message to exchange.
+        In confirm mode (config.publisher_confirms) message is published via
+        separate confirming publisher and confirmation object is returned.
+
+        :param exchange: exchange name
+        :type exchange: string
+        :param routing_key: routing key
+        :type routing_key: string
+        :param message: AMQP message to send
+        :type message: messages.AMQPMessage
+        :param callback: callable that gets confirmation when broker
+            confirms the message (confirm mode only)
+        :type callback: callable
+        :return: confirmation in confirm mode, None otherwise
+        :rtype: pika_async.Confirmation
+        """
+        if self._confirms_enabled():
+            publisher = self._get_confirming_publisher()
+            return publisher.publish_message(exchange, routing_key, message,
+                                             callback)
+        self._writer = self._get_writer()
         self._writer.publish_message(exchange, routing_key, message)
 
+    def publish_messages(self, messages, callback=None):
+        """
+        Publishes several messages in one channel session
+
+        :param messages: list of (exchange, routing_key, message) tuples
+        :type messages: list
+        :param callback: callable that gets confirmation of every message
+            (confirm mode only)
+        :type callback: callable
+        :return: list of confirmations in confirm mode, None otherwise
+        :rtype: list
+        """
+        if self._confirms_enabled():
+            publisher = self._get_confirming_publisher()
+            return publisher.publish_messages(messages, callback)
+        self._writer = self._get_writer()
+        self._writer.publish_messages(messages)
+
+    def wait_for_confirms(self, timeout=None, confirmations=None):
+        """
+        Waits until messages published in confirm mode are confirmed,
+        rejected or lost with connection
+
+        :param timeout: time to wait in seconds, None means infinite
+        :type timeout: float
+        :param confirmations: confirmations to wait for, all messages by
+            default
+        :type confirmations: list of pika_async.Confirmation
+        :return: True if all messages are resolved
+        :rtype: bool
+        """
+        if not self._confirming_publisher:
+            return True
+        return self._confirming_publisher.wait_for_confirms(timeout,
+                                                            confirmations)
+
     def listen(self, queue, preprocessor=None):
         reader = self.create_reader(queue, preprocessor)
         self._reader = reader
         reader.run()
 
+    def stop_listening(self):
+        """
+        Asks reader started by listen() to stop gracefully
+        """
+        if self._reader:
+            self._reader.request_stop()
+
     @property
     def reader(self):
         return self._reader
@@ -64,8 +176,19 @@ class AMQPDriver(object):
         return self._writer
 
     def send_heartbeat_via_reader(self):
-        if isinstance(self.reader, pika_async.Reader):
-            self.log.warning("Pika is unable to send heartbeats in async mode")
+        if isinstance(self.reader, memory.Reader):
+            # in-process broker has no connection to keep alive
+            return True
+        elif self.reader.concurrent:
+            # connection thread (or ioloop) answers heartbeats while
+            # handlers run in workers
+            return True
+        elif isinstance(self.reader, pika_asyncio.Reader):
+            self.log.warning("Pika is unable to send heartbeats from event "
+                             "loop callback, make long handlers coroutines")
+        elif isinstance(self.reader, pika_async.Reader):
+            self.log.warning("Pika is unable to send heartbeats from ioloop "
+                             "callback, enable background_heartbeats")
         else:
             conn = self.reader.connection
             try:
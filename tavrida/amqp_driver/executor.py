@@ -0,0 +1,114 @@
+import logging
+import Queue
+import threading
+
+
+class HandlerExecutor(object):
+
+    """
+    Runs message handlers in a pool of worker threads.
+
+    Each worker has its own queue (lane). Messages are distributed between
+    lanes by correlation_id, so messages with the same correlation_id are
+    handled one by one in the order of delivery, while messages of different
+    requests are handled concurrently.
+    Results are not acked by workers: they are put to the completion queue
+    that is drained by the connection thread (see completed), because pika
+    connections are not thread safe.
+    When connection is lost reset() should be called: results of messages
+    delivered via the old channel are dropped, broker redelivers them.
+    """
+
+    def __init__(self, workers, handler):
+        super(HandlerExecutor, self).__init__()
+        self.log = logging.getLogger(__name__)
+        self._handler = handler
+        self._lanes = [Queue.Queue() for _ in range(max(workers, 1))]
+        self._completed = Queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._in_progress = 0
+        self._epoch = 0
+
+    @property
+    def workers(self):
+        return len(self._lanes)
+
+    @property
+    def in_progress(self):
+        """
+        Number of submitted messages that are not completed yet
+        """
+        return self._in_progress
+
+    def start(self):
+        if self._threads:
+            return
+        for lane in self._lanes:
+            thread = threading.Thread(target=self._work, args=(lane,))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        for lane in self._lanes:
+            lane.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _get_lane(self, message):
+        correlation_id = message.headers.get("correlation_id")
+        return self._lanes[hash(correlation_id) % len(self._lanes)]
+
+    def submit(self, message, frame):
+        """
+        Schedules message handling
+
+        :param message: incoming AMQP message
+        :type message: messages.AMQPMessage
+        :param frame: delivery frame that should be acked after handling
+        """
+        with self._lock:
+            self._in_progress += 1
+        self._get_lane(message).put((message, frame, self._epoch))
+
+    def _work(self, lane):
+        while True:
+            item = lane.get()
+            if item is None:
+                break
+            message, frame, epoch = item
+            error = None
+            try:
+                self._handler(message)
+            except Exception as e:
+                self.log.exception(e)
+                error = e
+            self._completed.put((frame, error, epoch))
+
+    def completed(self):
+        """
+        Generates (frame, error) pairs of handled messages in order of
+        completion. Doesn't block
+
+        :return: generator of (frame, exception or None)
+        """
+        while True:
+            try:
+                item = self._completed.get_nowait()
+            except Queue.Empty:
+                break
+            frame, error, epoch = item
+            with self._lock:
+                self._in_progress -= 1
+            if epoch == self._epoch:
+                yield frame, error
+
+    def reset(self):
+        """
+        Forgets messages submitted before the call: their results won't be
+        returned by completed()
+        """
+        with self._lock:
+            self._epoch += 1
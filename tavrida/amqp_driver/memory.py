@@ -0,0 +1,507 @@
+import collections
+import itertools
+import logging
+import threading
+import time
+
+import base
+import executor
+from tavrida import exceptions
+from tavrida import messages
+from tavrida import timings
+
+
+def topic_matches(binding_key, routing_key):
+    """
+    Checks routing key against binding key of topic exchange.
+    "*" matches exactly one word, "#" matches zero or more words
+
+    :param binding_key: binding key, e.g. "service.#"
+    :type binding_key: string
+    :param routing_key: routing key of message, e.g. "service.method"
+    :type routing_key: string
+    :rtype: bool
+    """
+    return _match_words(binding_key.split("."), routing_key.split("."))
+
+
+def _match_words(pattern, words):
+    if not pattern:
+        return not words
+    head = pattern[0]
+    if head == "#":
+        return any(_match_words(pattern[1:], words[i:])
+                   for i in range(len(words) + 1))
+    if not words:
+        return False
+    if head == "*" or head == words[0]:
+        return _match_words(pattern[1:], words[1:])
+    return False
+
+
+class Delivery(object):
+
+    """
+    Delivery frame of in-memory queue, is acked by delivery_tag
+    """
+
+    __slots__ = ("delivery_tag",)
+
+    def __init__(self, delivery_tag):
+        self.delivery_tag = delivery_tag
+
+
+class MemoryQueue(object):
+
+    """
+    Bounded queue of in-memory broker.
+    Delivered messages stay unacked until ack() or reject(), rejected
+    messages are returned to the head of the queue. Only ready messages are
+    counted by max_size: publisher waits for free space up to given
+    timeout.
+    """
+
+    def __init__(self, name, max_size):
+        super(MemoryQueue, self).__init__()
+        self._name = name
+        self._max_size = max_size
+        self._ready = collections.deque()
+        self._unacked = {}
+        self._tags = itertools.count(1)
+        self._cond = threading.Condition()
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    def __len__(self):
+        return len(self._ready)
+
+    @property
+    def unacked_count(self):
+        return len(self._unacked)
+
+    def _is_full(self):
+        return self._max_size and len(self._ready) >= self._max_size
+
+    def put(self, message, timeout=None):
+        """
+        Appends message to the queue
+
+        :param message: AMQP message
+        :type message: messages.AMQPMessage
+        :param timeout: time (secs) to wait for free space, None means
+            infinite
+        :type timeout: float
+        """
+        with self._cond:
+            if self._is_full():
+                deadline = None if timeout is None else time.time() + timeout
+                while self._is_full():
+                    remaining = (None if deadline is None
+                                 else deadline - time.time())
+                    if remaining is not None and remaining <= 0:
+                        raise exceptions.QueueIsFull(queue=self._name)
+                    self._cond.wait(remaining)
+            self._ready.append(message)
+            self._cond.notify_all()
+
+    def get(self, timeout=None, prefetch_count=None):
+        """
+        Takes the first ready message. Message is kept until it is acked or
+        rejected
+
+        :param timeout: time (secs) to wait for message, None means infinite
+        :type timeout: float
+        :param prefetch_count: maximal number of unacked messages
+        :type prefetch_count: int
+        :return: delivery and message or None if there is no message
+        :rtype: tuple
+        """
+        with self._cond:
+            deadline = None if timeout is None else time.time() + timeout
+            while (not self._ready or
+                   (prefetch_count and
+                    len(self._unacked) >= prefetch_count)):
+                remaining = (None if deadline is None
+                             else deadline - time.time())
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            message = self._ready.popleft()
+            delivery = Delivery(next(self._tags))
+            self._unacked[delivery.delivery_tag] = message
+            self._cond.notify_all()
+            return delivery, message
+
+    def ack(self, delivery_tag):
+        with self._cond:
+            self._unacked.pop(delivery_tag, None)
+            self._cond.notify_all()
+
+    def reject(self, delivery_tag, requeue=True):
+        with self._cond:
+            message = self._unacked.pop(delivery_tag, None)
+            if message is not None and requeue:
+                self._ready.appendleft(message)
+            self._cond.notify_all()
+
+
+class Broker(object):
+
+    """
+    In-process message broker with RabbitMQ routing semantics: messages
+    are published to exchanges (topic, direct or fanout) and routed to
+    bound queues. Message that matches no binding is dropped. Default
+    exchange ("") routes message to queue named by routing key.
+    Every queue gets its own copy of message headers as if message was
+    received from network.
+    """
+
+    EXCHANGE_TYPES = ("topic", "direct", "fanout")
+
+    def __init__(self):
+        super(Broker, self).__init__()
+        self._lock = threading.Lock()
+        self._exchanges = {}
+        self._queues = {}
+        # exchange name -> list of (queue, binding_key)
+        self._bindings = {}
+        # (exchange name, routing key) -> list of queues
+        self._routes = {}
+
+    def declare_exchange(self, exchange_name, ex_type="topic"):
+        if ex_type not in self.EXCHANGE_TYPES:
+            raise ValueError("Exchange type %s is not supported" % ex_type)
+        with self._lock:
+            self._exchanges.setdefault(exchange_name, ex_type)
+            self._bindings.setdefault(exchange_name, [])
+
+    def declare_queue(self, queue_name, max_size=None):
+        with self._lock:
+            if queue_name not in self._queues:
+                self._queues[queue_name] = MemoryQueue(queue_name, max_size)
+            return self._queues[queue_name]
+
+    def get_queue(self, queue_name):
+        try:
+            return self._queues[queue_name]
+        except KeyError:
+            raise exceptions.QueueNotFound(queue=queue_name)
+
+    def delete_queue(self, queue_name):
+        with self._lock:
+            queue = self._queues.pop(queue_name, None)
+            if queue is None:
+                return
+            for exchange_name, bindings in self._bindings.items():
+                self._bindings[exchange_name] = [
+                    binding for binding in bindings if binding[0] is not queue]
+            self._routes.clear()
+
+    def bind_queue(self, queue_name, exchange_name, routing_key):
+        with self._lock:
+            if exchange_name not in self._exchanges:
+                raise exceptions.ExchangeNotFound(exchange=exchange_name)
+            if queue_name not in self._queues:
+                raise exceptions.QueueNotFound(queue=queue_name)
+            binding = (self._queues[queue_name], routing_key)
+            if binding not in self._bindings[exchange_name]:
+                self._bindings[exchange_name].append(binding)
+            self._routes.clear()
+
+    def _route(self, exchange_name, routing_key):
+        if exchange_name == "":
+            # Default exchange: routing key is the name of queue
+            queue = self._queues.get(routing_key)
+            return [queue] if queue is not None else []
+        key = (exchange_name, routing_key)
+        try:
+            return self._routes[key]
+        except KeyError:
+            pass
+        with self._lock:
+            try:
+                ex_type = self._exchanges[exchange_name]
+            except KeyError:
+                raise exceptions.ExchangeNotFound(exchange=exchange_name)
+            queues = []
+            for queue, binding_key in self._bindings[exchange_name]:
+                if queue in queues:
+                    continue
+                if (ex_type == "fanout" or
+                        (ex_type == "direct" and
+                         binding_key == routing_key) or
+                        (ex_type == "topic" and
+                         topic_matches(binding_key, routing_key))):
+                    queues.append(queue)
+            self._routes[key] = queues
+            return queues
+
+    def publish(self, exchange_name, routing_key, message, timeout=None):
+        """
+        Routes message to queues bound to exchange
+
+        :param exchange_name: exchange name
+        :type exchange_name: string
+        :param routing_key: routing key
+        :type routing_key: string
+        :param message: AMQP message
+        :type message: messages.AMQPMessage
+        :param timeout: time (secs) to wait for free space in full queue
+        :type timeout: float
+        :return: number of queues message is routed to
+        :rtype: int
+        """
+        queues = self._route(exchange_name, routing_key)
+        for queue in queues:
+            queue.put(messages.AMQPMessage(message.body,
+                                           dict(message.headers),
+                                           message.content_type,
+                                           message.content_encoding),
+                      timeout)
+        return len(queues)
+
+
+_brokers = {}
+_brokers_lock = threading.Lock()
+
+
+def get_broker(virtual_host="/"):
+    """
+    Returns in-process broker of virtual host. Brokers live as long as
+    process
+
+    :rtype: Broker
+    """
+    with _brokers_lock:
+        if virtual_host not in _brokers:
+            _brokers[virtual_host] = Broker()
+        return _brokers[virtual_host]
+
+
+def reset_brokers():
+    """
+    Drops all in-process brokers with their queues and messages
+    """
+    with _brokers_lock:
+        _brokers.clear()
+
+
+class MemoryClient(base.AbstractClient):
+
+    """
+    Client of in-process broker. Connection is the broker of virtual host
+    """
+
+    def __init__(self, config):
+        super(MemoryClient, self).__init__(config)
+        self._connection = None
+
+    def connect(self):
+        if not self._connection:
+            self._connection = get_broker(self.config.virtual_host)
+        return self._connection
+
+    def close_connection(self):
+        self._connection = None
+
+
+class Reader(MemoryClient, base.AbstractReader):
+
+    """
+    Consumes messages of in-memory queue. Messages are acked (or rejected
+    and requeued on NackableException) after handling, as in sync engine
+    """
+
+    # How often (secs) consumer loop wakes up to ack handled messages
+    # and to check stop requests if there are no deliveries
+    ACK_INTERVAL = 0.05
+
+    def __init__(self, config, queue, preprocessor):
+        super(Reader, self).__init__(config)
+        self.log = logging.getLogger(__name__)
+        self._queue = queue
+        self._queue_size = config.memory_queue_size
+        self.preprocessor = preprocessor
+        self._prefetch_count = config.get_prefetch_count()
+        self._memory_queue = None
+        self._unacked = set()
+        self._executor = None
+        self._stopping = False
+        if config.get_handler_workers():
+            self._executor = executor.HandlerExecutor(
+                config.get_handler_workers(), self._process)
+
+    @property
+    def concurrent(self):
+        return self._executor is not None
+
+    def _consume(self):
+        if self._executor:
+            self._executor.start()
+        while not self._stopping:
+            item = self._memory_queue.get(self.ACK_INTERVAL,
+                                          self._prefetch_count)
+            if item:
+                frame, msg = item
+                self._unacked.add(frame.delivery_tag)
+                self._on_message(msg, frame)
+            if self._executor:
+                self._finish_completed()
+        if self._executor:
+            self._executor.stop()
+            self._finish_completed()
+
+    def run(self):
+        self._memory_queue = self.connect().get_queue(self._queue)
+        try:
+            self._consume()
+        finally:
+            self.close_connection()
+
+    def request_stop(self):
+        """
+        Asks consumer loop to stop after current message. Is safe to call
+        from signal handler
+        """
+        self._stopping = True
+
+    def stop(self):
+        self._stopping = True
+
+    def close_connection(self):
+        # messages that are not acked are returned to queue as broker does
+        # when consumer disconnects
+        for delivery_tag in self._unacked:
+            self._memory_queue.reject(delivery_tag)
+        self._unacked.clear()
+        super(Reader, self).close_connection()
+
+    def _ack(self, frame):
+        self._unacked.discard(frame.delivery_tag)
+        self._memory_queue.ack(frame.delivery_tag)
+
+    def _reject(self, frame):
+        self._unacked.discard(frame.delivery_tag)
+        self._memory_queue.reject(frame.delivery_tag)
+
+    def _finish(self, frame, error):
+        if isinstance(error, exceptions.NackableException):
+            self._reject(frame)
+        else:
+            self._ack(frame)
+
+    def _finish_completed(self):
+        for frame, error in self._executor.completed():
+            self._finish(frame, error)
+
+    def _process(self, msg):
+        return self.preprocessor.process(msg)
+
+    def _on_message(self, msg, frame):
+        timings.stamp(msg.headers, timings.RECEIVED_AT)
+        if self._executor:
+            self._executor.submit(msg, frame)
+            return
+        try:
+            self._process(msg)
+        except Exception as e:
+            self.log.exception(e)
+            self._finish(frame, e)
+        else:
+            self._finish(frame, None)
+
+    def create_queue(self):
+        self.connect().declare_queue(self._queue, self._queue_size)
+
+    def bind_queue(self, exchange_name, routing_key):
+        self.connect().bind_queue(self._queue, exchange_name, routing_key)
+
+
+class ReplyReader(Reader):
+
+    """
+    Consumes replies from queue of client. The queue is declared on connect
+    and deleted on disconnect as exclusive auto-delete queue of RabbitMQ.
+    """
+
+    def __init__(self, config, queue, preprocessor):
+        super(ReplyReader, self).__init__(config, queue, preprocessor)
+        self._executor = None
+
+    def connect(self):
+        broker = super(ReplyReader, self).connect()
+        broker.declare_queue(self._queue, self._queue_size)
+        return broker
+
+    def close_connection(self):
+        broker = self._connection
+        super(ReplyReader, self).close_connection()
+        if broker:
+            broker.delete_queue(self._queue)
+
+
+class Writer(MemoryClient, base.AbstractWriter):
+
+    """
+    Publishes messages to in-process broker. If destination queue is full,
+    waits for free space up to socket_timeout of config.
+    Writer is thread safe
+    """
+
+    def __init__(self, config):
+        super(Writer, self).__init__(config)
+        self.log = logging.getLogger(__name__)
+
+    def publish_message(self, exchange, routing_key, message):
+        self.connect().publish(exchange, routing_key, message,
+                               self.config.socket_timeout)
+
+    def create_exchange(self, exchange_name, ex_type):
+        self.connect().declare_exchange(exchange_name, ex_type)
+
+
+class WriterFactory(base.AbstractWriterFactory):
+
+    def __init__(self):
+        super(WriterFactory, self).__init__()
+        self._writer = None
+        self._lock = threading.Lock()
+
+    def get_writer(self, config):
+        return Writer(config)
+
+    def get_shared_writer(self, config):
+        with self._lock:
+            if not self._writer:
+                self._writer = Writer(config)
+        return self._writer
+
+    def get_writer_by_reader(self, reader):
+        return self.get_shared_writer(reader.config)
+
+
+class TopologyDeclarer(MemoryClient):
+
+    """
+    Declares exchanges, queues and bindings of topology in in-process
+    broker
+    """
+
+    def __init__(self, config, topology):
+        super(TopologyDeclarer, self).__init__(config)
+        self._topology = topology
+
+    def declare(self):
+        broker = self.connect()
+        for exchange_name, ex_type in self._topology.exchanges:
+            broker.declare_exchange(exchange_name, ex_type)
+        for queue_name in self._topology.queues:
+            broker.declare_queue(queue_name, self.config.memory_queue_size)
+        for queue_name, exchange_name, routing_key in self._topology.bindings:
+            broker.bind_queue(queue_name, exchange_name, routing_key)
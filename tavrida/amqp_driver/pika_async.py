@@ -1,10 +1,16 @@
+import collections
+import functools
 import logging
+import threading
+import time
 
 import pika
 
 import base
+import executor
 from tavrida import exceptions
 from tavrida import messages
+from tavrida import timings
 
 
 class BasePikaAsync(base.AbstractClient):
@@ -167,6 +173,10 @@ class Reader(BasePikaAsync, base.AbstractReader, base.AbstractWriter):
     commands that were issued and that should surface in the output as well.
 
     """
+
+    # How often (secs) ioloop acks messages handled by workers
+    ACK_INTERVAL = 0.01
+
     def __init__(self, config, queue, preprocessor):
         """Create a new instance of the consumer class, passing in the AMQP
         URL used to connect to RabbitMQ.
@@ -180,6 +190,15 @@ class Reader(BasePikaAsync, base.AbstractReader, base.AbstractWriter):
         self.log = logging.getLogger(__name__)
         self._queue = queue
         self.preprocessor = preprocessor
+        self._prefetch_count = config.get_prefetch_count()
+        self._executor = None
+        if config.get_handler_workers():
+            self._executor = executor.HandlerExecutor(
+                config.get_handler_workers(), self._process)
+
+    @property
+    def concurrent(self):
+        return self._executor is not None
 
     def create_queue(self):
         """Setup the queue on RabbitMQ by invoking the Queue.Declare RPC
@@ -214,9 +233,17 @@ class Reader(BasePikaAsync, base.AbstractReader, base.AbstractWriter):
         consumer with RabbitMQ. We keep the value to use it when we want to
         cancel consuming. The on_message method is passed in as a callback pika
         will invoke when a message is fully received.
+        If handlers run in workers, prefetch count is set and periodic ack
+        of handled messages is scheduled in ioloop.
 
         """
         self._add_on_cancel_callback()
+        if self._prefetch_count:
+            self._channel.basic_qos(prefetch_count=self._prefetch_count)
+        if self._executor:
+            self._executor.reset()
+            self._executor.start()
+            self._schedule_finish_completed()
         self._consumer_tag = self._channel.basic_consume(self.on_message,
                                                          self._queue)
 
@@ -252,7 +279,9 @@ class Reader(BasePikaAsync, base.AbstractReader, base.AbstractWriter):
         :param str|unicode body: The message body
 
         """
-        msg = messages.AMQPMessage(body, properties.headers)
+        msg = messages.AMQPMessage(body, properties.headers,
+                                   properties.content_type,
+                                   properties.content_encoding)
         self._on_message(msg, basic_deliver)
 
     def _ack(self, frame):
@@ -269,17 +298,43 @@ class Reader(BasePikaAsync, base.AbstractReader, base.AbstractWriter):
         self.log.debug("Rejected frame with delivery tag %s",
                        frame.delivery_tag)
 
+    def _finish(self, frame, error):
+        if isinstance(error, exceptions.NackableException):
+            self._reject(frame)
+        else:
+            self._ack(frame)
+
+    def _schedule_finish_completed(self):
+        self._connection.add_timeout(self.ACK_INTERVAL,
+                                     self._finish_completed)
+
+    def _finish_completed(self):
+        """
+        Acks or rejects messages handled by workers. Is called by ioloop
+        timer, reschedules itself while channel is open
+        """
+        if not self._channel:
+            return
+        for frame, error in self._executor.completed():
+            self._finish(frame, error)
+        if not self._closing:
+            self._schedule_finish_completed()
+
+    def _process(self, msg):
+        return self.preprocessor.process(msg)
+
     def _on_message(self, msg, frame):
+        timings.stamp(msg.headers, timings.RECEIVED_AT)
+        if self._executor:
+            self._executor.submit(msg, frame)
+            return
         try:
-            self.preprocessor.process(msg)
+            self._process(msg)
         except Exception as e:
             self.log.exception(e)
-            if isinstance(e, exceptions.NackableException):
-                self._reject(frame)
-            else:
-                self._ack(frame)
+            self._finish(frame, e)
         else:
-            self._ack(frame)
+            self._finish(frame, None)
 
     def stop_consuming(self):
         """Tell RabbitMQ that you would like to stop consuming by sending the
@@ -313,17 +368,30 @@ class Reader(BasePikaAsync, base.AbstractReader, base.AbstractWriter):
         """
         self.log.info('Stopping')
         self._closing = True
+        if self._executor:
+            self._executor.stop()
+            self._finish_completed()
         self.stop_consuming()
         self.close_channel()
         self.close_connection()
         self._connection.ioloop.stop()
         self.log.info('Stopped')
 
+    def request_stop(self):
+        """Schedules stop in ioloop, so it could be called from signal
+        handler while ioloop is polling.
+
+        """
+        self._connection.add_timeout(0, self.stop)
+
     def create_exchange(self, exchange_name, ex_type):
         ExchangeCreator(self._config, exchange_name, ex_type).create_exchange()
 
     def publish_message(self, exchange, routing_key, message):
-        props = pika.BasicProperties(headers=message.headers)
+        props = pika.BasicProperties(
+            headers=message.headers,
+            content_type=message.content_type,
+            content_encoding=message.content_encoding)
         self._channel.basic_publish(exchange=exchange,
                                     routing_key=routing_key,
                                     body=message.body,
@@ -336,75 +404,449 @@ class Writer(BasePikaAsync, base.AbstractWriter):
         super(Writer, self).__init__(config)
         self._config = config.to_pika_params()
         self.log = logging.getLogger(__name__)
-        self._publish_interval = 0
+        self._publisher = Publisher(config)
+
+    @property
+    def publisher(self):
+        return self._publisher
 
     def create_exchange(self, exchange_name, ex_type):
         ExchangeCreator(self._config, exchange_name, ex_type).create_exchange()
 
     def publish_message(self, exchange, routing_key, message):
-        Publisher(self._config, exchange, routing_key, message)\
-            .publish_message()
+        self._publisher.publish_message(exchange, routing_key, message)
 
+    def publish_messages(self, messages):
+        self._publisher.publish_messages(messages)
 
-class Publisher(object):
+    def close_connection(self):
+        self._publisher.close_connection()
 
-    def __init__(self, config, exchange_name, routing_key, message):
-        self._config = config
-        self._exchange_name = exchange_name
-        self._routing_key = routing_key
-        self._message = message
+
+class Confirmation(object):
+
+    """
+    Result of message publication in confirm mode.
+    Is resolved when broker acknowledges (acked is True) or rejects
+    (acked is False) the message. If connection is lost before
+    confirmation, message is not published again (it could have reached the
+    broker) and confirmation is resolved as not acknowledged with lost flag,
+    so caller decides whether to publish it again.
+    Confirmations are resolved and callbacks are called by the thread that
+    drives publisher connection: the one that publishes or waits for
+    confirms (see Publisher.wait_for_confirms).
+    """
+
+    def __init__(self, callback=None):
+        super(Confirmation, self).__init__()
+        self._acked = None
+        self._lost = False
+        self._callbacks = [callback] if callback else []
         self.log = logging.getLogger(__name__)
 
+    @property
+    def acked(self):
+        return self._acked
+
+    @property
+    def lost(self):
+        return self._lost
+
+    def done(self):
+        return self._acked is not None
+
+    def add_done_callback(self, callback):
+        """
+        Adds callback that is called with confirmation when it is resolved
+
+        :param callback: callable with one argument
+        :type callback: callable
+        """
+        if self.done():
+            callback(self)
+        else:
+            self._callbacks.append(callback)
+
+    def resolve(self, acked, lost=False):
+        self._acked = acked
+        self._lost = lost
+        for callback in self._callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                self.log.exception(e)
+        self._callbacks = []
+
+
+class Publisher(BasePikaAsync):
+
+    """
+    Long-lived publisher that owns a single SelectConnection and channel.
+
+    The publisher has its own connection and is not attached to reader
+    ioloop: it is used by worker threads of concurrent readers, by clients
+    and in confirm mode, i.e. by code that doesn't run in the reader ioloop
+    thread. Handlers that run in the ioloop of a non-concurrent reader
+    publish via the reader channel (see WriterFactory.get_writer_by_reader)
+    and don't wait for this publisher. In confirm mode the reader ioloop is
+    blocked while handler waits for free confirm window.
+
+    Messages are put to outbound buffer and written to the channel by the
+    publishing thread, which drives the connection ioloop until pika writes
+    all frames to socket (the socket is flushed when it becomes writable).
+    Messages that were not flushed when connection was lost are published
+    again after reconnect. Publication is serialized by lock, so one
+    publisher can be shared between threads.
+
+    If config.publisher_confirms is set, channel is put to confirm mode.
+    Publication doesn't wait for acknowledgement: up to config.confirm_window
+    messages are kept in flight and are confirmed by Basic.Ack/Basic.Nack
+    frames processed by ioloop. Messages that are not confirmed when
+    connection is lost are not published again, their confirmations are
+    resolved as lost. Without confirms delivery is at-least-once: messages
+    that were not flushed are published again and could be duplicated.
+    """
+
+    def __init__(self, config):
+        super(Publisher, self).__init__(config)
+        self._pending = collections.deque()
+        self._unflushed = []
+        self._open_error = None
+        self._lock = threading.RLock()
+        self._confirms = config.publisher_confirms
+        self._window = max(config.confirm_window or 1, 1)
+        self._delivery_tag = 0
+        self._unconfirmed = collections.OrderedDict()
+
+    @property
+    def is_open(self):
+        return bool(self._connection and self._connection.is_open and
+                    self._channel and self._channel.is_open)
+
+    @property
+    def pending_count(self):
+        """
+        Number of messages that are not written to socket yet
+        """
+        return len(self._pending) + len(self._unflushed)
+
+    @property
+    def unconfirmed_count(self):
+        """
+        Number of messages that are waiting for broker confirmation
+        """
+        return len(self._unconfirmed)
+
     def connect(self):
-        """This method connects to RabbitMQ, returning the connection handle.
-        When the connection is established, the on_connection_open method
-        will be invoked by pika. If you want the reconnection to work, make
-        sure you set stop_ioloop_on_close to False, which is not the default
-        behavior of this adapter.
+        """Creates SelectConnection. The ioloop is not started, it is driven
+        by the publishing thread (see _run_ioloop_once).
 
         :rtype: pika.SelectConnection
 
         """
         return pika.SelectConnection(self._config,
-                                     self._open_channel,
+                                     self.on_connection_open,
+                                     self._on_connection_open_error,
                                      stop_ioloop_on_close=False)
 
-    def _open_channel(self, unused_connection):
-        """Open a new channel with RabbitMQ by issuing the Channel.Open RPC
-        command. When RabbitMQ responds that the channel is open, the
-        on_channel_open callback will be invoked by pika.
+    def _on_connection_open_error(self, unused_connection, error=None):
+        """Invoked by pika if connection can't be established
+
+        :param pika.connection.Connection unused_connection: The connection
+        :param error: Error description
 
         """
-        self._connection.channel(on_open_callback=self._on_channel_open)
+        self._open_error = error or "Connection can't be opened"
 
-    def _on_channel_open(self, channel):
-        """This method is invoked by pika when the channel has been opened.
-        The channel object is passed in so we can make use of it.
+    def _on_connection_closed(self, connection, reply_code, reply_text):
+        """Invoked by pika when the connection is closed. Messages that were
+        not flushed to socket are returned to the outbound buffer to be
+        published via new connection, in confirm mode unconfirmed messages
+        are reported as lost instead.
 
-        Since the channel is now open, we'll declare the exchange to use.
+        """
+        self._channel = None
+        if not self._closing:
+            self.log.warning("Publisher connection closed (%s) %s",
+                             reply_code, reply_text)
+            self._requeue_unflushed()
+
+    def _on_channel_open(self, channel):
+        """Invoked by pika when the channel has been opened. Enables
+        confirm mode if it is configured.
 
         :param pika.channel.Channel channel: The channel object
 
         """
-        self._channel = channel
-        self._publish_message()
+        super(Publisher, self)._on_channel_open(channel)
+        if self._confirms:
+            self._delivery_tag = 0
+            self._channel.confirm_delivery(self._on_delivery_confirmation)
 
-    def _publish_message(self):
-        props = pika.BasicProperties(headers=self._message.headers)
-        self._channel.basic_publish(exchange=self._exchange_name,
-                                    routing_key=self._routing_key,
-                                    body=self._message.body,
-                                    properties=props)
-        self.close_connection()
+    def _on_delivery_confirmation(self, method_frame):
+        """Invoked by pika when RabbitMQ responds to Basic.Publish in confirm
+        mode. One frame can confirm all messages up to the delivery tag if
+        'multiple' flag is set.
+
+        :param pika.frame.Method method_frame: Basic.Ack or Basic.Nack frame
+
+        """
+        method = method_frame.method
+        acked = isinstance(method, pika.spec.Basic.Ack)
+        if method.multiple:
+            tags = [tag for tag in self._unconfirmed
+                    if tag <= method.delivery_tag]
+        else:
+            tags = [method.delivery_tag]
+        for tag in tags:
+            item = self._unconfirmed.pop(tag, None)
+            if item:
+                if not acked:
+                    self.log.warning("Message with delivery tag %s was "
+                                     "rejected by broker", tag)
+                item[3].resolve(acked)
+
+    def _requeue_unflushed(self):
+        if self._confirms:
+            lost = self._unconfirmed.values()
+            self._unconfirmed.clear()
+            self._unflushed = []
+            if lost:
+                self.log.warning("Connection was lost before confirmation "
+                                 "of %s messages", len(lost))
+            for item in lost:
+                item[3].resolve(False, lost=True)
+            return
+        self._pending.extendleft(reversed(self._unflushed))
+        self._unflushed = []
+
+    def _run_ioloop_once(self):
+        ioloop = self._connection.ioloop
+        ioloop.poll()
+        ioloop.process_timeouts()
+
+    def _process_data_events(self):
+        """Processes socket events that are already available without
+        blocking: broker close frames, heartbeats, etc.
+
+        """
+        self._connection.ioloop.add_timeout(0, lambda: None)
+        self._run_ioloop_once()
 
-    def publish_message(self):
+    def _open(self):
+        self._open_error = None
         self._connection = self.connect()
+        while not (self.is_open or self._open_error or
+                   self._connection.is_closed):
+            self._run_ioloop_once()
+        if not self.is_open:
+            raise pika.exceptions.AMQPConnectionError(
+                self._open_error or "Connection closed while opening")
+
+    def _close_quietly(self, connection):
+        """Closes connection that is dropped by publisher. The ioloop is
+        driven until broker confirms close or socket timeout expires, errors
+        are only logged: the connection is already considered broken.
+
+        :param connection: connection to close
+        :type connection: pika.SelectConnection
+        """
+        if connection.is_closed or connection.is_closing:
+            return
+        closing, self._closing = self._closing, True
+        try:
+            connection.close()
+            deadline = time.time() + (self._config.socket_timeout or 0)
+            while not connection.is_closed and time.time() < deadline:
+                connection.ioloop.add_timeout(deadline - time.time(),
+                                              lambda: None)
+                connection.ioloop.poll()
+                connection.ioloop.process_timeouts()
+        except Exception as e:
+            self.log.debug("Error while closing broken publisher "
+                           "connection: %s", e)
+        finally:
+            self._closing = closing
+
+    def reset_connection(self):
+        """
+        Closes and forgets connection. Is used to drop connections that were
+        broken by broker
+        """
+        connection, self._connection = self._connection, None
+        self._channel = None
+        self._requeue_unflushed()
+        if connection:
+            self._close_quietly(connection)
+
+    def ensure_connection(self):
+        """
+        Opens new connection if there is no live one
+        """
+        if self.is_open:
+            self._process_data_events()
+        while not self.is_open:
+            self.reset_connection()
+            try:
+                self._open()
+                self._current_reconnect_attempt = 0
+            except pika.exceptions.AMQPConnectionError as e:
+                if not self._if_do_retry():
+                    raise
+                self._current_reconnect_attempt += 1
+                self.log.error(e)
+                time.sleep(self._config.retry_delay)
+
+    def _basic_publish(self, exchange, routing_key, message):
+        props = pika.BasicProperties(
+            headers=message.headers,
+            content_type=message.content_type,
+            content_encoding=message.content_encoding)
+        self._channel.basic_publish(exchange=exchange,
+                                    routing_key=routing_key,
+                                    body=message.body,
+                                    properties=props)
+
+    def _wait_for_window(self):
+        while (self._confirms and self.is_open and
+               len(self._unconfirmed) >= self._window):
+            self._run_ioloop_once()
+
+    def _write_pending(self):
+        while self._pending and self.is_open:
+            self._wait_for_window()
+            if not self.is_open:
+                break
+            item = self._pending.popleft()
+            self._unflushed.append(item)
+            if self._confirms:
+                self._delivery_tag += 1
+                self._unconfirmed[self._delivery_tag] = item
+            try:
+                self._basic_publish(*item[:3])
+            except (pika.exceptions.ConnectionClosed,
+                    pika.exceptions.ChannelClosed) as e:
+                self.log.warning("Publisher connection is broken (%s), "
+                                 "reconnecting", e)
+                self.reset_connection()
+
+    def _wait_for_flush(self):
+        while self.is_open and self._connection.outbound_buffer:
+            self._connection.ioloop.poll(write_only=True)
+            self._connection.ioloop.process_timeouts()
+        if self.is_open:
+            self._unflushed = []
+
+    def flush(self):
+        """
+        Writes all buffered messages to socket, reconnects if needed
+        """
+        with self._lock:
+            while self._pending:
+                self.ensure_connection()
+                self._write_pending()
+                self._wait_for_flush()
+
+    def _is_waiting(self, confirmations):
+        if confirmations is None:
+            return bool(self._unconfirmed or self._pending)
+        return not all(c.done() for c in confirmations)
+
+    def wait_for_confirms(self, timeout=None, confirmations=None):
+        """
+        Flushes buffered messages and waits until all of them (or given
+        confirmations) are resolved. Check Confirmation.acked to find
+        messages rejected by broker or lost with connection
+
+        :param timeout: time to wait in seconds, None means infinite
+        :type timeout: float
+        :param confirmations: confirmations to wait for, all messages by
+            default
+        :type confirmations: list of Confirmation
+        :return: True if all messages are resolved
+        :rtype: bool
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._lock:
+            self.flush()
+            while self._is_waiting(confirmations):
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                if not self.is_open:
+                    # resolves confirmations of messages lost with
+                    # connection
+                    self.reset_connection()
+                    self.flush()
+                    continue
+                if remaining is not None:
+                    self._connection.ioloop.add_timeout(remaining,
+                                                        lambda: None)
+                self._run_ioloop_once()
+            return True
+
+    def publish_message(self, exchange, routing_key, message, callback=None):
+        """
+        Publishes message
+
+        :param exchange: exchange name
+        :type exchange: string
+        :param routing_key: routing key
+        :type routing_key: string
+        :param message: AMQP message to send
+        :type message: messages.AMQPMessage
+        :param callback: callable that gets Confirmation when broker confirms
+            the message (confirm mode only)
+        :type callback: callable
+        :return: confirmation in confirm mode, None otherwise
+        :rtype: Confirmation
+        """
+        confirmation = Confirmation(callback) if self._confirms else None
+        with self._lock:
+            self._pending.append((exchange, routing_key, message,
+                                  confirmation))
+            self.flush()
+        return confirmation
+
+    def publish_messages(self, messages, callback=None):
+        """
+        Publishes several messages and flushes them to socket at once
+
+        :param messages: list of (exchange, routing_key, message) tuples
+        :type messages: list
+        :param callback: callable that gets Confirmation of every message
+            (confirm mode only)
+        :type callback: callable
+        :return: list of confirmations in confirm mode, None otherwise
+        :rtype: list
+        """
+        confirmations = []
+        with self._lock:
+            for exchange, routing_key, message in messages:
+                confirmation = (Confirmation(callback) if self._confirms
+                                else None)
+                confirmations.append(confirmation)
+                self._pending.append((exchange, routing_key, message,
+                                      confirmation))
+            self.flush()
+        return confirmations if self._confirms else None
 
     def close_connection(self):
         """This method closes the connection to RabbitMQ."""
-        if self._connection:
-            self._connection.close()
-            self._connection.ioloop.stop()
+        with self._lock:
+            self._closing = True
+            try:
+                if self._connection and not self._connection.is_closed:
+                    self._connection.close()
+                    while not self._connection.is_closed:
+                        self._run_ioloop_once()
+            finally:
+                self._closing = False
+                self._connection = None
+                self._channel = None
+                self._requeue_unflushed()
 
 
 class ExchangeCreator(object):
@@ -625,10 +1067,165 @@ class BindingCreator(object):
             self._connection.close()
 
 
+class TopologyDeclarer(base.AbstractClient):
+
+    """
+    Declares all exchanges, queues and bindings of topology over one
+    connection. Declarations are pipelined (sent without waiting for
+    responses), only the last one waits: RabbitMQ handles methods of a
+    channel in order, so its response means that all previous declarations
+    succeeded. Any failed declaration closes the channel.
+    If connection can't be opened or is lost before declarations are
+    confirmed, declaration is repeated over new connection
+    (config.reconnect_attempts).
+    """
+
+    def __init__(self, config, topology):
+        super(TopologyDeclarer, self).__init__(config)
+        self._config = config.to_pika_params()
+        self._retry_delay = config.retry_delay
+        self._topology = topology
+        self._connection = None
+        self._channel = None
+        self._done = False
+        self._error = None
+        self.log = logging.getLogger(__name__)
+
+    def connect(self):
+        """This method connects to RabbitMQ, returning the connection handle.
+
+        :rtype: pika.SelectConnection
+
+        """
+        return pika.SelectConnection(self._config,
+                                     self._open_channel,
+                                     self._on_connection_open_error,
+                                     stop_ioloop_on_close=False)
+
+    def _on_connection_open_error(self, connection, error=None):
+        """Invoked by pika if connection can't be established. Could be
+        called before ioloop is started.
+
+        """
+        self._error = pika.exceptions.AMQPConnectionError(
+            error or "Connection can't be opened")
+        connection.ioloop.stop()
+
+    def _open_channel(self, unused_connection):
+        self._connection.add_on_close_callback(self._on_connection_closed)
+        self._connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_closed(self, connection, reply_code, reply_text):
+        """Invoked by pika when the connection is closed. If it happens
+        before the last declaration is confirmed, declaration is repeated.
+
+        """
+        if not self._done and not self._error:
+            self._error = pika.exceptions.ConnectionClosed(reply_code,
+                                                           reply_text)
+        connection.ioloop.stop()
+
+    def _on_channel_open(self, channel):
+        self._channel = channel
+        self._channel.add_on_close_callback(self._on_channel_closed)
+        self._declare()
+
+    def _on_channel_closed(self, channel, reply_code, reply_text):
+        """Invoked by pika when RabbitMQ closes the channel. If it happens
+        before the last declaration is confirmed, one of declarations failed.
+
+        """
+        if not self._done:
+            self._error = pika.exceptions.ChannelClosed(reply_code,
+                                                        reply_text)
+            self._stop()
+
+    def _get_declarations(self):
+        channel = self._channel
+        declarations = []
+        for exchange_name, ex_type in self._topology.exchanges:
+            declarations.append(functools.partial(
+                channel.exchange_declare, exchange=exchange_name,
+                exchange_type=ex_type, durable=True))
+        for queue_name in self._topology.queues:
+            declarations.append(functools.partial(
+                channel.queue_declare, queue=queue_name, durable=True))
+        for queue_name, exchange_name, routing_key in self._topology.bindings:
+            declarations.append(functools.partial(
+                channel.queue_bind, queue=queue_name, exchange=exchange_name,
+                routing_key=routing_key))
+        return declarations
+
+    def _declare(self):
+        declarations = self._get_declarations()
+        if not declarations:
+            self._on_declareok(None)
+            return
+        for declare in declarations[:-1]:
+            declare(callback=None, nowait=True)
+        declarations[-1](callback=self._on_declareok)
+
+    def _on_declareok(self, unused_frame):
+        self._done = True
+        self._stop()
+
+    def _stop(self):
+        self.close_connection()
+        self._connection.ioloop.stop()
+
+    def _declare_once(self):
+        self._done = False
+        self._error = None
+        self._channel = None
+        self._connection = self.connect()
+        if not self._error:
+            self._connection.ioloop.start()
+        if self._error:
+            raise self._error
+
+    def declare(self):
+        """
+        Declares topology, reconnects if broker is not available
+
+        :raises: pika.exceptions.AMQPConnectionError if reconnect attempts
+            are exhausted, pika.exceptions.ChannelClosed if declaration
+            failed
+        """
+        while True:
+            try:
+                self._declare_once()
+                self._current_reconnect_attempt = 0
+                return
+            except pika.exceptions.AMQPConnectionError as e:
+                if not self._if_do_retry():
+                    raise
+                self._current_reconnect_attempt += 1
+                self.log.error(e)
+                time.sleep(self._retry_delay)
+
+    def close_connection(self):
+        """This method closes the connection to RabbitMQ."""
+        if self._connection:
+            self._connection.close()
+
+
 class WriterFactory(base.AbstractWriterFactory):
 
+    def __init__(self):
+        super(WriterFactory, self).__init__()
+        self._writer = None
+
     def get_writer(self, config):
         return Writer(config)
 
+    def get_shared_writer(self, config):
+        if not self._writer:
+            self._writer = Writer(config)
+        return self._writer
+
     def get_writer_by_reader(self, reader):
+        # handlers that run in worker threads can't publish via ioloop
+        # channel of reader
+        if reader.concurrent:
+            return self.get_shared_writer(reader.config)
         return reader
@@ -0,0 +1,149 @@
+import functools
+
+import pika
+from pika.adapters import base_connection
+
+import pika_async
+from tavrida import exceptions
+from tavrida import timings
+from tavrida import utils
+
+
+class IOLoopAdapter(object):
+
+    """
+    Adapter that lets pika SelectConnection run on asyncio event loop
+    (asyncio on Python 3, trollius on Python 2).
+    Implements the subset of pika IOLoop interface used by connection.
+    """
+
+    READ = base_connection.BaseConnection.READ
+    WRITE = base_connection.BaseConnection.WRITE
+
+    def __init__(self, loop):
+        super(IOLoopAdapter, self).__init__()
+        self._loop = loop
+        self._handlers = {}
+
+    @property
+    def loop(self):
+        return self._loop
+
+    def add_timeout(self, deadline, callback_method):
+        return self._loop.call_later(deadline, callback_method)
+
+    def remove_timeout(self, timeout_id):
+        timeout_id.cancel()
+
+    def add_handler(self, fileno, handler, events):
+        self._handlers[fileno] = handler
+        self.update_handler(fileno, events)
+
+    def update_handler(self, fileno, events):
+        handler = self._handlers[fileno]
+        self._loop.remove_reader(fileno)
+        self._loop.remove_writer(fileno)
+        if events & self.READ:
+            self._loop.add_reader(fileno, handler, fileno, self.READ)
+        if events & self.WRITE:
+            self._loop.add_writer(fileno, handler, fileno, self.WRITE)
+
+    def remove_handler(self, fileno):
+        self._loop.remove_reader(fileno)
+        self._loop.remove_writer(fileno)
+        self._handlers.pop(fileno, None)
+
+    def start(self):
+        self._loop.run_forever()
+
+    def stop(self):
+        self._loop.stop()
+
+
+class Reader(pika_async.Reader):
+
+    """
+    Reader that runs on asyncio event loop.
+
+    Service handlers could be coroutines: if preprocessor returns future,
+    message is acked (or rejected) when the future is done, so a lot of
+    requests could be handled concurrently in one thread. Handlers publish
+    messages via reader channel in the loop thread.
+    Handlers always run in the loop thread (coroutines can't be scheduled
+    from worker threads), so handler_workers and background_heartbeats are
+    ignored: the loop answers heartbeats while coroutines wait.
+    """
+
+    def __init__(self, config, queue, preprocessor, loop=None):
+        if utils.asyncio is None:
+            raise exceptions.AsyncioIsNotAvailable()
+        super(Reader, self).__init__(config, queue, preprocessor)
+        self._loop = loop or utils.asyncio.get_event_loop()
+        if self._executor:
+            self.log.warning("Handlers of asyncio engine run in event loop, "
+                             "handler_workers and background_heartbeats "
+                             "are ignored")
+            self._executor = None
+            self._prefetch_count = config.prefetch_count
+
+    @property
+    def loop(self):
+        return self._loop
+
+    def connect(self):
+        """Creates SelectConnection that runs on asyncio event loop
+
+        :rtype: pika.SelectConnection
+
+        """
+        return pika.SelectConnection(self._config,
+                                     self.on_connection_open,
+                                     stop_ioloop_on_close=False,
+                                     custom_ioloop=IOLoopAdapter(self._loop))
+
+    def reconnect(self):
+        """Will be invoked by the loop timer if the connection is closed.
+        New connection runs on the same event loop, so the loop is not
+        restarted.
+
+        """
+        if not self._closing:
+            if self._if_do_retry():
+                self._current_reconnect_attempt += 1
+                self._connection = self.connect()
+            else:
+                self.log.error("Connection closed unexpectedly")
+                self._loop.stop()
+
+    def _on_handled(self, frame, future):
+        error = future.exception()
+        if error:
+            self.log.error(error)
+        self._finish(frame, error)
+
+    def _on_message(self, msg, frame):
+        timings.stamp(msg.headers, timings.RECEIVED_AT)
+        try:
+            result = self._process(msg)
+        except Exception as e:
+            self.log.exception(e)
+            self._finish(frame, e)
+            return
+        if utils.is_awaitable(result):
+            future = utils.asyncio.ensure_future(result, loop=self._loop)
+            future.add_done_callback(functools.partial(self._on_handled,
+                                                       frame))
+        else:
+            self._finish(frame, None)
+
+
+class WriterFactory(pika_async.WriterFactory):
+
+    """
+    Writers of asyncio engine. Messages are published via reader channel in
+    the loop thread, outside of server they are published via long-lived
+    async publisher.
+    """
+
+
+Writer = pika_async.Writer
@@ -1,12 +1,16 @@
 import abc
 import logging
+import Queue
+import threading
 import time
 
 import pika
 
 import base
+import executor
 from tavrida import exceptions
 from tavrida import messages
+from tavrida import timings
 
 
 class PikaClient(base.AbstractClient):
@@ -32,33 +36,90 @@ class PikaClient(base.AbstractClient):
 
 class Reader(PikaClient, base.AbstractReader):
 
+    # How often (secs) consumer loop wakes up to ack handled messages
+    # and to check stop requests if there are no deliveries
+    ACK_INTERVAL = 0.05
+
     def __init__(self, config, queue, preprocessor):
         super(Reader, self).__init__(config)
         self.log = logging.getLogger(__name__)
         self._queue = queue
         self.preprocessor = preprocessor
+        self._prefetch_count = config.get_prefetch_count()
+        self._executor = None
+        self._stopping = False
+        if config.get_handler_workers():
+            self._executor = executor.HandlerExecutor(
+                config.get_handler_workers(), self._process)
+
+    @property
+    def concurrent(self):
+        return self._executor is not None
 
     def connect(self):
         if not self._connection:
             self._connection = pika.BlockingConnection(self._config)
         if not self._channel:
             self._channel = self._connection.channel()
+            if self._prefetch_count:
+                self._channel.basic_qos(prefetch_count=self._prefetch_count)
+
+    def _consume(self):
+        if self._executor:
+            self._executor.start()
+        consumer = self._channel.consume(
+            self._queue, inactivity_timeout=self.ACK_INTERVAL)
+        for event in consumer:
+            if event:
+                frame, properties, body = event
+                msg = messages.AMQPMessage(body, properties.headers,
+                                           properties.content_type,
+                                           properties.content_encoding)
+                self._on_message(msg, frame)
+            if self._executor:
+                self._finish_completed()
+            if self._stopping:
+                self._drain()
+                break
+
+    def _drain(self):
+        """
+        Cancels consumer (prefetched messages are returned to broker) and
+        acks messages that are already being handled
+        """
+        self._channel.cancel()
+        if self._executor:
+            self._executor.stop()
+            self._finish_completed()
 
     def run(self):
         try:
             self.connect()
-            for frame, properties, body in self._channel.consume(self._queue):
-                msg = messages.AMQPMessage(body, properties.headers)
-                self._on_message(msg, frame)
+            self._consume()
         except (pika.exceptions.ConnectionClosed,
                 pika.exceptions.AMQPConnectionError) as e:
             self._connection = None
             self._channel = None
+            if self._executor:
+                # unacked messages will be redelivered by broker
+                self._executor.reset()
             self.log.error(e)
+            if self._stopping:
+                return
             time.sleep(self._config.retry_delay)
             if self._if_do_retry():
                 self._current_reconnect_attempt += 1
                 self.run()
+        else:
+            if self._stopping:
+                self.close_connection()
+
+    def request_stop(self):
+        """
+        Asks consumer loop to stop after current message. Is safe to call
+        from signal handler
+        """
+        self._stopping = True
 
     def _ack(self, frame):
         self.log.debug("Starting ack frame with delivery tag %s",
@@ -74,19 +135,39 @@ class Reader(PikaClient, base.AbstractReader):
         self.log.debug("Rejected frame with delivery tag %s",
                        frame.delivery_tag)
 
+    def _finish(self, frame, error):
+        if isinstance(error, exceptions.NackableException):
+            self._reject(frame)
+        else:
+            self._ack(frame)
+
+    def _finish_completed(self):
+        """
+        Acks or rejects messages handled by workers. Is called in connection
+        thread
+        """
+        for frame, error in self._executor.completed():
+            self._finish(frame, error)
+
+    def _process(self, msg):
+        return self.preprocessor.process(msg)
+
     def _on_message(self, msg, frame):
+        timings.stamp(msg.headers, timings.RECEIVED_AT)
+        if self._executor:
+            self._executor.submit(msg, frame)
+            return
         try:
-            self.preprocessor.process(msg)
+            self._process(msg)
         except Exception as e:
             self.log.exception(e)
-            if isinstance(e, exceptions.NackableException):
-                self._reject(frame)
-            else:
-                self._ack(frame)
+            self._finish(frame, e)
         else:
-            self._ack(frame)
+            self._finish(frame, None)
 
     def stop(self):
+        if self._executor:
+            self._executor.stop()
         self.close_connection()
 
     def create_queue(self):
@@ -106,6 +187,26 @@ class Reader(PikaClient, base.AbstractReader):
             self.close_connection()
 
 
+class ReplyReader(Reader):
+
+    """
+    Consumes replies from exclusive auto-delete queue of client. The queue
+    is declared on connection of reader, so broker deletes it when client
+    disconnects. Replies are handled in consumer thread.
+    """
+
+    def __init__(self, config, queue, preprocessor):
+        super(ReplyReader, self).__init__(config, queue, preprocessor)
+        self._executor = None
+
+    def connect(self):
+        declare = not self._channel
+        super(ReplyReader, self).connect()
+        if declare:
+            self._channel.queue_declare(queue=self._queue, exclusive=True,
+                                        auto_delete=True, durable=False)
+
+
 class Writer(PikaClient, base.AbstractWriter):
 
     def __init__(self, config):
@@ -119,10 +220,16 @@ class Writer(PikaClient, base.AbstractWriter):
         writer._channel = reader.channel
         return writer
 
+    @property
+    def is_open(self):
+        return bool(self._connection and self._connection.is_open and
+                    self._channel and self._channel.is_open)
+
     def connect(self):
         try:
             self._connection = pika.BlockingConnection(self._config)
             self._channel = self._connection.channel()
+            self._current_reconnect_attempt = 0
         except (pika.exceptions.ConnectionClosed,
                 pika.exceptions.AMQPConnectionError) as e:
             if self._if_do_retry():
@@ -133,14 +240,58 @@ class Writer(PikaClient, base.AbstractWriter):
             else:
                 raise
 
+    def reset_connection(self):
+        """
+        Closes connection quietly and forgets it. Is used to drop connections
+        that were broken by broker
+        """
+        try:
+            self.close_connection()
+        except Exception as e:
+            self.log.debug("Error while closing broken connection: %s", e)
+        self._connection = None
+        self._channel = None
+
+    def ensure_connection(self):
+        """
+        Opens new connection if there is no live one
+        """
+        if not self.is_open:
+            self.reset_connection()
+            self.connect()
+
+    def basic_publish(self, exchange, routing_key, message):
+        """
+        Publishes message via current channel. Connection should be opened
+
+        :param exchange: exchange name
+        :type exchange: string
+        :param routing_key: routing key
+        :type routing_key: string
+        :param message: AMQP message to send
+        :type message: messages.AMQPMessage
+        """
+        props = pika.BasicProperties(
+            headers=message.headers,
+            content_type=message.content_type,
+            content_encoding=message.content_encoding)
+        self._channel.basic_publish(exchange=exchange,
+                                    routing_key=routing_key,
+                                    body=message.body,
+                                    properties=props)
+
     def publish_message(self, exchange, routing_key, message):
         self.connect()
         try:
-            props = pika.BasicProperties(headers=message.headers)
-            self._channel.basic_publish(exchange=exchange,
-                                        routing_key=routing_key,
-                                        body=message.body,
-                                        properties=props)
+            self.basic_publish(exchange, routing_key, message)
+        finally:
+            self.close_connection()
+
+    def publish_messages(self, messages):
+        self.connect()
+        try:
+            for exchange, routing_key, message in messages:
+                self.basic_publish(exchange, routing_key, message)
         finally:
             self.close_connection()
 
@@ -154,10 +305,140 @@ class Writer(PikaClient, base.AbstractWriter):
             self.close_connection()
 
 
+class WriterPool(base.AbstractWriter):
+
+    """
+    Bounded pool of long-lived writers.
+    Writers are created on demand up to config.writer_pool_size, stay
+    connected between publishes and are revalidated before each publish, so
+    connections dropped by broker are reopened lazily.
+    The pool is thread safe: if all writers are busy, publishing thread waits
+    for the first released one.
+    close_connection() closes idle writers at once and writers that are busy
+    in other threads when they are released.
+    """
+
+    def __init__(self, config):
+        super(WriterPool, self).__init__(config)
+        self.log = logging.getLogger(__name__)
+        self._size = max(config.writer_pool_size or 1, 1)
+        # LIFO keeps the most recently used (surely alive) writer on top
+        self._idle = Queue.LifoQueue()
+        self._created = 0
+        # all created writers with generation of pool they belong to,
+        # generation is changed by close_connection()
+        self._writers = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        return self._size
+
+    def _create_writer(self):
+        return Writer(self.config)
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except Queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self._size:
+                self._created += 1
+                writer = self._create_writer()
+                self._writers[writer] = self._generation
+                return writer
+        return self._idle.get()
+
+    def _discard(self, writer):
+        with self._lock:
+            self._writers.pop(writer, None)
+            self._created -= 1
+        writer.reset_connection()
+
+    def _release(self, writer):
+        with self._lock:
+            if self._writers.get(writer) == self._generation:
+                self._idle.put(writer)
+                return
+        # pool was closed while writer was busy
+        self._discard(writer)
+
+    def _publish(self, writer, exchange, routing_key, message):
+        writer.ensure_connection()
+        try:
+            writer.basic_publish(exchange, routing_key, message)
+        except (pika.exceptions.ConnectionClosed,
+                pika.exceptions.ChannelClosed) as e:
+            self.log.warning("Writer connection is broken (%s), "
+                             "reconnecting", e)
+            writer.reset_connection()
+            writer.connect()
+            writer.basic_publish(exchange, routing_key, message)
+
+    def connect(self):
+        writer = self._acquire()
+        try:
+            writer.ensure_connection()
+        finally:
+            self._release(writer)
+
+    def close_connection(self):
+        """
+        Closes connections of idle writers, busy writers are closed when
+        they are released. Pool opens new connections if it is used again
+        """
+        with self._lock:
+            self._generation += 1
+        while True:
+            try:
+                writer = self._idle.get_nowait()
+            except Queue.Empty:
+                break
+            self._discard(writer)
+
+    def publish_message(self, exchange, routing_key, message):
+        writer = self._acquire()
+        try:
+            self._publish(writer, exchange, routing_key, message)
+        finally:
+            self._release(writer)
+
+    def publish_messages(self, messages):
+        writer = self._acquire()
+        try:
+            for exchange, routing_key, message in messages:
+                self._publish(writer, exchange, routing_key, message)
+        finally:
+            self._release(writer)
+
+    def create_exchange(self, exchange_name, ex_type):
+        writer = self._acquire()
+        try:
+            writer.ensure_connection()
+            writer.channel.exchange_declare(exchange=exchange_name,
+                                            type=ex_type,
+                                            durable=True)
+        finally:
+            self._release(writer)
+
+
 class WriterFactory(base.AbstractWriterFactory):
 
+    def __init__(self):
+        super(WriterFactory, self).__init__()
+        self._pool = None
+        self._lock = threading.Lock()
+
     def get_writer(self, config):
         return Writer(config)
 
+    def get_shared_writer(self, config):
+        with self._lock:
+            if not self._pool:
+                self._pool = WriterPool(config)
+        return self._pool
+
     def get_writer_by_reader(self, reader):
-        return Writer.create_from_reader(reader)
+        return self.get_shared_writer(reader.config)
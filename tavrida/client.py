@@ -15,12 +15,16 @@
 # limitations under the License.
 
 import copy
+import threading
+import uuid
 
 from tavrida.amqp_driver import driver
 from tavrida import discovery
 from tavrida import entry_point
 from tavrida import postprocessor
 from tavrida import proxies
+from tavrida import replies
+from tavrida import serialization
 
 
 class RPCClient(object):
@@ -37,6 +41,17 @@ class RPCClient(object):
     >>> headers = {"header": "value"}
     >>> cli = RPCClient(config, disc, source="some_client", headers=headers)
     >>> cli.some_method(some_parameter="1234").cast()
+
+    Calls could be published in batches:
+
+    >>> with cli.batch(max_size=500) as batch:
+    ...     for i in range(10000):
+    ...         batch.some_method(some_parameter=i).cast()
+
+    Client creates driver (AMQP connection) and service proxies once and
+    reuses them for all calls. Connection of sync engine is safe to use from
+    several threads, use ThreadSafeRPCClient with other engines or with
+    publisher confirms.
     """
 
     def __init__(self, config, discovery, source="", context=None,
@@ -47,6 +62,8 @@ class RPCClient(object):
         self._source = source
         self._headers = copy.copy(headers) or {}
         self._context = copy.copy(context) if context else None
+        self._cache = None
+        self._cache_lock = threading.Lock()
 
     def _get_discovery(self):
         return discovery.LocalDiscovery()
@@ -55,16 +72,203 @@ class RPCClient(object):
         return driver.AMQPDriver(self._config)
 
     def _get_postprocessor(self):
-        return postprocessor.PostProcessor(self._get_driver(),
-                                           self._discovery)
+        return postprocessor.PostProcessor(
+            self._get_driver(), self._discovery,
+            serialization.get_codec(self._config.serializer),
+            self._config.get_compressor(),
+            self._config.compression_threshold)
+
+    def _get_proxy(self, postproc):
+        if isinstance(self._source, entry_point.EntryPoint):
+            source = self._source
+        else:
+            source = entry_point.EntryPointFactory().create(self._source)
+
+        return proxies.RPCProxy(postproc, source,
+                                context=self._context, headers=self._headers)
+
+    def _create_cache(self):
+        return ProxyCache(self._get_postprocessor(), self._get_proxy)
+
+    def _get_cache(self):
+        if self._cache is None:
+            with self._cache_lock:
+                if self._cache is None:
+                    self._cache = self._create_cache()
+        return self._cache
+
+    def batch(self, max_size=100, max_delay=1.0):
+        """
+        Returns context manager that collects calls and publishes them in
+        batches
+
+        :param max_size: number of messages that triggers batch flush
+        :type max_size: int
+        :param max_delay: age of the oldest message (secs) that triggers
+            batch flush
+        :type max_delay: float
+        :return: batch context manager
+        :rtype: RPCBatch
+        """
+        return RPCBatch(self, max_size=max_size, max_delay=max_delay)
 
     def __getattr__(self, item):
+        if item.startswith("_"):
+            raise AttributeError(item)
+        return self._get_cache().get(item)
+
+
+class ProxyCache(object):
+
+    """
+    Postprocessor of client with its proxy and service proxies created
+    by attribute lookups
+    """
+
+    __slots__ = ("postprocessor", "proxy", "_services")
+
+    def __init__(self, postproc, proxy_factory):
+        super(ProxyCache, self).__init__()
+        self.postprocessor = postproc
+        self.proxy = proxy_factory(postproc)
+        self._services = {}
+
+    def get(self, item):
+        try:
+            return self._services[item]
+        except KeyError:
+            service_proxy = getattr(self.proxy, item)
+            self._services[item] = service_proxy
+            return service_proxy
+
+
+class ThreadSafeRPCClient(RPCClient):
+
+    """
+    Client that could be shared by threads (e.g. request threads of web
+    application). Every thread gets its own driver (AMQP connection) and
+    service proxies on first call, they are reused by subsequent calls of
+    the thread.
+
+    >>> cli = ThreadSafeRPCClient(config, disc, source="some_client")
+    >>> cli.service_name.some_method(some_parameter="1234").cast()
+    """
+
+    def __init__(self, config, discovery, source="", context=None,
+                 headers=None):
+        super(ThreadSafeRPCClient, self).__init__(config, discovery, source,
+                                                  context, headers)
+        self._local = threading.local()
+
+    def _get_cache(self):
+        try:
+            return self._local.cache
+        except AttributeError:
+            self._local.cache = self._create_cache()
+            return self._local.cache
+
+
+class BlockingRPCClient(RPCClient):
+
+    """
+    Client that waits for responses of remote services.
+    Client owns exclusive auto-delete reply queue and consumes it in
+    background thread, servers send responses and errors of its requests
+    directly to this queue. Any number of threads could make calls via one
+    client concurrently.
+
+    >>> cli = BlockingRPCClient(config, disc, source="some_client",
+    ...                         timeout=10)
+    >>> result = cli.service_name.some_method(some_parameter="1234").call()
+
+    Remote error is raised as exceptions.RemoteError, exceptions.ReplyTimeout
+    is raised if there is no response in timeout. Call could be made
+    without waiting:
+
+    >>> future = cli.service_name.some_method(some_parameter="1").call_async()
+    >>> result = future.result(timeout=5)
+
+    In asyncio code use future.as_asyncio() to get awaitable future.
+    Client should be closed to delete its reply queue:
+
+    >>> cli.close()
+    """
+
+    REPLY_QUEUE_PREFIX = "tavrida_reply_"
+
+    def __init__(self, config, discovery, source="", context=None,
+                 headers=None, timeout=30):
+        super(BlockingRPCClient, self).__init__(config, discovery, source,
+                                                context, headers)
+        self._timeout = timeout
+        self._driver = driver.AMQPDriver(self._config)
+        self._consumer = replies.ReplyConsumer(
+            self._driver, self.REPLY_QUEUE_PREFIX + uuid.uuid4().hex)
+        self._consumer.start()
+
+    @property
+    def reply_queue(self):
+        return self._consumer.queue_name
+
+    def _get_driver(self):
+        return self._driver
+
+    def _get_proxy(self, postproc):
         if isinstance(self._source, entry_point.EntryPoint):
             source = self._source
         else:
             source = entry_point.EntryPointFactory().create(self._source)
 
-        postproc = self._get_postprocessor()
-        proxy = proxies.RPCProxy(postproc, source,
-                                 context=self._context, headers=self._headers)
-        return getattr(proxy, item)
+        return proxies.BlockingRPCProxy(postproc, source, self._consumer,
+                                        timeout=self._timeout,
+                                        context=self._context,
+                                        headers=self._headers)
+
+    def close(self):
+        """
+        Stops reply consumer and deletes reply queue. Calls that wait for
+        responses fail with ReplyConsumerIsStopped
+        """
+        self._consumer.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+
+class RPCBatch(object):
+
+    """
+    Collects RPC calls made via client and publishes them in batches.
+    Remaining messages are published on exit from context, if the context
+    is exited by exception they are discarded.
+    """
+
+    def __init__(self, client, max_size=100, max_delay=1.0):
+        super(RPCBatch, self).__init__()
+        self._client = client
+        self._postprocessor = postprocessor.BatchPostProcessor(
+            client._get_cache().postprocessor, max_size=max_size,
+            max_delay=max_delay)
+        self._proxies = ProxyCache(self._postprocessor, client._get_proxy)
+
+    def flush(self):
+        self._postprocessor.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.flush()
+        else:
+            self._postprocessor.discard()
+        return False
+
+    def __getattr__(self, item):
+        if item.startswith("_"):
+            raise AttributeError(item)
+        return self._proxies.get(item)
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# Copyright (c) 2015 Sergey Bunatyan <sergey.bunatyan@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import abc
+import threading
+import zlib
+
+import exceptions
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class AbstractCompressor(object):
+
+    """
+    Compresses message body. Name of compressor is sent in AMQP
+    content_encoding property, so consumer picks the matching decompressor
+    """
+
+    __metaclass__ = abc.ABCMeta
+
+    name = None
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    @abc.abstractmethod
+    def compress(self, data):
+        pass
+
+    @abc.abstractmethod
+    def decompress(self, data):
+        pass
+
+
+class ZlibCompressor(AbstractCompressor):
+
+    name = "zlib"
+
+    def __init__(self, level=6):
+        super(ZlibCompressor, self).__init__()
+        self._level = level
+
+    def compress(self, data):
+        return zlib.compress(data, self._level)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+
+class LZ4Compressor(AbstractCompressor):
+
+    name = "lz4"
+
+    @classmethod
+    def is_available(cls):
+        return lz4_frame is not None
+
+    def compress(self, data):
+        return lz4_frame.compress(data)
+
+    def decompress(self, data):
+        return lz4_frame.decompress(data)
+
+
+class ZstdCompressor(AbstractCompressor):
+
+    """
+    Zstandard contexts are not thread-safe, so every thread (handler
+    workers, publishers, reply consumer) gets its own pair of them
+    """
+
+    name = "zstd"
+
+    def __init__(self, level=3):
+        super(ZstdCompressor, self).__init__()
+        self._level = level
+        self._local = threading.local()
+
+    @classmethod
+    def is_available(cls):
+        return zstandard is not None
+
+    def _get_compressor(self):
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            compressor = self._local.compressor = zstandard.ZstdCompressor(
+                level=self._level)
+        return compressor
+
+    def _get_decompressor(self):
+        decompressor = getattr(self._local, "decompressor", None)
+        if decompressor is None:
+            decompressor = self._local.decompressor = \
+                zstandard.ZstdDecompressor()
+        return decompressor
+
+    def compress(self, data):
+        return self._get_compressor().compress(data)
+
+    def decompress(self, data):
+        return self._get_decompressor().decompress(data)
+
+
+class CompressorRegistry(object):
+
+    """
+    Registry of available compressors by name
+    """
+
+    def __init__(self):
+        super(CompressorRegistry, self).__init__()
+        self._compressors = {}
+
+    def register(self, compressor_cls):
+        """
+        Registers compressor if its library is installed
+
+        :param compressor_cls: compressor class
+        :type compressor_cls: AbstractCompressor
+        :return: True if compressor is registered
+        :rtype: bool
+        """
+        if not compressor_cls.is_available():
+            return False
+        self._compressors[compressor_cls.name] = compressor_cls()
+        return True
+
+    def get_compressor(self, name):
+        """
+        Returns compressor by name (AMQP content_encoding)
+
+        :param name: compressor name ('zlib', 'lz4', 'zstd')
+        :type name: string
+        :rtype: AbstractCompressor
+        :raises: UnknownContentEncoding
+        """
+        try:
+            return self._compressors[name]
+        except KeyError:
+            raise exceptions.UnknownContentEncoding(content_encoding=name)
+
+
+registry = CompressorRegistry()
+for compressor_cls in (ZlibCompressor, LZ4Compressor, ZstdCompressor):
+    registry.register(compressor_cls)
+
+
+def get_compressor(name):
+    return registry.get_compressor(name)
@@ -18,6 +18,8 @@
 import copy
 import pika
 
+import compression
+
 
 class Credentials(object):
 
@@ -37,13 +39,29 @@ class ConnectionConfig(object):
     Most of the parameters are passed to pika client as is.
     """
 
+    # Tavrida specific parameters that are not passed to pika
+    TAVRIDA_PARAMS = ("reconnect_attempts", "async_engine", "asyncio_engine",
+                      "writer_pool_size", "publisher_confirms",
+                      "confirm_window", "handler_workers",
+                      "prefetch_count", "serializer", "compression",
+                      "compression_threshold", "memory_engine",
+                      "memory_queue_size", "local_dispatch",
+                      "background_heartbeats")
+
     def __init__(self, host, credentials, port=5672, virtual_host="/",
                  channel_max=None,
                  frame_max=None, heartbeat_interval=None, ssl=None,
                  ssl_options=None, connection_attempts=3,
                  retry_delay=1.0, socket_timeout=3.0,
                  locale=None, backpressure_detection=None,
-                 reconnect_attempts=-1, async_engine=False):
+                 reconnect_attempts=-1, async_engine=False,
+                 asyncio_engine=False,
+                 writer_pool_size=4, publisher_confirms=False,
+                 confirm_window=1000, handler_workers=0,
+                 prefetch_count=None, serializer="json",
+                 compression=None, compression_threshold=65536,
+                 memory_engine=False, memory_queue_size=10000,
+                 local_dispatch=False, background_heartbeats=False):
         super(ConnectionConfig, self).__init__()
         self.host = host
         self.port = port
@@ -61,6 +79,19 @@ class ConnectionConfig(object):
         self.backpressure_detection = backpressure_detection
         self.reconnect_attempts = reconnect_attempts  # value <0 means infinite
         self.async_engine = async_engine
+        self.asyncio_engine = asyncio_engine
+        self.writer_pool_size = writer_pool_size
+        self.publisher_confirms = publisher_confirms
+        self.confirm_window = confirm_window
+        self.handler_workers = handler_workers
+        self.prefetch_count = prefetch_count
+        self.serializer = serializer
+        self.compression = compression
+        self.compression_threshold = compression_threshold
+        self.memory_engine = memory_engine
+        self.memory_queue_size = memory_queue_size
+        self.local_dispatch = local_dispatch
+        self.background_heartbeats = background_heartbeats
 
     def to_dict(self):
         """
@@ -70,6 +101,49 @@ class ConnectionConfig(object):
         """
         return copy.copy(self.__dict__)
 
+    def get_handler_workers(self):
+        """
+        Returns number of threads that run message handlers.
+        With background heartbeats handlers never run in connection thread:
+        if workers are not set, one worker handles messages one by one
+        while connection thread answers broker heartbeats
+
+        :return: number of workers, 0 means handling in connection thread
+        :rtype: int
+        """
+        if self.handler_workers:
+            return self.handler_workers
+        if self.background_heartbeats:
+            return 1
+        return 0
+
+    def get_prefetch_count(self):
+        """
+        Returns number of unacked messages that broker delivers to reader.
+        If it is not set explicitly and handlers run in workers, returns
+        doubled number of workers to keep all of them busy
+
+        :return: prefetch count or None (unlimited)
+        :rtype: int
+        """
+        if self.prefetch_count:
+            return self.prefetch_count
+        workers = self.get_handler_workers()
+        if workers:
+            return workers * 2
+        return None
+
+    def get_compressor(self):
+        """
+        Returns compressor of outgoing messages
+
+        :return: compressor or None if compression is disabled
+        :rtype: compression.AbstractCompressor
+        """
+        if not self.compression:
+            return None
+        return compression.get_compressor(self.compression)
+
     def to_pika_params(self):
         """
         Returns pika connection parameters
@@ -79,6 +153,6 @@ class ConnectionConfig(object):
         params = self.to_dict()
         params["credentials"] = pika.PlainCredentials(
             self.credentials.username, self.credentials.password)
-        del params["reconnect_attempts"]
-        del params["async_engine"]
+        for param in self.TAVRIDA_PARAMS:
+            del params[param]
         return pika.ConnectionParameters(**params)
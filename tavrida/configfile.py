@@ -21,6 +21,36 @@ server_opts = [
                required=True),
     cfg.StrOpt('discovery', help='discovery file path or URL', required=True,
                default=None),
+    cfg.IntOpt('workers', help='Number of worker processes, 0 means '
+                               'listening in server process',
+               default=0),
+    cfg.StrOpt('topology_cache', help='File that stores fingerprint of '
+                                      'declared AMQP structures to skip '
+                                      'declaration on restart'),
+    cfg.BoolOpt('metrics', help='Collect metrics of processed messages',
+                default=False),
+    cfg.IntOpt('metrics_port', help='Port to serve metrics at /metrics in '
+                                    'Prometheus text format, worker N '
+                                    'uses metrics_port + N'),
+    cfg.StrOpt('metrics_host', help='Address to serve metrics on',
+               default='127.0.0.1'),
+    cfg.StrOpt('trace_file', help='File to append spans of traced messages '
+                                  'to as newline-delimited JSON'),
+    cfg.FloatOpt('trace_sample_rate', help='Share of traced call chains, '
+                                           'from 0 to 1',
+                 default=1.0),
+    cfg.BoolOpt('message_log', help='Log sampled messages as JSON records '
+                                    'in background thread',
+                default=False),
+    cfg.FloatOpt('message_log_sample_rate', help='Share of logged messages, '
+                                                 'from 0 to 1',
+                 default=1.0),
+    cfg.DictOpt('message_log_sample_rates', help='Shares of logged messages '
+                                                 'by entry point or service, '
+                                                 'e.g. hello.world:0.1'),
+    cfg.IntOpt('message_log_max_body_size', help='Maximal length of logged '
+                                                 'message body',
+               default=1024),
 ]
 
 connection_opts = [
@@ -50,6 +80,46 @@ connection_opts = [
     cfg.IntOpt('reconnect_attempts', help='Attempts to reconnect to RabbitMQ',
                required=True, default=-1),
     cfg.BoolOpt('async_engine', help='Use async server engine', required=True,
+                default=False),
+    cfg.BoolOpt('asyncio_engine', help='Use asyncio server engine that '
+                                       'allows coroutine handlers',
+                default=False),
+    cfg.IntOpt('writer_pool_size', help='Number of long-lived connections '
+                                        'used to publish messages',
+               default=4),
+    cfg.BoolOpt('publisher_confirms', help='Wait for broker confirmations '
+                                           'of published messages',
+                default=False),
+    cfg.IntOpt('confirm_window', help='Maximum number of published messages '
+                                      'waiting for broker confirmation',
+               default=1000),
+    cfg.IntOpt('handler_workers', help='Number of threads that run message '
+                                       'handlers, 0 means handling in '
+                                       'consumer thread',
+               default=0),
+    cfg.IntOpt('prefetch_count', help='Maximum number of unacked messages '
+                                      'delivered to server'),
+    cfg.StrOpt('serializer', help='Codec of outgoing messages: json, '
+                                  'fastjson or msgpack',
+               default='json'),
+    cfg.StrOpt('compression', help='Compression of large outgoing '
+                                   'messages: zlib, lz4 or zstd'),
+    cfg.IntOpt('compression_threshold', help='Minimal size (bytes) of '
+                                             'message body to compress',
+               default=65536),
+    cfg.BoolOpt('memory_engine', help='Use in-process broker instead of '
+                                      'RabbitMQ',
+                default=False),
+    cfg.IntOpt('memory_queue_size', help='Maximal number of ready messages '
+                                         'in queue of in-process broker',
+               default=10000),
+    cfg.BoolOpt('local_dispatch', help='Deliver messages between services '
+                                       'of one server without broker',
+                default=False),
+    cfg.BoolOpt('background_heartbeats', help='Run handlers out of '
+                                              'connection thread, so '
+                                              'heartbeats are answered '
+                                              'while handler runs',
                 default=False)
 ]
 
@@ -41,6 +41,8 @@ class Dispatcher(controller.AbstractController):
             "error": {},
             "notification": {}
         }
+        # (message_type, service, method) -> handler method name
+        self._handler_index = {}
 
     @property
     def handlers(self):
@@ -68,6 +70,8 @@ class Dispatcher(controller.AbstractController):
             raise exceptions.DuplicatedMethodRegistration(
                 method_name=handler_method_name)
         self._handlers[message_type][ep] = handler_method_name
+        key = (message_type, entry_point.service, entry_point.method)
+        self._handler_index[key] = handler_method_name
 
     def get_handler(self, entry_point, message_type):
         """
@@ -122,6 +126,28 @@ class Dispatcher(controller.AbstractController):
         else:
             return message.destination.copy()
 
+    def _resolve_handler(self, message):
+        """
+        Finds handler method name for message without building entry point
+        string
+
+        :param message: incoming message
+        :type message: Message
+        :return: name of handler method
+        :rtype: string
+        """
+        if isinstance(message, (messages.IncomingError,
+                                messages.IncomingResponse,
+                                messages.IncomingNotification)):
+            ep = message.source
+        else:
+            ep = message.destination
+        try:
+            return self._handler_index[(message.type, ep.service, ep.method)]
+        except KeyError:
+            raise exceptions.HandlerNotFound(entry_point=str(ep),
+                                             message_type=message.type)
+
     def _get_source_context(self, message, service_instance):
         """
         Prepares 'source' value for RPC proxy
@@ -171,8 +197,7 @@ class Dispatcher(controller.AbstractController):
         :return: service's response
         :rtype: messages.Message, dict, None
         """
-        ep = self._get_dispatching_entry_point(message)
-        method_name = self.get_handler(ep, message.type)
+        method_name = self._resolve_handler(message)
         proxy = self._create_rpc_proxy(service_instance, message)
         return service_instance.process(method_name, message, proxy)
 
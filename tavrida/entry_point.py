@@ -19,9 +19,13 @@ class EntryPoint(object):
 
     """
     Describes service entry point.
-    Stores service_name and method_name
+    Stores service_name and method_name.
+    Entry points are immutable, so instances are shared between messages
+    (see EntryPointFactory)
     """
 
+    __slots__ = ("_service_name", "_method_name")
+
     def __init__(self, service_name, method_name):
         super(EntryPoint, self).__init__()
         self._service_name = service_name
@@ -61,6 +65,8 @@ class EntryPoint(object):
 
 class ServiceEntryPoint(EntryPoint):
 
+    __slots__ = ()
+
     def __init__(self, service_name):
         super(ServiceEntryPoint, self).__init__(service_name, None)
 
@@ -73,6 +79,8 @@ class ServiceEntryPoint(EntryPoint):
 
 class NullEntryPoint(EntryPoint):
 
+    __slots__ = ()
+
     def __init__(self):
         super(NullEntryPoint, self).__init__(None, None)
 
@@ -90,15 +98,27 @@ class NullEntryPoint(EntryPoint):
 
 
 class Source(EntryPoint):
-    pass
+
+    __slots__ = ()
 
 
 class Destination(EntryPoint):
-    pass
+
+    __slots__ = ()
 
 
 class EntryPointFactory(object):
 
+    """
+    Creates entry points from strings.
+    Created entry points are cached per (string, kind), so messages with the
+    same source and destination share entry point objects. Cache is cleared
+    when it grows over CACHE_SIZE entries
+    """
+
+    CACHE_SIZE = 10000
+    _cache = {}
+
     def _create_entry_point(self, *parts):
         return EntryPoint(*parts)
 
@@ -118,6 +138,16 @@ class EntryPointFactory(object):
         if isinstance(value, EntryPoint):
             return value
 
+        key = (self.__class__, value, bool(source), bool(destination))
+        ep = self._cache.get(key)
+        if ep is None:
+            ep = self._create(value, source, destination)
+            if len(self._cache) >= self.CACHE_SIZE:
+                self._cache.clear()
+            self._cache[key] = ep
+        return ep
+
+    def _create(self, value, source, destination):
         if not value:
             return self._create_null()
         elif "." in value:
@@ -125,6 +125,13 @@ class IncorrectAMQPLibrary(BaseException):
     _service_error_code = 1010
 
 
+class AsyncioIsNotAvailable(BaseException):
+
+    _msg_template = ("asyncio engine requires asyncio (Python 3) or "
+                     "trollius (Python 2) library")
+    _service_error_code = 1011
+
+
 class ServiceNotFound(BaseAckableException):
 
     _msg_template = "Service for %(entry_point)s is not found"
@@ -207,3 +214,76 @@ class CantRegisterRemotePublisher(BaseException):
 class ConfigFileIsNotDefined(BaseException):
     _msg_template = "Config file is not defined"
     _service_error_code = 1050
+
+
+class CodecIsNotAvailable(BaseException):
+
+    _msg_template = ("Codec %(codec)s is unknown or its library is not "
+                     "installed")
+    _service_error_code = 1032
+
+
+class UnknownContentType(BaseException):
+
+    _msg_template = ("Can't decode message body of content type "
+                     "%(content_type)s")
+    _service_error_code = 1033
+
+
+class UnknownContentEncoding(BaseException):
+
+    _msg_template = ("Compression %(content_encoding)s is unknown or its "
+                     "library is not installed")
+    _service_error_code = 1034
+
+
+class ExchangeNotFound(BaseException):
+
+    _msg_template = "Exchange %(exchange)s is not declared"
+    _service_error_code = 1035
+
+
+class QueueNotFound(BaseException):
+
+    _msg_template = "Queue %(queue)s is not declared"
+    _service_error_code = 1036
+
+
+class QueueIsFull(BaseException):
+
+    _msg_template = "Queue %(queue)s is full"
+    _service_error_code = 1037
+
+
+class RemoteError(BaseException):
+
+    """
+    Error returned by remote service in response to request of blocking
+    client. Code is the code of remote error
+    """
+
+    _msg_template = "Remote error %(error_class)s: %(message)s"
+
+    @property
+    def error_class(self):
+        return self._kwargs.get("error_class")
+
+    @property
+    def code(self):
+        code = self._kwargs.get("code")
+        if code is None:
+            return self._service_error_code
+        return code
+
+
+class ReplyTimeout(BaseException):
+
+    _msg_template = ("No reply to request %(request_id)s in %(timeout)s "
+                     "seconds")
+    _service_error_code = 1038
+
+
+class ReplyConsumerIsStopped(BaseException):
+
+    _msg_template = "Consumer of reply queue %(queue)s is stopped"
+    _service_error_code = 1039
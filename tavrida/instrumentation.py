@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+# Copyright (c) 2015 Sergey Bunatyan <sergey.bunatyan@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+import timeit
+
+import utils
+
+# Whole processing of incoming message, the following stages are nested
+PROCESSING = "processing"
+# Stages of incoming message processing
+VALIDATION = "validation"
+DECOMPRESSION = "decompression"
+DESERIALIZATION = "deserialization"
+ROUTING = "routing"
+INCOMING_MIDDLEWARES = "incoming_middlewares"
+HANDLER = "handler"
+# Stages of outgoing message processing
+OUTGOING_MIDDLEWARES = "outgoing_middlewares"
+SERIALIZATION = "serialization"
+COMPRESSION = "compression"
+PUBLISH = "publish"
+# Debug logging of incoming and outgoing AMQP messages
+LOGGING = "logging"
+
+timer = timeit.default_timer
+
+LOG = logging.getLogger(__name__)
+
+_observers = ()
+_lock = threading.Lock()
+
+
+class Observer(object):
+
+    """
+    Base class of observers of message processing stages. Observers are
+    called in the thread that processes message, exceptions raised by them
+    are logged and ignored.
+    Stages are nested: e.g. publish of response is observed inside handler
+    stage of request if handler sends it.
+    Handler and processing stages of coroutine handlers are suspended: they
+    end when coroutine is done, stages of other messages of the thread
+    start and end meanwhile.
+    """
+
+    def on_stage_start(self, stage, message):
+        """
+        Is called before stage
+
+        :param stage: name of stage
+        :type stage: string
+        :param message: message that is passed to stage, None for batch
+            publication
+        :type message: messages.Message or messages.AMQPMessage
+        """
+
+    def on_stage_end(self, stage, message, duration, error=None):
+        """
+        Is called after stage
+
+        :param stage: name of stage
+        :type stage: string
+        :param message: message that was passed to stage
+        :type message: messages.Message or messages.AMQPMessage
+        :param duration: duration of stage (secs)
+        :type duration: float
+        :param error: exception raised by stage
+        :type error: Exception
+        """
+
+    def on_stage_suspend(self, stage, message, future):
+        """
+        Is called if stage returned awaitable (coroutine handler). Stage
+        continues in future (asyncio task), on_stage_end is called when it
+        is done
+
+        :param stage: name of stage
+        :type stage: string
+        :param message: message that was passed to stage
+        :type message: messages.Message or messages.AMQPMessage
+        :param future: future or task of stage
+        :type future: asyncio.Future
+        """
+
+
+def register_observer(observer):
+    """
+    Registers observer of all processing stages in process
+
+    :param observer: observer
+    :type observer: Observer
+    """
+    global _observers
+    with _lock:
+        if observer not in _observers:
+            _observers = _observers + (observer,)
+
+
+def unregister_observer(observer):
+    global _observers
+    with _lock:
+        _observers = tuple(o for o in _observers if o is not observer)
+
+
+def get_observers():
+    """
+    Returns registered observers. Empty tuple means that instrumentation is
+    disabled
+
+    :rtype: tuple
+    """
+    return _observers
+
+
+def _notify_start(observers, stage, message):
+    for observer in observers:
+        try:
+            observer.on_stage_start(stage, message)
+        except Exception as e:
+            LOG.exception(e)
+
+
+def _notify_end(observers, stage, message, duration, error):
+    for observer in observers:
+        try:
+            observer.on_stage_end(stage, message, duration, error)
+        except Exception as e:
+            LOG.exception(e)
+
+
+def run_stage(observers, stage, message, func, args, kwargs=None):
+    """
+    Calls func as stage of message processing and notifies observers
+
+    :param observers: observers returned by get_observers()
+    :type observers: tuple
+    :param stage: name of stage
+    :type stage: string
+    :param message: processed message
+    :param func: stage implementation
+    :type func: callable
+    :param args: positional arguments of func
+    :type args: tuple
+    :param kwargs: keyword arguments of func (e.g. handler parameters)
+    :type kwargs: dict
+    :return: result of func
+    """
+    _notify_start(observers, stage, message)
+    error = None
+    started_at = timer()
+    try:
+        if kwargs:
+            return func(*args, **kwargs)
+        return func(*args)
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        _notify_end(observers, stage, message, timer() - started_at, error)
+
+
+def _notify_suspend(observers, stage, message, future):
+    for observer in observers:
+        try:
+            observer.on_stage_suspend(stage, message, future)
+        except Exception as e:
+            LOG.exception(e)
+
+
+def observe(stage, message, func, args, kwargs=None):
+    """
+    Calls func as stage of message processing if there are observers,
+    otherwise just calls it
+
+    :param stage: name of stage
+    :type stage: string
+    :param message: processed message
+    :param func: stage implementation
+    :type func: callable
+    :param args: positional arguments of func
+    :type args: tuple
+    :param kwargs: keyword arguments of func (e.g. handler parameters)
+    :type kwargs: dict
+    :return: result of func
+    """
+    observers = _observers
+    if not observers:
+        if kwargs:
+            return func(*args, **kwargs)
+        return func(*args)
+    return run_stage(observers, stage, message, func, args, kwargs)
+
+
+def observe_awaitable(stage, message, func, args, kwargs=None):
+    """
+    Calls func as stage of message processing like observe(). If func
+    returns awaitable (coroutine handler), stage ends when it is done
+
+    :param stage: name of stage
+    :type stage: string
+    :param message: processed message
+    :param func: stage implementation
+    :type func: callable
+    :param args: positional arguments of func
+    :type args: tuple
+    :param kwargs: keyword arguments of func (e.g. handler parameters)
+    :type kwargs: dict
+    :return: result of func, future of its result if it is awaitable
+    """
+    observers = _observers
+    if not observers:
+        if kwargs:
+            return func(*args, **kwargs)
+        return func(*args)
+    _notify_start(observers, stage, message)
+    started_at = timer()
+    try:
+        if kwargs:
+            result = func(*args, **kwargs)
+        else:
+            result = func(*args)
+    except Exception as e:
+        _notify_end(observers, stage, message, timer() - started_at, e)
+        raise
+    if not utils.is_awaitable(result):
+        _notify_end(observers, stage, message, timer() - started_at, None)
+        return result
+    future = utils.asyncio.ensure_future(result)
+    _notify_suspend(observers, stage, message, future)
+
+    def on_done(done_future):
+        try:
+            result = done_future.result()
+        except Exception as e:
+            _notify_end(observers, stage, message, timer() - started_at, e)
+            raise
+        _notify_end(observers, stage, message, timer() - started_at, None)
+        return result
+
+    return utils.chain_awaitable(future, on_done)
+
+
+def run_steps(steps, message):
+    """
+    Passes message through steps. Every step is observed as stage named by
+    its 'stage' attribute
+
+    :param steps: list of steps
+    :type steps: list of controller.AbstractController
+    :param message: message
+    :return: result of the last step
+    """
+    observers = _observers
+    if not observers:
+        for step in steps:
+            message = step.process(message)
+        return message
+    for step in steps:
+        message = run_stage(observers, step.stage, message, step.process,
+                            (message,))
+    return message
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# Copyright (c) 2015 Sergey Bunatyan <sergey.bunatyan@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import logging
+import threading
+
+import controller
+import exceptions
+import instrumentation
+import messages
+import timings
+
+
+class LocalDispatcher(controller.AbstractController):
+
+    """
+    Delivers requests, responses and errors between services of one server
+    without broker.
+
+    Messages are passed to preprocessor of the server as LocalAMQPMessage,
+    so validation, logging, routing and incoming middlewares are the same as
+    for messages received from RabbitMQ, only serialization is skipped.
+    Dispatcher wraps preprocessor given to reader: messages sent while a
+    message is handled are queued and handled after it in the same
+    thread, so handler of caller finishes before handler of callee starts,
+    as with broker. Errors of local messages are logged, they don't affect
+    ack of the message received from RabbitMQ. Message rejected by local
+    service with NackableException is sent via RabbitMQ by fallback given
+    to dispatch, as broker would requeue it.
+    """
+
+    def __init__(self):
+        super(LocalDispatcher, self).__init__()
+        self.log = logging.getLogger(__name__)
+        self._routing_table = None
+        self._preprocessor = None
+        self._state = threading.local()
+
+    def bind(self, routing_table, preprocessor):
+        """
+        Binds dispatcher to routing table and preprocessor of server
+
+        :param routing_table: routing table of server services
+        :type routing_table: router.RoutingTable
+        :param preprocessor: preprocessor of server
+        :type preprocessor: preprocessor.PreProcessor
+        :return: self, to be passed to reader instead of preprocessor
+        :rtype: LocalDispatcher
+        """
+        self._routing_table = routing_table
+        self._preprocessor = preprocessor
+        return self
+
+    def is_local(self, message):
+        """
+        Checks if outgoing message could be delivered locally
+
+        :param message: outgoing message
+        :type message: messages.Message
+        :rtype: bool
+        """
+        if self._routing_table is None:
+            return False
+        if message.headers.get(messages.REPLY_QUEUE_HEADER):
+            return False
+        return self._routing_table.is_local(message)
+
+    def _fall_back(self, amqp_message, fallback):
+        self.log.warning("Local message %s is rejected, sending it via "
+                         "RabbitMQ", amqp_message.headers.get("message_id"))
+        try:
+            fallback()
+        except Exception as e:
+            self.log.exception(e)
+
+    def _drain(self, queue):
+        while queue:
+            amqp_message, fallback = queue.popleft()
+            timings.stamp(amqp_message.headers, timings.RECEIVED_AT)
+            try:
+                self._preprocessor.process(amqp_message)
+            except Exception as e:
+                if (isinstance(e, exceptions.NackableException) and
+                        fallback is not None):
+                    self._fall_back(amqp_message, fallback)
+                else:
+                    self.log.exception(e)
+
+    @staticmethod
+    def _publish(queue, amqp_message, fallback):
+        instrumentation.observe(instrumentation.PUBLISH, amqp_message,
+                                queue.append, ((amqp_message, fallback),))
+
+    def dispatch(self, amqp_message, fallback=None):
+        """
+        Delivers outgoing message to local service
+
+        :param amqp_message: outgoing message
+        :type amqp_message: messages.LocalAMQPMessage
+        :param fallback: callable that sends message via RabbitMQ if local
+            service rejects it with NackableException
+        :type fallback: callable
+        """
+        queue = getattr(self._state, "queue", None)
+        if queue is not None:
+            self._publish(queue, amqp_message, fallback)
+            return
+        queue = self._state.queue = collections.deque()
+        self._publish(queue, amqp_message, fallback)
+        try:
+            self._drain(queue)
+        finally:
+            self._state.queue = None
+
+    def process(self, amqp_message):
+        """
+        Processes message received from RabbitMQ and then local messages
+        sent by its handlers
+
+        :param amqp_message: AMPQ message
+        :type amqp_message: messages.AMQPMessage
+        :return: result of preprocessor
+        """
+        queue = self._state.queue = collections.deque()
+        try:
+            return self._preprocessor.process(amqp_message)
+        finally:
+            # messages sent before handler failed are delivered as well
+            try:
+                self._drain(queue)
+            finally:
+                self._state.queue = None
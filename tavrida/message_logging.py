@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# Copyright (c) 2015 Sergey Bunatyan <sergey.bunatyan@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import logging
+import Queue
+import random
+import threading
+
+import metrics
+
+INCOMING = "incoming"
+OUTGOING = "outgoing"
+
+SENSITIVE_HEADERS = ('authorization', 'proxy-authorization')
+
+_message_log = None
+
+
+def hide_sensitive_data(headers):
+    """
+    Returns copy of headers with values of SENSITIVE_HEADERS (in any case)
+    replaced by their names
+
+    :param headers: message headers
+    :type headers: dict
+    :rtype: dict
+    """
+    processed_headers = {}
+    for key, value in headers.iteritems():
+        lower_key = key.lower()
+        if lower_key in SENSITIVE_HEADERS:
+            value = '<%s>' % lower_key
+        processed_headers[key] = value
+    return processed_headers
+
+
+class MessageLog(object):
+
+    """
+    Writes sampled AMQP messages to log as JSON records in background
+    thread. Processing thread only makes sampling decision and puts
+    reference to message data into bounded queue, records that don't fit
+    into full queue are dropped.
+    Sample rate is looked up by entry point (destination of request,
+    response or error, publisher of notification), then by its service.
+    Bodies are truncated to max_body_size characters
+    """
+
+    LOGGER_NAME = "tavrida.messages"
+
+    def __init__(self, sample_rates=None, default_rate=1.0,
+                 max_body_size=1024, queue_size=10000):
+        super(MessageLog, self).__init__()
+        self.log = logging.getLogger(__name__)
+        self._records_log = logging.getLogger(self.LOGGER_NAME)
+        self._sample_rates = dict(sample_rates or {})
+        self._default_rate = default_rate
+        self._max_body_size = max_body_size
+        self._queue = Queue.Queue(queue_size)
+        self._dropped = 0
+        self._thread = None
+
+    @property
+    def dropped(self):
+        """
+        Number of records dropped because queue was full
+        """
+        return self._dropped
+
+    def get_sample_rate(self, entry_point):
+        rate = self._sample_rates.get(entry_point)
+        if rate is None:
+            rate = self._sample_rates.get(entry_point.split(".", 1)[0],
+                                          self._default_rate)
+        return rate
+
+    def log_message(self, direction, message):
+        """
+        Queues record of message if it is sampled. Never blocks
+
+        :param direction: INCOMING or OUTGOING
+        :type direction: string
+        :param message: AMQP message
+        :type message: messages.AMQPMessage
+        """
+        headers = message.headers
+        entry_point = metrics.get_entry_point(headers)
+        rate = self.get_sample_rate(entry_point)
+        if rate < 1 and (rate <= 0 or random.random() >= rate):
+            return
+        body = message.body
+        if isinstance(body, basestring):
+            body_size = len(body)
+        else:
+            # body of local message is not serialized, it is shared with
+            # handler, so it is formatted before handling
+            body = repr(body)
+            body_size = None
+        try:
+            # headers are changed by the following steps, string body is
+            # replaced, not modified
+            self._queue.put_nowait((direction, entry_point, dict(headers),
+                                    body, body_size))
+        except Queue.Full:
+            self._dropped += 1
+
+    def _format_body(self, body):
+        if isinstance(body, str):
+            body = body[:self._max_body_size + 1].decode("utf-8", "replace")
+        if len(body) > self._max_body_size:
+            return body[:self._max_body_size], True
+        return body, False
+
+    def format_record(self, direction, entry_point, headers, body,
+                      body_size):
+        """
+        Returns JSON record of message
+
+        :param body: AMQP body or repr of not serialized body
+        :type body: string
+        :param body_size: size of AMQP body, None if it is not serialized
+        :type body_size: int
+        :rtype: string
+        """
+        body, truncated = self._format_body(body)
+        return json.dumps({
+            "direction": direction,
+            "entry_point": entry_point,
+            "headers": hide_sensitive_data(headers),
+            "body": body,
+            "body_size": body_size,
+            "truncated": truncated
+        }, sort_keys=True, default=repr)
+
+    def _write(self, record):
+        self._records_log.info(self.format_record(*record))
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            if record is None:
+                return
+            try:
+                self._write(record)
+            except Exception as e:
+                self.log.exception(e)
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run,
+                                        name="tavrida-message-log")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Writes queued records and stops background thread
+        """
+        if not self._thread:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+
+def get_message_log():
+    """
+    Returns message log of process, None if it is not enabled
+
+    :rtype: MessageLog
+    """
+    return _message_log
+
+
+def enable(message_log):
+    """
+    Starts message log and uses it instead of debug logging of messages in
+    the current process
+
+    :param message_log: message log
+    :type message_log: MessageLog
+    """
+    global _message_log
+    message_log.start()
+    _message_log = message_log
+
+
+def disable():
+    """
+    Stops message log of process
+    """
+    global _message_log
+    message_log, _message_log = _message_log, None
+    if message_log:
+        message_log.stop()
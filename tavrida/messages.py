@@ -14,33 +14,43 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import anyjson
 import copy
-import logging
 import uuid
 
 import entry_point
 import exceptions
+import serialization
+import timings
 import utils
 
+# Header of request with name of exclusive queue of client (see
+# client.BlockingRPCClient) that response should be sent to
+REPLY_QUEUE_HEADER = "reply_queue"
+
 
 class AMQPMessage(object):
 
     """
     Container for raw AMQP message
     Stored raw body as string and headers as dict
-    This class is used in AMQP drivers to send AMQP Message to preprocessor
+    This class is used in AMQP drivers to send AMQP Message to preprocessor.
+    content_type and content_encoding are sent in AMQP properties and
+    define codec and compression of body
     """
 
     REQUIRED_HEADERS = ["correlation_id", "message_id", "request_id",
                         "message_type", "source", "destination"]
     MESSAGE_TYPE = ["request", "response", "notification", "error"]
 
-    def __init__(self, body, headers):
+    __slots__ = ("body", "headers", "content_type", "content_encoding")
+
+    def __init__(self, body, headers, content_type=None,
+                 content_encoding=None):
         super(AMQPMessage, self).__init__()
         self.body = body
         self.headers = headers
-        self.log = logging.getLogger(__name__)
+        self.content_type = content_type
+        self.content_encoding = content_encoding
 
     def _validate_headers(self, headers):
         for field in self.REQUIRED_HEADERS:
@@ -67,41 +77,117 @@ class AMQPMessage(object):
         self._validate_headers(self.headers)
 
     @classmethod
-    def create_from_message(cls, message):
+    def create_from_message(cls, message, codec=None):
         """
         Create AMQP message from Message. Method is used in postprocessor
 
         :param message: Message (Response, Error, Notifications, etc)
         :type message: message.Message
+        :param codec: body codec, JSON by default
+        :type codec: serialization.AbstractCodec
         :return: AMQPMessage object
         :type: AMQPMessage
         """
-        return cls(message.body_serialize(), message.headers)
+        codec = codec or serialization.get_default_codec()
+        return cls(message.body_serialize(codec), message.headers,
+                   codec.content_type)
 
     def body_deserialize(self):
         """
-        Deserializes raw JSON message to dict
+        Deserializes raw message to dict by codec of its content type
 
         :return: deserialized body
         :type: dict
         """
-        return anyjson.deserialize(self.body)
+        return serialization.get_decoder(self.content_type).decode(self.body)
+
+
+class LocalAMQPMessage(AMQPMessage):
+
+    """
+    AMQP message that is passed to preprocessor of the same process
+    without broker. Body is a dict with copies of payload and context,
+    it is not serialized
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def create_from_message(cls, message, codec=None):
+        """
+        Create local AMQP message from outgoing message. Payload and context
+        are copied, so sender and receiver don't share them
+
+        :param message: Message (Request, Response, Error)
+        :type message: message.Message
+        :param codec: is not used, is accepted for compatibility with
+            AMQPMessage
+        :return: local AMQP message
+        :rtype: LocalAMQPMessage
+        """
+        body = copy.deepcopy({"payload": message.payload,
+                              "context": message.context})
+        return cls(body, dict(message.headers))
+
+    def body_deserialize(self):
+        return self.body
 
 
 class Incoming(object):
-    pass
+
+    __slots__ = ()
 
 
 class Outgoing(object):
-    pass
+
+    __slots__ = ()
+
+
+class LazyBody(object):
+
+    """
+    Body of incoming AMQP message that is deserialized on first access
+    """
+
+    __slots__ = ("_amqp_message", "_body")
+
+    def __init__(self, amqp_message):
+        super(LazyBody, self).__init__()
+        self._amqp_message = amqp_message
+        self._body = None
+
+    @property
+    def loaded(self):
+        return self._body is not None
+
+    def load(self):
+        """
+        Deserializes body once
+
+        :return: dict with payload and context
+        :rtype: dict
+        """
+        if self._body is None:
+            self._body = self._amqp_message.body_deserialize()
+            self._amqp_message = None
+        return self._body
 
 
 class Message(object):
 
     """
-    Base message class. Parent class for all messages
+    Base message class. Parent class for all messages.
+    Entry points are created from headers on first access. If payload is
+    LazyBody, payload and context are deserialized on first access, so
+    messages could be routed by headers without decoding of body.
+    Messages have no instance dict: subclasses should define __slots__
     """
 
+    __slots__ = ("correlation_id", "request_id", "message_id",
+                 "message_type", "_reply_to", "_source", "_destination",
+                 "_headers", "_context", "_lazy_body", "_payload",
+                 "_context_before_payload")
+
     def __init__(self,
                  headers,
                  context,
@@ -116,34 +202,85 @@ class Message(object):
         self.request_id = headers.get("request_id")
         self.message_id = headers.get("message_id")
         self.message_type = headers.get("message_type")
-        self.reply_to = entry_point.EntryPointFactory().create(
-            headers.get("reply_to"))
-        self.source = entry_point.EntryPointFactory().create(
-            headers.get("source"), source=True)
-        self.destination = entry_point.EntryPointFactory().create(
-            headers.get("destination"), destination=True)
-
-        self._headers = copy.copy(headers)
+        self._reply_to = None
+        self._source = None
+        self._destination = None
+
         self._context = context or {}
-        self._payload = payload
+        self._context_before_payload = None
+
+        if isinstance(payload, LazyBody):
+            # headers of received message are owned by the message
+            self._headers = headers
+            self._lazy_body = payload
+            self._payload = None
+        else:
+            self._headers = copy.copy(headers)
+            self._lazy_body = None
+            self._payload = payload
 
         if not isinstance(self.source, entry_point.EntryPoint):
             raise TypeError('source must be EntryPoint')
 
+        if self._lazy_body is None:
+            self._validate_payload(payload)
+
+    @staticmethod
+    def _validate_payload(payload):
         if not isinstance(payload, dict):
             raise TypeError('payload must be dict, received {}'
                             .format(type(payload)))
 
+    def _load_body(self):
+        body = self._lazy_body.load()
+        payload = body["payload"]
+        self._validate_payload(payload)
+        context = body["context"] or {}
+        # context updated before deserialization takes precedence
+        if self._context_before_payload is not None:
+            context.update(self._context_before_payload)
+            context.update(payload)
+            self._context_before_payload = None
+        context.update(self._context)
+        self._payload = payload
+        self._context = context
+        self._lazy_body = None
+
+    @property
+    def reply_to(self):
+        if self._reply_to is None:
+            self._reply_to = entry_point.EntryPointFactory().create(
+                self._headers.get("reply_to"))
+        return self._reply_to
+
+    @property
+    def source(self):
+        if self._source is None:
+            self._source = entry_point.EntryPointFactory().create(
+                self._headers.get("source"), source=True)
+        return self._source
+
+    @property
+    def destination(self):
+        if self._destination is None:
+            self._destination = entry_point.EntryPointFactory().create(
+                self._headers.get("destination"), destination=True)
+        return self._destination
+
     @property
     def headers(self):
         return self._headers
 
     @property
     def context(self):
+        if self._lazy_body is not None:
+            self._load_body()
         return self._context
 
     @property
     def payload(self):
+        if self._lazy_body is not None:
+            self._load_body()
         return self._payload
 
     @property
@@ -157,15 +294,30 @@ class Message(object):
     def update_context(self, context):
         self._context.update(context)
 
-    def body_serialize(self):
+    def update_context_by_payload(self):
+        """
+        Updates context by payload. If body is not deserialized yet, the
+        update is postponed until payload or context is accessed
         """
-        Serializes message to JSON
+        if self._lazy_body is None:
+            self._context.update(self._payload)
+        elif self._context_before_payload is None:
+            # keeps order: updates made later take precedence over payload
+            self._context_before_payload = self._context
+            self._context = {}
 
-        :return: JSON representation
+    def body_serialize(self, codec=None):
+        """
+        Serializes message to JSON or by given codec
+
+        :param codec: body codec
+        :type codec: serialization.AbstractCodec
+        :return: serialized representation
         :rtype: string
         """
-        return anyjson.serialize({"payload": self.payload,
-                                  "context": self.context})
+        codec = codec or serialization.get_default_codec()
+        return codec.encode({"payload": self.payload,
+                             "context": self.context})
 
 
 class IncomingRequest(Message, Incoming):
@@ -174,6 +326,8 @@ class IncomingRequest(Message, Incoming):
     Incoming request object
     """
 
+    __slots__ = ()
+
 
 class IncomingRequestCall(IncomingRequest):
 
@@ -181,6 +335,8 @@ class IncomingRequestCall(IncomingRequest):
     Incoming call request object
     """
 
+    __slots__ = ()
+
     def make_response(self, **payload):
         """
         Create response to request
@@ -199,6 +355,8 @@ class IncomingRequestCast(IncomingRequest):
     Incoming cast request object
     """
 
+    __slots__ = ()
+
 
 class Request(Message, Outgoing):
 
@@ -206,6 +364,8 @@ class Request(Message, Outgoing):
     Outgoing request object
     """
 
+    __slots__ = ()
+
     def __init__(self, headers, context, payload):
         headers = copy.copy(headers)
         if not headers["correlation_id"]:
@@ -226,6 +386,8 @@ class BaseResponse(Message):
     Base response object
     """
 
+    __slots__ = ()
+
     def __init__(self, headers, context, payload):
         headers = copy.copy(headers)
         headers["reply_to"] = str(entry_point.NullEntryPoint())
@@ -238,7 +400,8 @@ class IncomingResponse(BaseResponse, Incoming):
     """
     Incoming response object
     """
-    pass
+
+    __slots__ = ()
 
 
 class Response(BaseResponse, Outgoing):
@@ -247,6 +410,8 @@ class Response(BaseResponse, Outgoing):
     Outgoing response object
     """
 
+    __slots__ = ()
+
     @classmethod
     def create_by_request(cls, request, payload):
 
@@ -269,6 +434,7 @@ class Response(BaseResponse, Outgoing):
         }
         request_headers = request.headers.copy()
         request_headers.update(headers)
+        request_headers.update(timings.get_reply_stamps(request.headers))
         return cls(request_headers, request.context, payload)
 
 
@@ -278,6 +444,8 @@ class BaseError(Message):
     Base error message
     """
 
+    __slots__ = ()
+
     def __init__(self, headers, context, payload):
         headers = copy.copy(headers)
         headers["reply_to"] = str(entry_point.NullEntryPoint())
@@ -290,7 +458,8 @@ class IncomingError(BaseError, Incoming):
     """
     Incoming error message
     """
-    pass
+
+    __slots__ = ()
 
 
 class Error(BaseError, Outgoing):
@@ -299,6 +468,8 @@ class Error(BaseError, Outgoing):
     Outgoing error message
     """
 
+    __slots__ = ()
+
     def __init__(self, headers, context, exception):
 
         try:
@@ -334,6 +505,7 @@ class Error(BaseError, Outgoing):
         }
         request_headers = request.headers.copy()
         request_headers.update(headers)
+        request_headers.update(timings.get_reply_stamps(request.headers))
         return cls(request_headers, request.context, exception)
 
 
@@ -343,6 +515,8 @@ class IncomingNotification(Message, Incoming):
     Incoming notification message
     """
 
+    __slots__ = ()
+
     def __init__(self, headers, context, payload):
         headers = copy.copy(headers)
         headers["reply_to"] = str(entry_point.NullEntryPoint())
@@ -357,6 +531,8 @@ class Notification(Message, Outgoing):
     Outgoing notification message
     """
 
+    __slots__ = ()
+
     def __init__(self, headers, context, payload):
         headers = copy.copy(headers)
         headers["reply_to"] = str(entry_point.NullEntryPoint())
@@ -517,9 +693,9 @@ class IncomingMessageFactory(object):
             headers["reply_to"])
 
         message_cls = self.get_class(headers["message_type"], reply_to)
-        body = amqp_message.body_deserialize()
-        payload = body["payload"]
-        context = body["context"]
+        # body is deserialized when handler needs payload or context
+        payload = LazyBody(amqp_message)
+        context = None
         if issubclass(message_cls, IncomingRequestCall):
             return self._create_request_call(headers, context, payload)
         elif issubclass(message_cls, Error):
@@ -0,0 +1,519 @@
+#!/usr/bin/env python
+# Copyright (c) 2015 Sergey Bunatyan <sergey.bunatyan@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import BaseHTTPServer
+import logging
+import math
+import threading
+
+import exceptions
+import instrumentation
+import messages
+import timings
+
+# Latency histograms store microseconds, up to one hour
+MICROSECONDS = 1000000
+MAX_LATENCY = 3600 * MICROSECONDS
+# Size histograms store bytes, up to 1 GiB
+MAX_SIZE = 1 << 30
+
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class HdrHistogram(object):
+
+    """
+    High dynamic range histogram of non-negative integer values.
+    Values are counted in log-linear buckets, so relative error of recorded
+    values is bounded by significant_figures decimal digits over the whole
+    range, and memory doesn't depend on number of recorded values.
+    Values above highest_trackable_value are recorded as the highest one
+    """
+
+    def __init__(self, highest_trackable_value, significant_figures=2):
+        super(HdrHistogram, self).__init__()
+        self._highest_trackable_value = highest_trackable_value
+        single_unit_resolution = 2 * 10 ** significant_figures
+        sub_bucket_count_magnitude = int(math.ceil(
+            math.log(single_unit_resolution, 2)))
+        self._sub_bucket_half_count_magnitude = sub_bucket_count_magnitude - 1
+        self._sub_bucket_count = 1 << sub_bucket_count_magnitude
+        self._sub_bucket_half_count = self._sub_bucket_count >> 1
+        self._sub_bucket_mask = self._sub_bucket_count - 1
+        bucket_count = 1
+        smallest_untrackable_value = self._sub_bucket_count
+        while smallest_untrackable_value <= highest_trackable_value:
+            smallest_untrackable_value <<= 1
+            bucket_count += 1
+        self._counts = [0] * ((bucket_count + 1) *
+                              self._sub_bucket_half_count)
+        self._total_count = 0
+        self._sum = 0
+        self._min = None
+        self._max = None
+        self._lock = threading.Lock()
+
+    @property
+    def count(self):
+        return self._total_count
+
+    @property
+    def sum(self):
+        return self._sum
+
+    @property
+    def min(self):
+        return self._min
+
+    @property
+    def max(self):
+        return self._max
+
+    def _get_counts_index(self, value):
+        bucket_index = ((value | self._sub_bucket_mask).bit_length() -
+                        self._sub_bucket_half_count_magnitude - 1)
+        sub_bucket_index = value >> bucket_index
+        return (((bucket_index + 1) <<
+                 self._sub_bucket_half_count_magnitude) +
+                sub_bucket_index - self._sub_bucket_half_count)
+
+    def _get_highest_equivalent_value(self, index):
+        bucket_index = (index >> self._sub_bucket_half_count_magnitude) - 1
+        sub_bucket_index = ((index & (self._sub_bucket_half_count - 1)) +
+                            self._sub_bucket_half_count)
+        if bucket_index < 0:
+            sub_bucket_index -= self._sub_bucket_half_count
+            bucket_index = 0
+        lowest_value = sub_bucket_index << bucket_index
+        return lowest_value + (1 << bucket_index) - 1
+
+    def record(self, value):
+        """
+        Records value
+
+        :param value: value
+        :type value: int
+        """
+        value = min(max(int(value), 0), self._highest_trackable_value)
+        index = self._get_counts_index(value)
+        with self._lock:
+            self._counts[index] += 1
+            self._total_count += 1
+            self._sum += value
+            if self._min is None or value < self._min:
+                self._min = value
+            if self._max is None or value > self._max:
+                self._max = value
+
+    def get_quantiles(self, quantiles):
+        """
+        Returns values at quantiles. Every value is the highest value that
+        is equivalent to recorded one within histogram precision, but not
+        greater than maximal recorded value
+
+        :param quantiles: sorted quantiles from 0 to 1
+        :type quantiles: list of float
+        :return: values at quantiles, zeros if nothing is recorded
+        :rtype: list of int
+        """
+        with self._lock:
+            counts = list(self._counts)
+            total_count = self._total_count
+            max_value = self._max
+        if not total_count:
+            return [0] * len(quantiles)
+        result = []
+        thresholds = [max(int(q * total_count + 0.5), 1) for q in quantiles]
+        position = 0
+        cumulative = 0
+        for index, count in enumerate(counts):
+            if not count:
+                continue
+            cumulative += count
+            while (position < len(thresholds) and
+                   cumulative >= thresholds[position]):
+                result.append(min(self._get_highest_equivalent_value(index),
+                                  max_value))
+                position += 1
+            if position == len(thresholds):
+                break
+        return result
+
+    def value_at_quantile(self, quantile):
+        """
+        Returns value at quantile
+
+        :param quantile: quantile from 0 to 1
+        :type quantile: float
+        :rtype: int
+        """
+        return self.get_quantiles([quantile])[0]
+
+
+class _Metric(object):
+
+    """
+    Family of metrics with the same name, children are created for every
+    combination of label values
+    """
+
+    type_name = None
+
+    def __init__(self, name, documentation, label_names):
+        super(_Metric, self).__init__()
+        self._name = name
+        self._documentation = documentation
+        self._label_names = tuple(label_names)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    @property
+    def name(self):
+        return self._name
+
+    def _create_child(self):
+        raise NotImplementedError()
+
+    def labels(self, *label_values):
+        """
+        Returns child metric for label values
+
+        :param label_values: values of labels in order of label names
+        :type label_values: list of string
+        """
+        child = self._children.get(label_values)
+        if child is None:
+            if len(label_values) != len(self._label_names):
+                raise ValueError("Metric %s has labels %s" %
+                                 (self._name, self._label_names))
+            with self._lock:
+                child = self._children.setdefault(label_values,
+                                                  self._create_child())
+        return child
+
+    def _format_labels(self, label_values, extra=()):
+        pairs = zip(self._label_names, label_values) + list(extra)
+        if not pairs:
+            return ""
+        return "{%s}" % ",".join('%s="%s"' % (name, _escape(value))
+                                 for name, value in pairs)
+
+    def _render_samples(self, label_values, child):
+        raise NotImplementedError()
+
+    def render(self):
+        """
+        Returns metric in Prometheus text format
+
+        :rtype: string
+        """
+        lines = ["# HELP %s %s" % (self._name, self._documentation),
+                 "# TYPE %s %s" % (self._name, self.type_name)]
+        for label_values, child in sorted(self._children.items()):
+            lines.extend(self._render_samples(label_values, child))
+        return "\n".join(lines)
+
+
+class CounterValue(object):
+
+    def __init__(self):
+        super(CounterValue, self).__init__()
+        self._value = 0
+        self._lock = threading.Lock()
+
+    @property
+    def value(self):
+        return self._value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+
+class Counter(_Metric):
+
+    type_name = "counter"
+
+    def _create_child(self):
+        return CounterValue()
+
+    def _render_samples(self, label_values, child):
+        return ["%s%s %s" % (self._name, self._format_labels(label_values),
+                             child.value)]
+
+
+class Histogram(_Metric):
+
+    """
+    Family of HDR histograms. Values are recorded in integer units and are
+    exported divided by divisor (e.g. microseconds are exported as seconds
+    with divisor 1000000) as Prometheus summary with QUANTILES
+    """
+
+    type_name = "summary"
+
+    def __init__(self, name, documentation, label_names,
+                 highest_trackable_value, divisor=1):
+        super(Histogram, self).__init__(name, documentation, label_names)
+        self._highest_trackable_value = highest_trackable_value
+        self._divisor = float(divisor)
+
+    def _create_child(self):
+        return HdrHistogram(self._highest_trackable_value)
+
+    def _render_samples(self, label_values, child):
+        lines = []
+        values = child.get_quantiles(QUANTILES)
+        for quantile, value in zip(QUANTILES, values):
+            lines.append("%s%s %r" % (
+                self._name,
+                self._format_labels(label_values,
+                                    [("quantile", repr(quantile))]),
+                value / self._divisor))
+        labels = self._format_labels(label_values)
+        lines.append("%s_sum%s %r" % (self._name, labels,
+                                      child.sum / self._divisor))
+        lines.append("%s_count%s %s" % (self._name, labels, child.count))
+        return lines
+
+
+def _escape(value):
+    return (str(value).replace("\\", "\\\\").replace("\n", "\\n")
+            .replace('"', '\\"'))
+
+
+class MetricsRegistry(object):
+
+    """
+    Stores metrics of process and renders them in Prometheus text format
+    """
+
+    def __init__(self):
+        super(MetricsRegistry, self).__init__()
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError("Metric %s is already registered" %
+                                 metric.name)
+            self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def counter(self, name, documentation, label_names=()):
+        """
+        Creates and registers counter
+
+        :param name: metric name
+        :type name: string
+        :param documentation: metric description
+        :type documentation: string
+        :param label_names: names of labels
+        :type label_names: list of string
+        :rtype: Counter
+        """
+        return self._register(Counter(name, documentation, label_names))
+
+    def histogram(self, name, documentation, label_names=(),
+                  highest_trackable_value=MAX_LATENCY, divisor=1):
+        """
+        Creates and registers HDR histogram
+
+        :param name: metric name
+        :type name: string
+        :param documentation: metric description
+        :type documentation: string
+        :param label_names: names of labels
+        :type label_names: list of string
+        :param highest_trackable_value: maximal recorded value
+        :type highest_trackable_value: int
+        :param divisor: number of recorded units in exported unit
+        :type divisor: int
+        :rtype: Histogram
+        """
+        return self._register(Histogram(name, documentation, label_names,
+                                        highest_trackable_value, divisor))
+
+    def render(self):
+        """
+        Returns all metrics in Prometheus text format
+
+        :rtype: string
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        return "".join(metric.render() + "\n" for metric in metrics)
+
+
+def get_entry_point(headers):
+    """
+    Returns entry point that incoming message is handled by: publisher
+    of notification, destination of other messages
+
+    :param headers: headers of AMQP message
+    :type headers: dict
+    :rtype: string
+    """
+    if headers.get("message_type") == "notification":
+        return headers.get("source") or ""
+    return headers.get("destination") or ""
+
+
+class MetricsObserver(instrumentation.Observer):
+
+    """
+    Collects per-entry-point metrics of processed messages:
+    received, handled, failed in handler and nacked messages, queue wait
+    (see timings module), handler and processing (from receipt to ack)
+    latency, sizes of received and published message bodies. Sizes of
+    messages delivered locally and published in batches are not recorded
+    """
+
+    def __init__(self, registry):
+        super(MetricsObserver, self).__init__()
+        labels = ("entry_point",)
+        self._received = registry.counter(
+            "tavrida_messages_received_total",
+            "Number of received messages", labels)
+        self._handled = registry.counter(
+            "tavrida_messages_handled_total",
+            "Number of messages handled without errors", labels)
+        self._errors = registry.counter(
+            "tavrida_handler_errors_total",
+            "Number of messages handler raised exception for", labels)
+        self._nacked = registry.counter(
+            "tavrida_messages_nacked_total",
+            "Number of messages returned to queue", labels)
+        self._handler_latency = registry.histogram(
+            "tavrida_handler_seconds", "Handler execution time", labels,
+            MAX_LATENCY, MICROSECONDS)
+        self._processing_latency = registry.histogram(
+            "tavrida_processing_seconds",
+            "Time from receipt of message to the end of its processing",
+            labels, MAX_LATENCY, MICROSECONDS)
+        self._queue_wait = registry.histogram(
+            "tavrida_queue_wait_seconds",
+            "Time from publication of message to its receipt", labels,
+            MAX_LATENCY, MICROSECONDS)
+        self._incoming_size = registry.histogram(
+            "tavrida_incoming_message_bytes",
+            "Size of received message body", labels, MAX_SIZE)
+        self._outgoing_size = registry.histogram(
+            "tavrida_outgoing_message_bytes",
+            "Size of published message body by source entry point", labels,
+            MAX_SIZE)
+
+    def on_stage_start(self, stage, message):
+        if stage != instrumentation.PROCESSING:
+            return
+        entry_point = get_entry_point(message.headers)
+        self._received.labels(entry_point).inc()
+        queue_wait = timings.get_queue_wait(message.headers)
+        if queue_wait is not None:
+            self._queue_wait.labels(entry_point).record(
+                queue_wait * MICROSECONDS)
+        if not isinstance(message, messages.LocalAMQPMessage):
+            self._incoming_size.labels(entry_point).record(len(message.body))
+
+    def on_stage_end(self, stage, message, duration, error=None):
+        if stage == instrumentation.HANDLER:
+            entry_point = get_entry_point(message.headers)
+            self._handler_latency.labels(entry_point).record(
+                duration * MICROSECONDS)
+            if error is None:
+                self._handled.labels(entry_point).inc()
+            else:
+                self._errors.labels(entry_point).inc()
+        elif stage == instrumentation.PROCESSING:
+            entry_point = get_entry_point(message.headers)
+            self._processing_latency.labels(entry_point).record(
+                duration * MICROSECONDS)
+            if isinstance(error, exceptions.NackableException):
+                self._nacked.labels(entry_point).inc()
+        elif (stage == instrumentation.PUBLISH and message is not None and
+                not isinstance(message, messages.LocalAMQPMessage)):
+            self._outgoing_size.labels(
+                message.headers.get("source") or "").record(len(message.body))
+
+
+class _MetricsRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.registry.render()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.getLogger(__name__).debug(format, *args)
+
+
+class MetricsHTTPServer(object):
+
+    """
+    Serves metrics of registry at /metrics in Prometheus text format in
+    background thread
+    """
+
+    def __init__(self, registry, port, host="127.0.0.1"):
+        super(MetricsHTTPServer, self).__init__()
+        self.log = logging.getLogger(__name__)
+        self._registry = registry
+        self._address = (host, port)
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def port(self):
+        """
+        Port the server listens on (useful if port 0 was given)
+        """
+        if self._httpd:
+            return self._httpd.server_address[1]
+        return self._address[1]
+
+    def start(self):
+        if self._httpd:
+            return
+        self._httpd = BaseHTTPServer.HTTPServer(self._address,
+                                                _MetricsRequestHandler)
+        self._httpd.registry = self._registry
+        self._thread = threading.Thread(target=self._httpd.serve_forever,
+                                        name="tavrida-metrics")
+        self._thread.daemon = True
+        self._thread.start()
+        self.log.info("Metrics are served on http://%s:%s/metrics",
+                      self._address[0], self.port)
+
+    def stop(self):
+        if not self._httpd:
+            return
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
+        self._httpd = None
+        self._thread = None
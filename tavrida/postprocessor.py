@@ -14,11 +14,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
 import logging
+import time
 
 import controller
 import entry_point
+import instrumentation
+import messages
 import steps
+import timings
 
 
 class PostProcessor(controller.AbstractController):
@@ -28,16 +33,29 @@ class PostProcessor(controller.AbstractController):
     transfer to writer
     """
 
-    def __init__(self, driver, discovery):
+    def __init__(self, driver, discovery, codec=None, compressor=None,
+                 compression_threshold=None, local_dispatcher=None):
         super(PostProcessor, self).__init__()
         self.log = logging.getLogger(__name__)
         self._driver = driver
         self._discovery = discovery
+        self._local_dispatcher = local_dispatcher
         self._steps = [
-            steps.CreateAMQPMiddleware(),
+            steps.CreateAMQPMiddleware(codec),
             steps.ValidateMessageMiddleware(),
             steps.LogOutgoingAMQPMessageMiddleware(),
         ]
+        if compressor and compression_threshold is not None:
+            self._steps.append(steps.CompressMessageMiddleware(
+                compressor, compression_threshold))
+        self._local_steps = [
+            steps.CreateLocalAMQPMiddleware(),
+            steps.ValidateMessageMiddleware(),
+            steps.LogOutgoingAMQPMessageMiddleware(),
+        ]
+
+    def _run_steps(self, message_obj):
+        return instrumentation.run_steps(self._steps, message_obj)
 
     def process(self, message_obj):
         """
@@ -46,12 +64,33 @@ class PostProcessor(controller.AbstractController):
         :param message_obj: message
         :type message_obj: messages.Message
         """
-        msg = message_obj
-        all_controllers = self._steps
-        for step in all_controllers:
-            msg = step.process(msg)
+        if self._send_locally(message_obj):
+            return
+        self._send_remotely(message_obj)
+
+    def _send_remotely(self, message_obj):
+        msg = self._run_steps(message_obj)
         self._send(msg)
 
+    def process_batch(self, message_objs):
+        """
+        Processes list of outgoing messages and sends them to writer at once
+
+        :param message_objs: messages
+        :type message_objs: list of messages.Message
+        """
+        batch = []
+        for message_obj in message_objs:
+            if self._send_locally(message_obj):
+                continue
+            msg = self._run_steps(message_obj)
+            exchange, routing_key = self._get_destination(msg)
+            timings.stamp(msg.headers, timings.SENT_AT)
+            batch.append((exchange, routing_key, msg))
+        if batch:
+            instrumentation.observe(instrumentation.PUBLISH, None,
+                                    self._driver.publish_messages, (batch,))
+
     @property
     def discovery_service(self):
         return self._discovery
@@ -63,13 +102,14 @@ class PostProcessor(controller.AbstractController):
     def set_discovery(self, discovery):
         self._discovery = discovery
 
-    def _send(self, message):
+    def _get_destination(self, message):
         """
-        Sends AMQP message to exchange via writer
+        Returns exchange and routing key to send AMQP message to
 
         :param message: AMQP message to send
         :type message: messages.AMQPMessage
-        :return:
+        :return: exchange name and routing key
+        :rtype: tuple
         """
         discovery_service = self.discovery_service
         if message.headers["message_type"] == "notification":
@@ -77,6 +117,11 @@ class PostProcessor(controller.AbstractController):
             ep = entry_point.EntryPointFactory().create(source)
             exchange = discovery_service.get_local_publisher(ep.service)
         elif message.headers["message_type"] in ("response", "error"):
+            reply_queue = message.headers.get(messages.REPLY_QUEUE_HEADER)
+            if reply_queue:
+                # Default exchange routes message to queue with name equal
+                # to routing key
+                return "", reply_queue
             rk = message.headers["destination"]
             ep = entry_point.EntryPointFactory().create(rk)
             exchange = discovery_service.get_remote(ep.service)
@@ -85,4 +130,104 @@ class PostProcessor(controller.AbstractController):
             ep = entry_point.EntryPointFactory().create(dst)
             exchange = discovery_service.get_remote(ep.service)
         routing_key = ep.to_routing_key()
-        self._driver.publish_message(exchange, routing_key, message)
+        return exchange, routing_key
+
+    def _send_locally(self, message_obj):
+        """
+        Passes message to local dispatcher if destination service is
+        instantiated in the same server. Message is validated and logged as
+        outgoing one, if local service rejects it with NackableException,
+        message is sent via RabbitMQ
+
+        :param message_obj: message
+        :type message_obj: messages.Message
+        :return: True if message is dispatched locally
+        :rtype: bool
+        """
+        if (self._local_dispatcher and
+                self._local_dispatcher.is_local(message_obj)):
+            amqp_message = instrumentation.run_steps(self._local_steps,
+                                                     message_obj)
+            timings.stamp(amqp_message.headers, timings.SENT_AT)
+            self._local_dispatcher.dispatch(
+                amqp_message,
+                functools.partial(self._send_remotely, message_obj))
+            return True
+        return False
+
+    def _send(self, message):
+        """
+        Sends AMQP message to exchange via writer
+
+        :param message: AMQP message to send
+        :type message: messages.AMQPMessage
+        :return:
+        """
+        exchange, routing_key = self._get_destination(message)
+        timings.stamp(message.headers, timings.SENT_AT)
+        instrumentation.observe(instrumentation.PUBLISH, message,
+                                self._driver.publish_message,
+                                (exchange, routing_key, message))
+
+
+class BatchPostProcessor(controller.AbstractController):
+
+    """
+    Collects outgoing messages and passes them to postprocessor in batches.
+    Batch is flushed when it reaches max_size messages, when the oldest
+    message in batch is older than max_delay seconds (checked on each new
+    message) or explicitly by flush()
+    """
+
+    def __init__(self, postprocessor, max_size=100, max_delay=1.0):
+        super(BatchPostProcessor, self).__init__()
+        self._postprocessor = postprocessor
+        self._max_size = max_size
+        self._max_delay = max_delay
+        self._messages = []
+        self._started_at = None
+
+    @property
+    def discovery_service(self):
+        return self._postprocessor.discovery_service
+
+    @property
+    def driver(self):
+        return self._postprocessor.driver
+
+    def __len__(self):
+        return len(self._messages)
+
+    def _is_full(self):
+        if len(self._messages) >= self._max_size:
+            return True
+        return (self._max_delay is not None and
+                time.time() - self._started_at >= self._max_delay)
+
+    def process(self, message_obj):
+        """
+        Adds outgoing message to batch
+
+        :param message_obj: message
+        :type message_obj: messages.Message
+        """
+        if not self._messages:
+            self._started_at = time.time()
+        self._messages.append(message_obj)
+        if self._is_full():
+            self.flush()
+
+    def flush(self):
+        """
+        Sends all collected messages
+        """
+        batch, self._messages = self._messages, []
+        self._started_at = None
+        self._postprocessor.process_batch(batch)
+
+    def discard(self):
+        """
+        Drops all collected messages
+        """
+        self._messages = []
+        self._started_at = None
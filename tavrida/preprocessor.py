@@ -17,6 +17,7 @@
 import logging
 
 import controller
+import instrumentation
 import steps
 
 
@@ -34,8 +35,10 @@ class PreProcessor(controller.AbstractController):
         self._service_list = service_list
         self._steps = [
             steps.ValidateMessageMiddleware(),
-            steps.CreateMessageMiddleware(),
-            steps.LogIncomingAMQPMessageMiddleware()
+            steps.DecompressMessageMiddleware(),
+            # raw body is logged, before it is decoded by handler
+            steps.LogIncomingAMQPMessageMiddleware(),
+            steps.CreateMessageMiddleware()
         ]
 
     def process(self, amqp_message):
@@ -44,11 +47,13 @@ class PreProcessor(controller.AbstractController):
 
         :param amqp_message: AMPQ message
         :type amqp_message: messages.AMQPMEssage
-        :return: response object ot None
+        :return: response object ot None, future if handler is coroutine
         :rtype: Response, Error or None
         """
-        msg = amqp_message
-        all_controllers = self._steps
-        for step in all_controllers:
-            msg = step.process(msg)
-        self._router.process(msg, self._service_list)
+        return instrumentation.observe_awaitable(
+            instrumentation.PROCESSING, amqp_message, self._process,
+            (amqp_message,))
+
+    def _process(self, amqp_message):
+        msg = instrumentation.run_steps(self._steps, amqp_message)
+        return self._router.process(msg, self._service_list)
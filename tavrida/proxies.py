@@ -17,15 +17,23 @@
 import copy
 
 import entry_point
+import exceptions
 import messages
+import timings
 
 
 class RCPCallProxy(object):
 
     """
-    Proxy class for method call
+    Proxy class for method call.
+    Headers are shared with method proxy and are not modified, request gets
+    its own copy
     """
 
+    __slots__ = ("_postprocessor", "_service_name", "_method_name",
+                 "_source", "_context", "_correlation_id", "_headers",
+                 "_kwargs")
+
     def __init__(self, postprocessor, service_name, method_name, source,
                  context, correlation_id, headers, kwargs):
         super(RCPCallProxy, self).__init__()
@@ -35,7 +43,7 @@ class RCPCallProxy(object):
         self._source = source
         self._context = context
         self._correlation_id = correlation_id
-        self._headers = copy.copy(headers) or {}
+        self._headers = headers or {}
         self._kwargs = kwargs
 
     def _make_request(self, context="", correlation_id="", reply_to="",
@@ -54,15 +62,12 @@ class RCPCallProxy(object):
 
         payload = self._kwargs
         dst = entry_point.Destination(self._service_name, self._method_name)
-        headers = {
-            "correlation_id": correlation_id,
-            "reply_to": str(reply_to),
-            "source": str(source),
-            "destination": str(dst)
-        }
-
-        request_headers = self._headers.copy()
-        request_headers.update(headers)
+        request_headers = dict(self._headers,
+                               correlation_id=correlation_id,
+                               reply_to=str(reply_to),
+                               source=str(source),
+                               destination=str(dst))
+        timings.stamp_request(request_headers)
         request = messages.Request(request_headers, context, payload)
         return request
 
@@ -108,10 +113,9 @@ class RPCMethodProxy(object):
         self._source = source
         self._context = context
         self._correlation_id = correlation_id
-        self._headers = copy.copy(headers)
+        self._headers = headers
 
     def __call__(self, **kwargs):
-        self._kwargs = kwargs
         return RCPCallProxy(self._postprocessor, self._service_name,
                             self._method_name, self._source, self._context,
                             self._correlation_id, self._headers, kwargs)
@@ -119,6 +123,11 @@ class RPCMethodProxy(object):
 
 class RPCServiceProxy(object):
 
+    """
+    Proxy of remote service. Method proxies are created once per method
+    name and share headers of service proxy
+    """
+
     def __init__(self, postprocessor, name, source, context=None,
                  correlation_id="", headers=None):
         self._postprocessor = postprocessor
@@ -126,13 +135,24 @@ class RPCServiceProxy(object):
         self._source = source
         self._context = context
         self._correlation_id = correlation_id
-        self._headers = copy.copy(headers)
+        self._headers = headers
+        self._methods = {}
 
-    def __getattr__(self, item):
+    def _create_method_proxy(self, item):
         return RPCMethodProxy(self._postprocessor, self._name, item,
                               self._source, self._context,
                               self._correlation_id, self._headers)
 
+    def __getattr__(self, item):
+        if item.startswith("__"):
+            raise AttributeError(item)
+        try:
+            return self._methods[item]
+        except KeyError:
+            method_proxy = self._create_method_proxy(item)
+            self._methods[item] = method_proxy
+            return method_proxy
+
 
 class RPCProxy(object):
 
@@ -166,3 +186,122 @@ class RPCProxy(object):
         publication = messages.Notification(notification_headers,
                                             self._context, kwargs)
         self._postprocessor.process(publication)
+
+
+class BlockingCallProxy(RCPCallProxy):
+
+    """
+    Proxy class for method call that waits for response in reply queue of
+    client
+    """
+
+    __slots__ = ("_consumer", "_timeout")
+
+    def __init__(self, postprocessor, service_name, method_name, source,
+                 context, correlation_id, headers, kwargs, consumer,
+                 timeout=None):
+        super(BlockingCallProxy, self).__init__(
+            postprocessor, service_name, method_name, source, context,
+            correlation_id, headers, kwargs)
+        self._consumer = consumer
+        self._timeout = timeout
+
+    def call_async(self, correlation_id="", context="", source=""):
+        """
+        Sends request and returns future of its response
+
+        :return: future that is resolved with payload of response or
+            with RemoteError
+        :rtype: replies.ReplyFuture
+        """
+        request = self._make_request(context=context,
+                                     correlation_id=correlation_id,
+                                     source=source)
+        future = self._consumer.expect(request.request_id)
+        try:
+            self._postprocessor.process(request)
+        except Exception:
+            self._consumer.forget(request.request_id)
+            raise
+        return future
+
+    def call(self, correlation_id="", context="", source="", timeout=None):
+        """
+        Sends request and waits for response
+
+        :param timeout: time (secs) to wait for response, timeout of client
+            by default
+        :type timeout: float
+        :return: payload of response
+        :rtype: dict
+        :raises: RemoteError, ReplyTimeout
+        """
+        future = self.call_async(correlation_id=correlation_id,
+                                 context=context, source=source)
+        if timeout is None:
+            timeout = self._timeout
+        try:
+            return future.result(timeout)
+        except exceptions.ReplyTimeout:
+            self._consumer.forget(future.request_id)
+            raise
+
+
+class BlockingMethodProxy(RPCMethodProxy):
+
+    def __init__(self, postprocessor, service_name, method_name, source,
+                 consumer, timeout=None, context="", correlation_id="",
+                 headers=""):
+        super(BlockingMethodProxy, self).__init__(
+            postprocessor, service_name, method_name, source, context,
+            correlation_id, headers)
+        self._consumer = consumer
+        self._timeout = timeout
+
+    def __call__(self, **kwargs):
+        return BlockingCallProxy(self._postprocessor, self._service_name,
+                                 self._method_name, self._source,
+                                 self._context, self._correlation_id,
+                                 self._headers, kwargs, self._consumer,
+                                 self._timeout)
+
+
+class BlockingServiceProxy(RPCServiceProxy):
+
+    def __init__(self, postprocessor, name, source, consumer, timeout=None,
+                 context=None, correlation_id="", headers=None):
+        super(BlockingServiceProxy, self).__init__(
+            postprocessor, name, source, context, correlation_id, headers)
+        self._consumer = consumer
+        self._timeout = timeout
+
+    def _create_method_proxy(self, item):
+        return BlockingMethodProxy(self._postprocessor, self._name, item,
+                                   self._source, self._consumer,
+                                   self._timeout, self._context,
+                                   self._correlation_id, self._headers)
+
+
+class BlockingRPCProxy(RPCProxy):
+
+    """
+    Proxy that makes calls with reply queue of consumer, so responses could
+    be waited for
+    """
+
+    def __init__(self, postprocessor, source, consumer, timeout=None,
+                 context=None, correlation_id="", headers=None):
+        super(BlockingRPCProxy, self).__init__(
+            postprocessor, source, context, correlation_id, headers)
+        self._consumer = consumer
+        self._timeout = timeout
+
+    def __getattr__(self, item):
+        disc = self._get_discovery_service()
+        disc.get_remote(item)
+        headers = self._headers.copy()
+        headers[messages.REPLY_QUEUE_HEADER] = self._consumer.queue_name
+        return BlockingServiceProxy(self._postprocessor, item, self._source,
+                                    self._consumer, self._timeout,
+                                    self._context, self._correlation_id,
+                                    headers)
@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# Copyright (c) 2015 Sergey Bunatyan <sergey.bunatyan@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+
+import controller
+import exceptions
+import instrumentation
+import messages
+import steps
+import timings
+import utils
+
+
+class ReplyFuture(object):
+
+    """
+    Result of request sent by blocking client. Is resolved by reply
+    consumer thread with payload of response or with RemoteError
+    """
+
+    def __init__(self, request_id):
+        super(ReplyFuture, self).__init__()
+        self.log = logging.getLogger(__name__)
+        self._request_id = request_id
+        self._event = threading.Event()
+        self._result = None
+        self._exception = None
+        self._timings = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def request_id(self):
+        return self._request_id
+
+    @property
+    def timings(self):
+        """
+        Latency decomposition of request, None until reply is received
+
+        :rtype: timings.Timings
+        """
+        return self._timings
+
+    def done(self):
+        return self._event.is_set()
+
+    def _resolve(self, result, exception):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._result = result
+            self._exception = exception
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                self.log.exception(e)
+
+    def set_result(self, result):
+        self._resolve(result, None)
+
+    def set_exception(self, exception):
+        self._resolve(None, exception)
+
+    def add_done_callback(self, callback):
+        """
+        Adds callback that is called with future when it is resolved.
+        Callback is called in reply consumer thread
+
+        :param callback: callable with one argument
+        :type callback: callable
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def exception(self, timeout=None):
+        """
+        Waits for reply and returns remote error or None
+
+        :param timeout: time (secs) to wait, None means infinite
+        :type timeout: float
+        :raises: ReplyTimeout
+        """
+        if not self._event.wait(timeout):
+            raise exceptions.ReplyTimeout(request_id=self._request_id,
+                                          timeout=timeout)
+        return self._exception
+
+    def result(self, timeout=None):
+        """
+        Waits for reply and returns payload of response
+
+        :param timeout: time (secs) to wait, None means infinite
+        :type timeout: float
+        :return: payload of response
+        :rtype: dict
+        :raises: RemoteError, ReplyTimeout
+        """
+        exception = self.exception(timeout)
+        if exception is not None:
+            raise exception
+        return self._result
+
+    def as_asyncio(self, loop=None):
+        """
+        Returns asyncio future (trollius future on Python 2) that is
+        resolved in event loop thread when reply is received
+
+        :param loop: event loop, current loop by default
+        :rtype: asyncio.Future
+        """
+        if utils.asyncio is None:
+            raise exceptions.AsyncioIsNotAvailable()
+        loop = loop or utils.asyncio.get_event_loop()
+        future = utils.asyncio.Future(loop=loop)
+
+        def copy_state(reply):
+            if future.cancelled():
+                return
+            if reply._exception is not None:
+                future.set_exception(reply._exception)
+            else:
+                future.set_result(reply._result)
+
+        self.add_done_callback(
+            lambda reply: loop.call_soon_threadsafe(copy_state, reply))
+        return future
+
+
+class ReplyConsumer(controller.AbstractController):
+
+    """
+    Consumes responses and errors from exclusive auto-delete reply queue
+    of client in background thread and resolves futures of requests by
+    request_id. One consumer serves any number of concurrent requests.
+    Replies that nobody waits for (e.g. received after timeout) are
+    dropped.
+    """
+
+    def __init__(self, driver, queue_name):
+        super(ReplyConsumer, self).__init__()
+        self.log = logging.getLogger(__name__)
+        self._queue_name = queue_name
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._steps = [
+            steps.ValidateMessageMiddleware(),
+            steps.DecompressMessageMiddleware(),
+            # raw body is logged, before it is decoded by handler
+            steps.LogIncomingAMQPMessageMiddleware(),
+            steps.CreateMessageMiddleware()
+        ]
+        self._reader = driver.create_reply_reader(queue_name, self)
+        self._thread = None
+
+    @property
+    def queue_name(self):
+        return self._queue_name
+
+    @property
+    def pending_count(self):
+        return len(self._futures)
+
+    def start(self):
+        """
+        Declares reply queue and starts consumer thread. Queue is declared
+        before return, so replies to requests sent after start are not lost
+        """
+        if self._thread:
+            return
+        self._reader.connect()
+        self._thread = threading.Thread(target=self._reader.run,
+                                        name="tavrida-replies")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops consumer thread. Requests that wait for replies fail with
+        ReplyConsumerIsStopped
+        """
+        if self._thread:
+            self._reader.request_stop()
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            futures, self._futures = self._futures, {}
+        for future in futures.values():
+            future.set_exception(exceptions.ReplyConsumerIsStopped(
+                queue=self._queue_name))
+
+    def expect(self, request_id):
+        """
+        Registers request that waits for reply
+
+        :param request_id: request_id of sent request
+        :type request_id: string
+        :rtype: ReplyFuture
+        """
+        future = ReplyFuture(request_id)
+        with self._lock:
+            self._futures[request_id] = future
+        return future
+
+    def forget(self, request_id):
+        """
+        Stops waiting for reply (e.g. after timeout)
+
+        :param request_id: request_id of sent request
+        :type request_id: string
+        """
+        with self._lock:
+            self._futures.pop(request_id, None)
+
+    @staticmethod
+    def _get_remote_error(error):
+        payload = error.payload
+        return exceptions.RemoteError(error_class=payload.get("class"),
+                                      message=payload.get("message"),
+                                      code=payload.get("code"))
+
+    def process(self, amqp_message):
+        """
+        Resolves future of request the reply belongs to
+
+        :param amqp_message: reply
+        :type amqp_message: messages.AMQPMessage
+        """
+        instrumentation.observe(instrumentation.PROCESSING, amqp_message,
+                                self._process, (amqp_message,))
+
+    def _process(self, amqp_message):
+        message = instrumentation.run_steps(self._steps, amqp_message)
+        with self._lock:
+            future = self._futures.pop(message.request_id, None)
+        if future is None:
+            self.log.warning("Nobody waits for reply to request %s",
+                             message.request_id)
+            return
+        future._timings = timings.get_timings(message.headers)
+        if isinstance(message, messages.IncomingError):
+            future.set_exception(self._get_remote_error(message))
+        elif isinstance(message, messages.IncomingResponse):
+            future.set_result(message.payload)
+        else:
+            future.set_exception(exceptions.IncorrectMessage(
+                message=message))
@@ -16,6 +16,7 @@
 
 import controller
 import exceptions
+import instrumentation
 import messages
 
 import utils
@@ -39,9 +40,21 @@ class Router(utils.Singleton, controller.AbstractController):
         :type service_cls: service.ServiceController
         :return:
         """
-        ep_maps = set(tuple(ep_map.items()[0]) for ep_map in self._services)
-        if not (service_name, service_cls) in ep_maps:
-            self._services.append({service_name: service_cls})
+        ep_map = {service_name: service_cls}
+        if ep_map not in self._services:
+            self._services.append(ep_map)
+
+    def compile(self, service_list):
+        """
+        Builds routing index for registered service classes and their
+        instances
+
+        :param service_list: list of services.ServiceController objects
+        :type service_list: list
+        :return: frozen routing index
+        :rtype: RoutingTable
+        """
+        return RoutingTable(self._services, service_list)
 
     def _check_if_request_suits(self, message, rpc_mapping):
         return message.destination.service in rpc_mapping
@@ -131,9 +144,12 @@ class Router(utils.Singleton, controller.AbstractController):
         return service_cls.get_dispatcher().process(message, service)
 
     def _process_subscription(self, message, service_classes, service_list):
+        results = []
         for service_cls in service_classes:
             service = self._get_service(service_cls, service_list)
-            service_cls.get_dispatcher().process(message, service)
+            results.append(service_cls.get_dispatcher().process(message,
+                                                                service))
+        return utils.gather_awaitables(results)
 
     def process(self, message, service_list):
         """
@@ -144,11 +160,132 @@ class Router(utils.Singleton, controller.AbstractController):
         :type message: message.Message
         :param service_list: list of services.ServiceController objects
         :type service_list: list
-        :return: messages.Message, dict, None
+        :return: messages.Message, dict, None or future if handlers are
+            coroutines
         """
         if isinstance(message, messages.IncomingNotification):
-            service_classes = self.get_subscription_cls(message)
-            self._process_subscription(message, service_classes, service_list)
+            service_classes = instrumentation.observe(
+                instrumentation.ROUTING, message, self.get_subscription_cls,
+                (message,))
+            return self._process_subscription(message, service_classes,
+                                              service_list)
         else:
-            service_cls = self.get_rpc_service_cls(message)
+            service_cls = instrumentation.observe(
+                instrumentation.ROUTING, message, self.get_rpc_service_cls,
+                (message,))
             return self._process_rpc(message, service_cls, service_list)
+
+
+class RoutingTable(controller.AbstractController):
+
+    """
+    Frozen routing index built by Router.compile when services are
+    instantiated. Maps message kind and service names to service instance
+    and its dispatcher, so routing of a message takes a couple of dict
+    lookups. Services registered after compilation are not routed.
+    If service name is registered by several classes (e.g. by the service
+    itself and by its caller that handles responses), requests are routed
+    to the class that has request handlers of the service.
+    """
+
+    def __init__(self, services, service_list):
+        super(RoutingTable, self).__init__()
+        instances = {}
+        # the first instance of a class wins as in Router._get_service
+        for service in reversed(service_list):
+            instances[type(service)] = service
+        self._by_service = {}
+        self._by_response = {}
+        for rpc_mapping in services:
+            for service_name, service_cls in rpc_mapping.iteritems():
+                route = (service_cls, instances.get(service_cls),
+                         service_cls.get_dispatcher())
+                self._by_service.setdefault(service_name, []).append(route)
+                key = (service_name, service_cls.service_name)
+                self._by_response.setdefault(key, []).append(route)
+        self._by_request = {}
+        for service_name, routes in self._by_service.iteritems():
+            self._by_request[service_name] = self._get_request_routes(
+                service_name, routes)
+
+    @staticmethod
+    def _get_request_routes(service_name, routes):
+        if len(routes) < 2:
+            return routes
+        providers = [route for route in routes
+                     if service_name in
+                     set(route[2].get_request_entry_services())]
+        return providers if len(providers) == 1 else routes
+
+    @staticmethod
+    def _get_single_route(routes, ep):
+        if not routes:
+            raise exceptions.ServiceNotFound(entry_point=str(ep))
+        if len(routes) > 1:
+            raise exceptions.DuplicatedServiceRegistration(service=ep.service)
+        return routes[0]
+
+    def _route(self, message):
+        """
+        Returns routes of message: all subscribed services for notification,
+        the only service for other messages
+
+        :rtype: list
+        :raises: ServiceNotFound, DuplicatedServiceRegistration
+        """
+        if isinstance(message, messages.IncomingNotification):
+            return self._by_service.get(message.source.service, ())
+        if isinstance(message, (messages.IncomingError,
+                                messages.IncomingResponse)):
+            ep = message.source
+            routes = self._by_response.get(
+                (ep.service, message.destination.service))
+        else:
+            ep = message.destination
+            routes = self._by_request.get(ep.service)
+        return (self._get_single_route(routes, ep),)
+
+    @staticmethod
+    def _dispatch(route, message):
+        service_cls, service, disp = route
+        if service is None:
+            raise exceptions.UnknownService(service=str(service_cls))
+        return disp.process(message, service)
+
+    def process(self, message, service_list=None):
+        """
+        Processes message for the service bound to its entry point
+
+        :param message: incoming message
+        :type message: message.Message
+        :param service_list: is not used, services are bound on compilation.
+            Is accepted for compatibility with Router
+        :type service_list: list
+        :return: messages.Message, dict, None or future if handlers are
+            coroutines
+        """
+        routes = instrumentation.observe(instrumentation.ROUTING, message,
+                                         self._route, (message,))
+        if isinstance(message, messages.IncomingNotification):
+            return utils.gather_awaitables(
+                [self._dispatch(route, message) for route in routes])
+        return self._dispatch(routes[0], message)
+
+    def is_local(self, message):
+        """
+        Checks if outgoing request, response or error is addressed to service
+        instantiated in this server. Notifications are never local, because
+        they could have remote subscribers
+
+        :param message: outgoing message
+        :type message: messages.Message
+        :rtype: bool
+        """
+        if message.message_type == "request":
+            routes = self._by_request.get(message.destination.service)
+        elif message.message_type in ("response", "error"):
+            routes = self._by_response.get((message.source.service,
+                                            message.destination.service))
+        else:
+            return False
+        return bool(routes) and len(routes) == 1 and routes[0][1] is not None
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# Copyright (c) 2015 Sergey Bunatyan <sergey.bunatyan@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import abc
+
+import anyjson
+
+import exceptions
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class AbstractCodec(object):
+
+    """
+    Encodes message body to bytes and decodes it back.
+    Content type of codec is sent in AMQP content_type property, so
+    consumer picks the matching decoder
+    """
+
+    __metaclass__ = abc.ABCMeta
+
+    name = None
+    content_type = None
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    @abc.abstractmethod
+    def encode(self, body):
+        pass
+
+    @abc.abstractmethod
+    def decode(self, data):
+        pass
+
+
+class JSONCodec(AbstractCodec):
+
+    """
+    JSON via anyjson. Messages without content type are decoded by this
+    codec
+    """
+
+    name = "json"
+    content_type = "application/json"
+
+    def encode(self, body):
+        return anyjson.serialize(body)
+
+    def decode(self, data):
+        return anyjson.deserialize(data)
+
+
+class FastJSONCodec(JSONCodec):
+
+    """
+    JSON via ujson. Output is plain JSON, so it is compatible with consumers
+    that use JSONCodec. Only encoding is done by ujson by default: it
+    rejects some valid JSON (e.g. integers above 2**64), so incoming JSON is
+    decoded by JSONCodec unless CodecRegistry.set_decoder("fastjson") is
+    called
+    """
+
+    name = "fastjson"
+
+    @classmethod
+    def is_available(cls):
+        return ujson is not None
+
+    def encode(self, body):
+        return ujson.dumps(body)
+
+    def decode(self, data):
+        return ujson.loads(data)
+
+
+class MsgPackCodec(AbstractCodec):
+
+    """
+    Binary MessagePack codec
+    """
+
+    name = "msgpack"
+    content_type = "application/x-msgpack"
+
+    @classmethod
+    def is_available(cls):
+        return msgpack is not None
+
+    def encode(self, body):
+        return msgpack.packb(body, use_bin_type=True)
+
+    def decode(self, data):
+        return msgpack.unpackb(data, raw=False)
+
+
+class CodecRegistry(object):
+
+    """
+    Registry of available codecs by name and by content type.
+    The first registered codec of content type is used to decode it,
+    codecs registered later only add encoders
+    """
+
+    def __init__(self):
+        super(CodecRegistry, self).__init__()
+        self._by_name = {}
+        self._by_content_type = {}
+
+    def register(self, codec_cls):
+        """
+        Registers codec if its library is installed
+
+        :param codec_cls: codec class
+        :type codec_cls: AbstractCodec
+        :return: True if codec is registered
+        :rtype: bool
+        """
+        if not codec_cls.is_available():
+            return False
+        codec = codec_cls()
+        self._by_name[codec.name] = codec
+        self._by_content_type.setdefault(codec.content_type, codec)
+        return True
+
+    def set_decoder(self, name):
+        """
+        Makes registered codec the decoder of its content type
+
+        :param name: codec name
+        :type name: string
+        :raises: CodecIsNotAvailable
+        """
+        codec = self.get_codec(name)
+        self._by_content_type[codec.content_type] = codec
+
+    def get_codec(self, name):
+        """
+        Returns codec by name
+
+        :param name: codec name ('json', 'fastjson', 'msgpack')
+        :type name: string
+        :rtype: AbstractCodec
+        :raises: CodecIsNotAvailable
+        """
+        try:
+            return self._by_name[name]
+        except KeyError:
+            raise exceptions.CodecIsNotAvailable(codec=name)
+
+    def get_decoder(self, content_type):
+        """
+        Returns codec for content type. Messages without content type are
+        JSON encoded
+
+        :param content_type: AMQP content_type property
+        :type content_type: string
+        :rtype: AbstractCodec
+        :raises: UnknownContentType
+        """
+        try:
+            return self._by_content_type[content_type or
+                                         JSONCodec.content_type]
+        except KeyError:
+            raise exceptions.UnknownContentType(content_type=content_type)
+
+
+registry = CodecRegistry()
+for codec_cls in (JSONCodec, FastJSONCodec, MsgPackCodec):
+    registry.register(codec_cls)
+
+
+def get_codec(name):
+    return registry.get_codec(name)
+
+
+def get_decoder(content_type):
+    return registry.get_decoder(content_type)
+
+
+def get_default_codec():
+    return registry.get_codec(JSONCodec.name)
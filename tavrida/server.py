@@ -16,6 +16,7 @@
 
 import abc
 import logging
+import signal
 import sys
 
 from amqp_driver import driver as amqp_driver
@@ -23,9 +24,17 @@ import config
 import configfile
 import discovery
 import exceptions
+import instrumentation
+import local_dispatch
+import message_logging
+import metrics
 import postprocessor
 import preprocessor
 import router
+import serialization
+import supervisor
+import topology
+import tracing
 
 
 class Server(object):
@@ -33,20 +42,44 @@ class Server(object):
     """
     Server start multiple services.
     Before start it creates all AMQP structures for each service
-    (queue, exchanges, bindings) in RabbitMQ
+    (queue, exchanges, bindings) in RabbitMQ.
+    If workers number is positive, server forks worker processes that
+    consume the same queue (RabbitMQ distributes messages between them).
+    If topology_cache file path is given, declaration is skipped when
+    structures are not changed since the previous start.
+    If metrics are enabled, server collects metrics of processed messages.
+    If metrics_port is given, they are served at /metrics in Prometheus
+    text format, worker N listens on metrics_port + N.
+    If trace_file is given, spans of sampled messages are appended to it.
+    If message_log is given, sampled messages are logged by it in background
+    instead of debug logging
     """
 
     __metaclass__ = abc.ABCMeta
 
-    def __init__(self, config, queue_name, exchange_name, service_list):
+    def __init__(self, config, queue_name, exchange_name, service_list,
+                 workers=0, topology_cache=None, metrics=False,
+                 metrics_port=None, metrics_host="127.0.0.1",
+                 trace_file=None, trace_sample_rate=1.0, message_log=None):
         super(Server, self).__init__()
         self.log = logging.getLogger(__name__)
         self._config = config
+        self._workers = workers
+        self._topology_cache = topology_cache
         self._service_list = (service_list if isinstance(service_list, list)
                               else [service_list])
         self._queue_name = queue_name
         self._exchange_name = exchange_name
         self._services = []
+        self._local_dispatcher = None
+        self._metrics_enabled = metrics or metrics_port is not None
+        self._metrics_port = metrics_port
+        self._metrics_host = metrics_host
+        self._metrics = None
+        self._metrics_observer = None
+        self._trace_file = trace_file
+        self._trace_sample_rate = trace_sample_rate
+        self._message_log = message_log
         self._driver = self._get_driver()
 
     @property
@@ -57,47 +90,86 @@ class Server(object):
     def exchange_name(self):
         return self._exchange_name
 
+    @property
+    def metrics(self):
+        """
+        Metrics of messages processed by the current process, None if
+        metrics are disabled or server is not started
+
+        :rtype: metrics.MetricsRegistry
+        """
+        return self._metrics
+
     def _get_router(self):
         return router.Router()
 
-    def _create_subscription_binding(self, service_cls):
-        driver = self._driver
+    @staticmethod
+    def _get_binding_key(routing_key):
+        return routing_key + ".#"
+
+    def _plan_subscription_bindings(self, plan, service_cls):
         disc = service_cls.get_discovery()
         disp = service_cls.get_dispatcher()
 
         publishers = disp.get_publishers()
         for publisher in publishers:
             exchange_name = disc.get_remote_publisher(publisher.service)
-            driver.bind_queue(self._queue_name,
-                              exchange_name, publisher.to_routing_key())
+            plan.add_binding(self._queue_name, exchange_name,
+                             self._get_binding_key(
+                                 publisher.to_routing_key()))
 
-    def _create_notification_exchanges(self, service_cls):
+    def _plan_notification_exchanges(self, plan, service_cls):
         disc = service_cls.get_discovery()
-        disc.get_all_exchanges()
-        driver = self._driver
         for exc_type, exchange_names in disc.get_all_exchanges().iteritems():
             for exchange_name in exchange_names:
-                driver.create_exchange(exchange_name)
+                plan.add_exchange(exchange_name)
 
-    def _create_service_structures(self, service_cls):
-        driver = self._driver
+    def _plan_service_structures(self, plan, service_cls):
         disp = service_cls.get_dispatcher()
 
         service_names = disp.get_request_entry_services()
         for service_name in service_names:
-            driver.bind_queue(self._queue_name,
-                              self._exchange_name, service_name)
-            if service_cls.get_dispatcher().subscriptions:
-                self._create_subscription_binding(service_cls)
+            plan.add_binding(self._queue_name, self._exchange_name,
+                             self._get_binding_key(service_name))
+        if disp.subscriptions:
+            self._plan_subscription_bindings(plan, service_cls)
 
-    def _create_amqp_structures(self):
-        driver = self._driver
-        driver.create_exchange(self._exchange_name)
-        driver.create_queue(self._queue_name)
+    def _plan_amqp_structures(self):
+        """
+        Computes all AMQP structures required by services
 
+        :return: de-duplicated exchanges, queues and bindings
+        :rtype: topology.Topology
+        """
+        plan = topology.Topology()
+        plan.add_exchange(self._exchange_name)
+        plan.add_queue(self._queue_name)
         for service_cls in self._service_list:
-            self._create_service_structures(service_cls)
-            self._create_notification_exchanges(service_cls)
+            # exchanges go first, so bindings to them don't fail
+            self._plan_notification_exchanges(plan, service_cls)
+            self._plan_service_structures(plan, service_cls)
+        return plan
+
+    def _get_topology_fingerprint(self, plan):
+        return plan.fingerprint(self._config.host, self._config.port,
+                                self._config.virtual_host)
+
+    def _create_amqp_structures(self):
+        plan = self._plan_amqp_structures()
+        cache = None
+        # in-process broker starts empty in every process, so its structures
+        # are always declared
+        if self._topology_cache and not self._config.memory_engine:
+            cache = topology.TopologyCache(self._topology_cache)
+            fingerprint = self._get_topology_fingerprint(plan)
+            if cache.contains(fingerprint):
+                self.log.info("AMQP structures are not changed since the "
+                              "last start, skipping declaration")
+                return
+        self.log.info("Declaring %s AMQP structures", len(plan))
+        self._driver.declare_topology(plan)
+        if cache:
+            cache.save(fingerprint)
 
     def _get_driver(self):
         if not self._config:
@@ -106,30 +178,143 @@ class Server(object):
         return driver
 
     def _get_preprocessor(self):
-        return preprocessor.PreProcessor(self._get_router(),
-                                         self._services)
+        # services are instantiated, so routing index could be frozen
+        routing_table = self._get_router().compile(self._services)
+        preproc = preprocessor.PreProcessor(routing_table, self._services)
+        if self._local_dispatcher:
+            return self._local_dispatcher.bind(routing_table, preproc)
+        return preproc
+
+    def _get_local_dispatcher(self):
+        if self._config.local_dispatch:
+            return local_dispatch.LocalDispatcher()
+        return None
+
+    def _get_codec(self):
+        return serialization.get_codec(self._config.serializer)
+
+    def _get_compression_threshold(self, service_cls):
+        if service_cls.compression_threshold is not None:
+            return service_cls.compression_threshold
+        return self._config.compression_threshold
 
     def _instantiate_services(self):
+        self._local_dispatcher = self._get_local_dispatcher()
         for s in self._service_list:
             self.log.info("Service %s", s.__name__)
-            postproc = postprocessor.PostProcessor(self._driver,
-                                                   s.get_discovery())
+            postproc = postprocessor.PostProcessor(
+                self._driver, s.get_discovery(), self._get_codec(),
+                self._config.get_compressor(),
+                self._get_compression_threshold(s),
+                self._local_dispatcher)
             self._services.append(s(postproc))
 
-    def run(self):
+    def _get_metrics_server(self, worker_number):
+        port = self._metrics_port
+        if port:
+            port += worker_number
+        return metrics.MetricsHTTPServer(self._metrics, port,
+                                         self._metrics_host)
+
+    def _start_metrics(self, worker_number=0):
+        """
+        Registers observer that collects metrics and starts HTTP server
+        that exports them
+
+        :param worker_number: number of worker process
+        :type worker_number: int
+        :return: HTTP server or None
+        :rtype: metrics.MetricsHTTPServer
+        """
+        if not self._metrics_enabled:
+            return None
+        self._metrics = metrics.MetricsRegistry()
+        self._metrics_observer = metrics.MetricsObserver(self._metrics)
+        instrumentation.register_observer(self._metrics_observer)
+        if self._metrics_port is None:
+            return None
+        metrics_server = self._get_metrics_server(worker_number)
+        metrics_server.start()
+        return metrics_server
+
+    def _start_tracing(self):
+        if not self._trace_file:
+            return None
+        self.log.info("Tracing %s of messages to %s",
+                      self._trace_sample_rate, self._trace_file)
+        return tracing.enable(self._trace_file, self._trace_sample_rate)
+
+    def _listen(self, worker_number=0):
+        metrics_server = self._start_metrics(worker_number)
+        tracer = self._start_tracing()
+        if self._message_log:
+            message_logging.enable(self._message_log)
+        self.log.info("Server is listening on %s: %s", self._config.host,
+                      self._config.port)
+        try:
+            self._driver.listen(queue=self._queue_name,
+                                preprocessor=self._get_preprocessor())
+        finally:
+            if self._message_log:
+                message_logging.disable()
+            if tracer:
+                tracing.disable(tracer)
+            self._stop_metrics(metrics_server)
+
+    def _stop_metrics(self, metrics_server):
+        if metrics_server:
+            metrics_server.stop()
+        if self._metrics_observer:
+            instrumentation.unregister_observer(self._metrics_observer)
+            self._metrics_observer = None
+
+    def _on_worker_signal(self, signum, frame):
+        self.log.info("Worker got signal %s, stopping", signum)
+        if self._driver.reader:
+            self._driver.stop_listening()
+        else:
+            sys.exit(0)
+
+    def _run_worker(self, number=0):
+        # supervisor propagates SIGTERM on Ctrl-C
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, self._on_worker_signal)
+        # connections can't be shared with parent process
+        self._driver = self._get_driver()
+        self.log.info("Instantiating services")
+        self._instantiate_services()
+        self._listen(number)
+
+    def _get_supervisor(self, workers):
+        return supervisor.Supervisor(self._run_worker, workers)
+
+    def run(self, workers=None):
         """
         Starts to listen RabbitMQ.
         Before listening instantiates service objects and creates AMQP
-        structures in RabbitMQ
+        structures in RabbitMQ.
+        If workers number is positive, AMQP structures are created once and
+        services are instantiated in each of worker processes. Crashed
+        workers are restarted, on SIGTERM workers finish handling of
+        received messages and exit.
+
+        :param workers: number of worker processes, overrides number passed
+            to constructor
+        :type workers: int
         """
+        workers = self._workers if workers is None else workers
+        if workers:
+            self.log.info("Creating AMQP structures on Server")
+            self._create_amqp_structures()
+            self.log.info("Starting %s workers", workers)
+            self._get_supervisor(workers).run()
+            return
+
         self.log.info("Instantiating services")
         self._instantiate_services()
         self.log.info("Creating AMQP structures on Server")
         self._create_amqp_structures()
-        self.log.info("Server is listening on %s: %s", self._config.host,
-                      self._config.port)
-        self._driver.listen(queue=self._queue_name,
-                            preprocessor=self._get_preprocessor())
+        self._listen()
 
 
 class CLIServer(Server):
@@ -174,9 +359,31 @@ class CLIServer(Server):
             locale=conf.connection.locale,
             backpressure_detection=conf.connection.backpressure_detection,
             reconnect_attempts=conf.connection.reconnect_attempts,
-            async_engine=conf.connection.async_engine
+            async_engine=conf.connection.async_engine,
+            asyncio_engine=conf.connection.asyncio_engine,
+            writer_pool_size=conf.connection.writer_pool_size,
+            publisher_confirms=conf.connection.publisher_confirms,
+            confirm_window=conf.connection.confirm_window,
+            handler_workers=conf.connection.handler_workers,
+            prefetch_count=conf.connection.prefetch_count,
+            serializer=conf.connection.serializer,
+            compression=conf.connection.compression,
+            compression_threshold=conf.connection.compression_threshold,
+            memory_engine=conf.connection.memory_engine,
+            memory_queue_size=conf.connection.memory_queue_size,
+            local_dispatch=conf.connection.local_dispatch,
+            background_heartbeats=conf.connection.background_heartbeats
         )
 
+        message_log = None
+        if conf.server.message_log:
+            message_log = message_logging.MessageLog(
+                sample_rates=dict(
+                    (entry_point, float(rate)) for entry_point, rate in
+                    (conf.server.message_log_sample_rates or {}).iteritems()),
+                default_rate=conf.server.message_log_sample_rate,
+                max_body_size=conf.server.message_log_max_body_size)
+
         service_list = configfile.get_services_classes()
         service_mapping = configfile.get_service_name_class_mapping()
         print configfile.get_services()
@@ -190,4 +397,12 @@ class CLIServer(Server):
             conn_conf,
             queue_name=conf.server.queue_name,
             exchange_name=conf.server.exchange_name,
-            service_list=service_list)
+            service_list=service_list,
+            workers=conf.server.workers,
+            topology_cache=conf.server.topology_cache,
+            metrics=conf.server.metrics,
+            metrics_port=conf.server.metrics_port,
+            metrics_host=conf.server.metrics_host,
+            trace_file=conf.server.trace_file,
+            trace_sample_rate=conf.server.trace_sample_rate,
+            message_log=message_log)
@@ -15,13 +15,16 @@
 # limitations under the License.
 
 import abc
-import copy
+import functools
 import logging
 
 import controller
 import dispatcher
 import exceptions
+import instrumentation
 import messages
+import timings
+import utils
 
 
 class ServiceController(controller.AbstractController):
@@ -38,12 +41,17 @@ class ServiceController(controller.AbstractController):
 
     _dispatcher = None
     _discovery = None
+    # minimal size (bytes) of outgoing message body to compress, overrides
+    # compression_threshold of config
+    compression_threshold = None
 
     def __init__(self, postprocessor):
         super(ServiceController, self).__init__()
         self.postprocessor = postprocessor
         self._incoming_middlewares = []
         self._outgoing_middlewares = []
+        # method name -> (bound handler, names of handler parameters)
+        self._handler_cache = {}
         self.log = logging.getLogger(__name__)
 
     @classmethod
@@ -94,15 +102,30 @@ class ServiceController(controller.AbstractController):
     def _send(self, message):
         return self.postprocessor.process(message)
 
+    def _get_handler(self, method_name):
+        """
+        Returns bound handler method and names of its payload parameters.
+        Both are resolved once per service instance
+
+        :param method_name: handler method name
+        :type method_name: string
+        :rtype: tuple
+        """
+        try:
+            return self._handler_cache[method_name]
+        except KeyError:
+            handler = getattr(self, method_name)
+            arg_names = tuple(getattr(handler, "_arg_names", ())[2:])
+            self._handler_cache[method_name] = (handler, arg_names)
+            return handler, arg_names
+
     def _filter_redundant_parameters(self, method_name, incoming_kwargs):
-        arg_names = getattr(self, method_name)._arg_names[2:]
-        incoming_params = incoming_kwargs.keys()
-        if set(arg_names) - set(incoming_params):
+        arg_names = self._get_handler(method_name)[1]
+        try:
+            return dict((name, incoming_kwargs[name]) for name in arg_names)
+        except KeyError:
             raise ValueError("Wrong incoming parameters (%s) for method '%s'"
                              % (str(incoming_kwargs), method_name))
-        else:
-            return dict((k, v) for (k, v) in incoming_kwargs.iteritems()
-                        if k in arg_names)
 
     def _handle_request(self, method, request, proxy):
         """
@@ -116,7 +139,40 @@ class ServiceController(controller.AbstractController):
         try:
             filtered_kwargs = self._filter_redundant_parameters(
                 method, request.payload)
-            result = getattr(self, method)(request, proxy, **filtered_kwargs)
+            handler = self._get_handler(method)[0]
+            timings.stamp(request.headers, timings.HANDLER_STARTED_AT)
+            try:
+                result = instrumentation.observe_awaitable(
+                    instrumentation.HANDLER, request, handler,
+                    (request, proxy), filtered_kwargs)
+            finally:
+                timings.stamp(request.headers, timings.HANDLER_FINISHED_AT)
+            if utils.is_awaitable(result):
+                return utils.chain_awaitable(
+                    result,
+                    functools.partial(self._handle_awaited_request, request))
+            if isinstance(request, messages.IncomingRequestCall):
+                return result
+        except Exception as e:
+            if isinstance(request, messages.IncomingRequestCall):
+                self.log.exception(e)
+                return messages.Error.create_by_request(request, exception=e)
+            else:
+                raise
+
+    def _handle_awaited_request(self, request, future):
+        """
+        Gets result of coroutine handler and handles exceptions
+
+        :param request: incoming request
+        :type request: IncomingRequestCall or IncomingRequestCast
+        :param future: done future of handler coroutine
+        :return: response or None
+        :rtype: messages.Response, messages.Error, None
+        """
+        timings.stamp(request.headers, timings.HANDLER_FINISHED_AT)
+        try:
+            result = future.result()
             if isinstance(request, messages.IncomingRequestCall):
                 return result
         except Exception as e:
@@ -130,18 +186,41 @@ class ServiceController(controller.AbstractController):
         """
         Handles Request message and sends back results of controller
         execution if there are any.
+        If handler is coroutine, returns future that is done when result is
+        sent.
 
         :param request: incoming request
         :type request: IncomingRequestCall or IncomingRequestCast
         """
         result = self._handle_request(method, request, proxy)
+        if utils.is_awaitable(result):
+            return utils.chain_awaitable(
+                result,
+                lambda future: self._send_result(request, future.result()))
+        self._send_result(request, result)
+
+    def _send_result(self, request, result):
+        """
+        Sends result of request handling
+
+        :param request: incoming request
+        :type request: IncomingRequestCall or IncomingRequestCast
+        :param result: result of handler
+        :type result: messages.Response, messages.Error, dict, None
+        """
         if result:
             if isinstance(result, (messages.Response, messages.Error)):
-                result = self._run_outgoing_middlewares(result)
+                timings.copy_handler_stamps(request.headers, result.headers)
+                result = instrumentation.observe(
+                    instrumentation.OUTGOING_MIDDLEWARES, result,
+                    self._run_outgoing_middlewares, (result,))
                 self._send(result)
             elif isinstance(result, dict):
                 message = request.make_response(**result)
-                message = self._run_outgoing_middlewares(message)
+                timings.copy_handler_stamps(request.headers, message.headers)
+                message = instrumentation.observe(
+                    instrumentation.OUTGOING_MIDDLEWARES, message,
+                    self._run_outgoing_middlewares, (message,))
                 self._send(message)
             else:
                 raise exceptions.WrongResponse(response=str(result))
@@ -150,22 +229,30 @@ class ServiceController(controller.AbstractController):
         """
         Handles incoming notification message
         """
-        getattr(self, method)(notification, proxy, **notification.payload)
+        handler = self._get_handler(method)[0]
+        return instrumentation.observe_awaitable(
+            instrumentation.HANDLER, notification, handler,
+            (notification, proxy), notification.payload)
 
     def _process_response(self, method, response, proxy):
         """
         Handles incoming response message
         """
-        getattr(self, method)(response, proxy, **response.payload)
+        handler = self._get_handler(method)[0]
+        return instrumentation.observe_awaitable(
+            instrumentation.HANDLER, response, handler, (response, proxy),
+            response.payload)
 
     def _process_error(self, method, error, proxy):
         """
         Handles incoming error message
         """
-        getattr(self, method)(error, proxy)
+        handler = self._get_handler(method)[0]
+        return instrumentation.observe_awaitable(
+            instrumentation.HANDLER, error, handler, (error, proxy))
 
     def _route_message_by_type(self, method, message, proxy):
-        message.update_context(copy.copy(message.payload))
+        message.update_context_by_payload()
         if isinstance(message, messages.IncomingRequest):
             return self._process_request(method, message, proxy)
         if isinstance(message, messages.IncomingResponse):
@@ -208,8 +295,11 @@ class ServiceController(controller.AbstractController):
         :type message: messages.Message
         :param proxy: proxy to make calls to remote services
         :type proxy: proxies.RPCProxy
+        :return: future if handler is coroutine, None otherwise
         """
 
-        continue_processing, res = self._run_incoming_middlewares(message)
+        continue_processing, res = instrumentation.observe(
+            instrumentation.INCOMING_MIDDLEWARES, message,
+            self._run_incoming_middlewares, (message,))
         if continue_processing:
-            self._route_message_by_type(method, res, proxy)
+            return self._route_message_by_type(method, res, proxy)
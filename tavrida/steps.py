@@ -15,7 +15,10 @@
 # limitations under the License.
 import logging
 
+import compression
 import controller
+import instrumentation
+import message_logging
 import messages
 
 
@@ -24,6 +27,8 @@ class ValidateMessageMiddleware(controller.AbstractController):
     Validates message headers
     """
 
+    stage = instrumentation.VALIDATION
+
     def process(self, ampq_message):
         ampq_message.validate()
         return ampq_message
@@ -34,6 +39,8 @@ class CreateMessageMiddleware(controller.AbstractController):
     Creates message from raw RabbitMQ message
     """
 
+    stage = instrumentation.DESERIALIZATION
+
     def process(self, message_body):
         return messages.IncomingMessageFactory().create(message_body)
 
@@ -43,39 +50,82 @@ class CreateAMQPMiddleware(controller.AbstractController):
     Creates intermediate AMQP message
     """
 
+    stage = instrumentation.SERIALIZATION
+
+    def __init__(self, codec=None):
+        super(CreateAMQPMiddleware, self).__init__()
+        self._codec = codec
+
+    def process(self, message):
+        return messages.AMQPMessage.create_from_message(message, self._codec)
+
+
+class CreateLocalAMQPMiddleware(controller.AbstractController):
+    """
+    Creates intermediate AMQP message for local dispatcher, body is not
+    serialized
+    """
+
+    stage = instrumentation.SERIALIZATION
+
     def process(self, message):
-        return messages.AMQPMessage.create_from_message(message)
+        return messages.LocalAMQPMessage.create_from_message(message)
+
+
+class CompressMessageMiddleware(controller.AbstractController):
+    """
+    Compresses body of AMQP message if it is not smaller than threshold
+    """
+
+    stage = instrumentation.COMPRESSION
+
+    def __init__(self, compressor, threshold):
+        super(CompressMessageMiddleware, self).__init__()
+        self._compressor = compressor
+        self._threshold = threshold
+
+    def process(self, amqp_message):
+        if (amqp_message.content_encoding is None and
+                len(amqp_message.body) >= self._threshold):
+            amqp_message.body = self._compressor.compress(amqp_message.body)
+            amqp_message.content_encoding = self._compressor.name
+        return amqp_message
+
+
+class DecompressMessageMiddleware(controller.AbstractController):
+    """
+    Decompresses body of AMQP message by its content encoding
+    """
+
+    stage = instrumentation.DECOMPRESSION
+
+    def process(self, amqp_message):
+        if amqp_message.content_encoding:
+            compressor = compression.get_compressor(
+                amqp_message.content_encoding)
+            amqp_message.body = compressor.decompress(amqp_message.body)
+            amqp_message.content_encoding = None
+        return amqp_message
 
 
 class LoggingMiddleware(controller.AbstractController):
     """Controller contains method to hide sensitive headers."""
 
-    SENSITIVE_HEADERS = ('authorization', 'proxy-authorization')
+    stage = instrumentation.LOGGING
+
+    SENSITIVE_HEADERS = message_logging.SENSITIVE_HEADERS
 
     def __init__(self):
         super(LoggingMiddleware, self).__init__()
         self._log = logging.getLogger(__name__)
 
     def _hide_sensitive_data(self, headers):
-        processed_headers = headers.copy()
-        old_keys = headers.keys()
-
-        # Turn keys to lower case
-        for k in old_keys:
-            processed_headers[k.lower()] = processed_headers.pop(k)
-
-        for sensitive in self.SENSITIVE_HEADERS:
-            if sensitive in processed_headers:
-                processed_headers[sensitive] = '<%s>' % sensitive
-
-        # Turn keys to original case
-        for k in old_keys:
-            processed_headers[k] = processed_headers.pop(k.lower())
-        return processed_headers
+        return message_logging.hide_sensitive_data(headers)
 
 
 class LogIncomingAMQPMessageMiddleware(LoggingMiddleware):
-    """Writes AMQP headers and body to log with level DEBUG.
+    """Writes AMQP headers and body to log with level DEBUG or to
+    message log of process if it is enabled.
 
     Hides values of SENSITIVE_HEADERS.
 
@@ -83,7 +133,10 @@ class LogIncomingAMQPMessageMiddleware(LoggingMiddleware):
     """
 
     def process(self, message):
-        if self._log.getEffectiveLevel() == logging.DEBUG:
+        log = message_logging.get_message_log()
+        if log is not None:
+            log.log_message(message_logging.INCOMING, message)
+        elif self._log.isEnabledFor(logging.DEBUG):
             headers = self._hide_sensitive_data(message.headers)
             self._log.debug(
                 "Incoming AMQP message with headers '%s' and body '%s'",
@@ -92,7 +145,8 @@ class LogIncomingAMQPMessageMiddleware(LoggingMiddleware):
 
 
 class LogOutgoingAMQPMessageMiddleware(LoggingMiddleware):
-    """Writes AMQP headers and body to log with level DEBUG.
+    """Writes AMQP headers and body to log with level DEBUG or to
+    message log of process if it is enabled.
 
     Hides values of SENSITIVE_HEADERS.
 
@@ -100,7 +154,10 @@ class LogOutgoingAMQPMessageMiddleware(LoggingMiddleware):
     """
 
     def process(self, message):
-        if self._log.getEffectiveLevel() == logging.DEBUG:
+        log = message_logging.get_message_log()
+        if log is not None:
+            log.log_message(message_logging.OUTGOING, message)
+        elif self._log.isEnabledFor(logging.DEBUG):
             headers = self._hide_sensitive_data(message.headers)
             self._log.debug(
                 "Outgoing AMQP message with headers '%s' and body '%s'",
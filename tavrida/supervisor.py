@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# Copyright (c) 2015 Sergey Bunatyan <sergey.bunatyan@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import multiprocessing
+import os
+import signal
+import time
+
+
+class Supervisor(object):
+
+    """
+    Runs target function in several worker processes. Target is called
+    with number of worker (from 0), restarted worker gets the same number.
+    Workers that exited with non-zero code (or were killed by signal) are
+    restarted, workers that exited with code 0 are not. Worker that crashes
+    again within max_restart_delay seconds after start is restarted with
+    exponential back-off from restart_delay up to max_restart_delay seconds,
+    after max_failures such crashes in a row it is not restarted anymore.
+    Supervisor exits when there are no workers left. On SIGTERM or SIGINT
+    supervisor sends SIGTERM to all workers and waits up to drain_timeout
+    seconds for them to finish processing of already received messages, the
+    rest of workers are killed.
+    """
+
+    CHECK_INTERVAL = 0.5
+
+    def __init__(self, target, workers, restart_delay=1.0, drain_timeout=30,
+                 max_restart_delay=60.0, max_failures=10):
+        super(Supervisor, self).__init__()
+        self.log = logging.getLogger(__name__)
+        self._target = target
+        self._workers_count = workers
+        self._restart_delay = restart_delay
+        self._max_restart_delay = max_restart_delay
+        self._max_failures = max_failures
+        self._drain_timeout = drain_timeout
+        self._workers = {}
+        self._started_at = {}
+        self._failures = {}
+        self._restart_at = {}
+        self._stopping = False
+
+    @property
+    def workers(self):
+        return dict(self._workers)
+
+    def _spawn(self, number):
+        process = multiprocessing.Process(target=self._target,
+                                          args=(number,),
+                                          name="tavrida-worker-%s" % number)
+        process.start()
+        self.log.info("Worker %s started (pid %s)", number, process.pid)
+        self._workers[number] = process
+        self._started_at[number] = time.time()
+        return process
+
+    def _on_signal(self, signum, frame):
+        self.log.info("Got signal %s, stopping workers", signum)
+        self._stopping = True
+
+    def _on_worker_exit(self, number, process):
+        """
+        Decides what to do with exited worker: schedules restart with
+        back-off or forgets the worker
+
+        :param number: worker number
+        :type number: int
+        :param process: exited worker process
+        :type process: multiprocessing.Process
+        """
+        if process.exitcode == 0:
+            self.log.info("Worker %s (pid %s) finished", number, process.pid)
+            del self._workers[number]
+            return
+        now = time.time()
+        if now - self._started_at[number] >= self._max_restart_delay:
+            failures = 1
+        else:
+            failures = self._failures.get(number, 0) + 1
+        self._failures[number] = failures
+        if failures > self._max_failures:
+            self.log.error("Worker %s (pid %s) exited with code %s, it "
+                           "crashed %s times in a row, giving up",
+                           number, process.pid, process.exitcode,
+                           failures)
+            del self._workers[number]
+            return
+        delay = min(self._restart_delay * 2 ** (failures - 1),
+                    self._max_restart_delay)
+        self.log.warning("Worker %s (pid %s) exited with code %s, "
+                         "restarting in %s seconds", number, process.pid,
+                         process.exitcode, delay)
+        self._restart_at[number] = now + delay
+
+    def _check_workers(self):
+        for number, process in self._workers.items():
+            if process.is_alive():
+                continue
+            if number not in self._restart_at:
+                self._on_worker_exit(number, process)
+            if (number in self._restart_at and
+                    time.time() >= self._restart_at[number]):
+                del self._restart_at[number]
+                self._spawn(number)
+
+    def _drain(self):
+        for process in self._workers.values():
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+        deadline = time.time() + self._drain_timeout
+        for process in self._workers.values():
+            process.join(max(deadline - time.time(), 0))
+        for number, process in self._workers.items():
+            if process.is_alive():
+                self.log.warning("Worker %s (pid %s) is not stopped in %s "
+                                 "seconds, killing", number, process.pid,
+                                 self._drain_timeout)
+                os.kill(process.pid, signal.SIGKILL)
+                process.join()
+
+    def run(self):
+        """
+        Starts workers and supervises them until SIGTERM or SIGINT
+        """
+        signal.signal(signal.SIGTERM, self._on_signal)
+        signal.signal(signal.SIGINT, self._on_signal)
+        for number in range(self._workers_count):
+            self._spawn(number)
+        while not self._stopping and self._workers:
+            self._check_workers()
+            time.sleep(self.CHECK_INTERVAL)
+        self._drain()
+        self.log.info("All workers are stopped")
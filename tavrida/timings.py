@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# Copyright (c) 2015 Sergey Bunatyan <sergey.bunatyan@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import threading
+import time
+
+import instrumentation
+
+# Headers with timestamps of message (microseconds since epoch, AMQP headers
+# don't support floats)
+SENT_AT = "sent_at"
+RECEIVED_AT = "received_at"
+HANDLER_STARTED_AT = "handler_started_at"
+HANDLER_FINISHED_AT = "handler_finished_at"
+# Timestamps of request that are returned in response or error
+REQUEST_SENT_AT = "request_sent_at"
+REQUEST_RECEIVED_AT = "request_received_at"
+
+# Timestamps that are inherited by nested requests from incoming headers and
+# must not be sent in them
+_REPLY_STAMPS = (RECEIVED_AT, HANDLER_STARTED_AT, HANDLER_FINISHED_AT,
+                 REQUEST_SENT_AT, REQUEST_RECEIVED_AT)
+
+MICROSECONDS = 1000000
+
+# Wall clock is used because timestamps are compared between hosts
+clock = time.time
+
+
+def now():
+    """
+    Returns current timestamp for header
+
+    :rtype: long
+    """
+    return long(clock() * MICROSECONDS)
+
+
+class Timings(collections.namedtuple("Timings", [
+        "correlation_id", "request_id", "queue_wait", "dispatch", "handler",
+        "return_trip", "total"])):
+
+    """
+    Latency decomposition of request (secs), None if timestamp is missing:
+
+    * queue_wait - from publication of request to its receipt by server
+      (broker backlog and network)
+    * dispatch - from receipt of request to handler start (waiting for
+      handler worker, deserialization, middlewares)
+    * handler - handler execution
+    * return_trip - from publication of response to its receipt
+    * total - from publication of request to receipt of response
+
+    Durations between timestamps of different hosts include clock skew
+    """
+
+    __slots__ = ()
+
+
+def stamp(headers, name):
+    """
+    Stores current time in header
+
+    :param headers: message headers, None is ignored
+    :type headers: dict
+    :param name: header name
+    :type name: string
+    """
+    if headers is not None:
+        headers[name] = now()
+
+
+def stamp_request(headers):
+    """
+    Stamps send time of request and removes timestamps inherited from
+    incoming message
+
+    :param headers: headers of outgoing request
+    :type headers: dict
+    """
+    for name in _REPLY_STAMPS:
+        headers.pop(name, None)
+    headers[SENT_AT] = now()
+
+
+def get_reply_stamps(request_headers):
+    """
+    Returns timestamps of request to send them back in response
+
+    :param request_headers: headers of incoming request
+    :type request_headers: dict
+    :rtype: dict
+    """
+    stamps = {SENT_AT: now()}
+    for request_name, reply_name in ((SENT_AT, REQUEST_SENT_AT),
+                                     (RECEIVED_AT, REQUEST_RECEIVED_AT)):
+        if request_name in request_headers:
+            stamps[reply_name] = request_headers[request_name]
+    return stamps
+
+
+def copy_handler_stamps(request_headers, reply_headers):
+    """
+    Copies handler timestamps of request to response or error
+
+    :param request_headers: headers of incoming request
+    :type request_headers: dict
+    :param reply_headers: headers of response or error
+    :type reply_headers: dict
+    """
+    for name in (HANDLER_STARTED_AT, HANDLER_FINISHED_AT):
+        if name in request_headers:
+            reply_headers[name] = request_headers[name]
+
+
+def _get_duration(headers, start, end):
+    started_at = headers.get(start)
+    finished_at = headers.get(end)
+    if started_at is None or finished_at is None:
+        return None
+    return float(finished_at - started_at) / MICROSECONDS
+
+
+def get_timings(headers):
+    """
+    Returns latency decomposition of request by headers of received
+    response or error
+
+    :param headers: headers of response or error
+    :type headers: dict
+    :rtype: Timings
+    """
+    return Timings(
+        correlation_id=headers.get("correlation_id"),
+        request_id=headers.get("request_id"),
+        queue_wait=_get_duration(headers, REQUEST_SENT_AT,
+                                 REQUEST_RECEIVED_AT),
+        dispatch=_get_duration(headers, REQUEST_RECEIVED_AT,
+                               HANDLER_STARTED_AT),
+        handler=_get_duration(headers, HANDLER_STARTED_AT,
+                              HANDLER_FINISHED_AT),
+        return_trip=_get_duration(headers, SENT_AT, RECEIVED_AT),
+        total=_get_duration(headers, REQUEST_SENT_AT, RECEIVED_AT))
+
+
+def get_queue_wait(headers):
+    """
+    Returns time (secs) message spent between publication and receipt
+
+    :param headers: headers of received message
+    :type headers: dict
+    :rtype: float
+    """
+    return _get_duration(headers, SENT_AT, RECEIVED_AT)
+
+
+class TimingsCollector(instrumentation.Observer):
+
+    """
+    Keeps latency decomposition of the last received responses and errors
+    by correlation_id
+    """
+
+    def __init__(self, capacity=1000):
+        super(TimingsCollector, self).__init__()
+        self._capacity = capacity
+        self._timings = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def on_stage_start(self, stage, message):
+        if stage != instrumentation.PROCESSING:
+            return
+        headers = message.headers
+        if headers.get("message_type") not in ("response", "error"):
+            return
+        timings = get_timings(headers)
+        with self._lock:
+            self._timings.pop(timings.correlation_id, None)
+            self._timings[timings.correlation_id] = timings
+            if len(self._timings) > self._capacity:
+                self._timings.popitem(last=False)
+
+    def get(self, correlation_id):
+        """
+        Returns timings of the last reply with correlation_id
+
+        :param correlation_id: correlation_id of request
+        :type correlation_id: string
+        :rtype: Timings
+        """
+        return self._timings.get(correlation_id)
+
+    def get_all(self):
+        """
+        Returns timings of the last replies from old to new
+
+        :rtype: list of Timings
+        """
+        with self._lock:
+            return self._timings.values()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# Copyright (c) 2015 Sergey Bunatyan <sergey.bunatyan@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import logging
+import os
+
+
+class Topology(object):
+
+    """
+    Set of AMQP structures (exchanges, queues, bindings) that should exist
+    in RabbitMQ. Duplicates are ignored, order of addition is kept.
+    """
+
+    def __init__(self):
+        super(Topology, self).__init__()
+        self._exchanges = []
+        self._queues = []
+        self._bindings = []
+        self._known = set()
+
+    @property
+    def exchanges(self):
+        """
+        :return: list of (exchange_name, exchange_type)
+        """
+        return list(self._exchanges)
+
+    @property
+    def queues(self):
+        return list(self._queues)
+
+    @property
+    def bindings(self):
+        """
+        :return: list of (queue_name, exchange_name, routing_key)
+        """
+        return list(self._bindings)
+
+    def _add(self, registry, item):
+        key = (id(registry), item)
+        if key not in self._known:
+            self._known.add(key)
+            registry.append(item)
+
+    def add_exchange(self, exchange_name, ex_type="topic"):
+        self._add(self._exchanges, (exchange_name, ex_type))
+
+    def add_queue(self, queue_name):
+        self._add(self._queues, queue_name)
+
+    def add_binding(self, queue_name, exchange_name, routing_key):
+        self._add(self._bindings, (queue_name, exchange_name, routing_key))
+
+    def __len__(self):
+        return len(self._exchanges) + len(self._queues) + len(self._bindings)
+
+    def fingerprint(self, *salt):
+        """
+        Returns digest that doesn't depend on order of addition
+
+        :param salt: additional values (e.g. broker address) that
+            distinguish topologies
+        :return: hex digest
+        :rtype: str
+        """
+        data = repr((sorted(self._exchanges), sorted(self._queues),
+                     sorted(self._bindings), salt))
+        return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+class TopologyCache(object):
+
+    """
+    Stores fingerprint of the last declared topology in a file, so server
+    could skip declaration if nothing changed since previous start.
+    Structures deleted from RabbitMQ manually are not restored until cache
+    file is removed.
+    """
+
+    def __init__(self, path):
+        super(TopologyCache, self).__init__()
+        self.log = logging.getLogger(__name__)
+        self._path = path
+
+    @property
+    def path(self):
+        return self._path
+
+    def contains(self, fingerprint):
+        if not os.path.exists(self._path):
+            return False
+        try:
+            with open(self._path) as f:
+                return f.read().strip() == fingerprint
+        except IOError as e:
+            self.log.warning("Can't read topology cache %s: %s",
+                             self._path, e)
+            return False
+
+    def save(self, fingerprint):
+        try:
+            with open(self._path, "w") as f:
+                f.write(fingerprint)
+        except IOError as e:
+            self.log.warning("Can't write topology cache %s: %s",
+                             self._path, e)
+
+    def clear(self):
+        if os.path.exists(self._path):
+            os.remove(self._path)
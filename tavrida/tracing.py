@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+# Copyright (c) 2015 Sergey Bunatyan <sergey.bunatyan@gmail.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import binascii
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+import zlib
+
+import instrumentation
+import metrics
+import utils
+
+# Header with id of span that published message, it is parent of receive
+# span of message
+SPAN_ID_HEADER = "span_id"
+
+SEND = "send"
+RECEIVE = "receive"
+HANDLE = "handle"
+
+_STAGE_KINDS = {
+    instrumentation.PUBLISH: SEND,
+    instrumentation.PROCESSING: RECEIVE,
+    instrumentation.HANDLER: HANDLE,
+}
+
+
+def new_span_id():
+    return binascii.hexlify(os.urandom(8))
+
+
+class Span(object):
+
+    """
+    Timed operation of message processing. Spans of one call chain have the
+    same trace_id (correlation_id of messages)
+    """
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "kind", "name",
+                 "started_at", "duration", "error", "tags")
+
+    def __init__(self, trace_id, span_id, parent_id, kind, name, tags):
+        super(Span, self).__init__()
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.kind = kind
+        self.name = name
+        self.started_at = time.time()
+        self.duration = None
+        self.error = None
+        self.tags = tags
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "kind": self.kind,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration": self.duration,
+            "error": self.error,
+            "tags": self.tags
+        }
+
+
+class SpanExporter(object):
+
+    """
+    Base class of span sinks. Spans are exported in the thread that
+    processes message, exceptions are logged and ignored
+    """
+
+    def export(self, span):
+        """
+        Exports finished span
+
+        :param span: span
+        :type span: Span
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class FileExporter(SpanExporter):
+
+    """
+    Appends spans to file as newline-delimited JSON. Lines are written
+    with O_APPEND, so several processes could share the file
+    """
+
+    def __init__(self, path):
+        super(FileExporter, self).__init__()
+        self._path = path
+        self._file = open(path, "a", 1)
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        return self._path
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), sort_keys=True) + "\n"
+        with self._lock:
+            self._file.write(line)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class Sampler(object):
+
+    """
+    Samples traces by hash of trace_id, so every process with the same rate
+    makes the same decision and call chain is traced completely or not
+    traced at all
+    """
+
+    def __init__(self, rate=1.0):
+        super(Sampler, self).__init__()
+        self._rate = rate
+        self._threshold = int(rate * 0x100000000)
+
+    @property
+    def rate(self):
+        return self._rate
+
+    def is_sampled(self, trace_id):
+        if self._rate >= 1:
+            return True
+        if self._rate <= 0:
+            return False
+        return zlib.crc32(trace_id or "") & 0xffffffff < self._threshold
+
+
+class Tracer(instrumentation.Observer):
+
+    """
+    Records spans of sampled messages: send (publication), receive
+    (processing of received message) and handle (handler call).
+    Receive span is a child of send span of the message (linked by
+    span_id header), spans started while another span of the thread is
+    active are its children. Messages published in batches have no send
+    spans.
+    Spans of coroutine handlers stay open until coroutine is done, spans
+    started by its task are their children
+    """
+
+    def __init__(self, exporter, sampler=None):
+        super(Tracer, self).__init__()
+        self.log = logging.getLogger(__name__)
+        self._exporter = exporter
+        self._sampler = sampler or Sampler()
+        self._local = threading.local()
+        # spans of suspended stages by (stage, id of message) and by task
+        self._suspended = {}
+        self._task_spans = weakref.WeakKeyDictionary()
+
+    @property
+    def exporter(self):
+        return self._exporter
+
+    def _get_stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def get_current_span(self):
+        """
+        Returns span that is active in the current thread
+
+        :rtype: Span
+        """
+        stack = self._get_stack()
+        for span in reversed(stack):
+            if span is not None:
+                return span
+        if self._task_spans:
+            task = utils.get_current_task()
+            if task is not None:
+                return self._task_spans.get(task)
+        return None
+
+    @staticmethod
+    def _get_tags(headers):
+        return {
+            "message_type": headers.get("message_type"),
+            "source": headers.get("source"),
+            "destination": headers.get("destination"),
+            "request_id": headers.get("request_id"),
+            "pid": os.getpid()
+        }
+
+    def _start_span(self, kind, message):
+        headers = message.headers
+        trace_id = headers.get("correlation_id")
+        if not self._sampler.is_sampled(trace_id):
+            return None
+        parent = self.get_current_span()
+        parent_id = parent.span_id if parent else None
+        if kind == RECEIVE:
+            parent_id = headers.get(SPAN_ID_HEADER) or parent_id
+        span = Span(trace_id, new_span_id(), parent_id, kind,
+                    metrics.get_entry_point(headers),
+                    self._get_tags(headers))
+        if kind == SEND:
+            headers[SPAN_ID_HEADER] = span.span_id
+        return span
+
+    def on_stage_start(self, stage, message):
+        kind = _STAGE_KINDS.get(stage)
+        if kind is None or message is None:
+            return
+        try:
+            span = self._start_span(kind, message)
+        except Exception as e:
+            self.log.exception(e)
+            span = None
+        self._get_stack().append(span)
+
+    def on_stage_suspend(self, stage, message, future):
+        if stage not in _STAGE_KINDS:
+            return
+        stack = self._get_stack()
+        # stack is empty if tracer was registered while stage was running
+        span = stack.pop() if stack else None
+        self._suspended[(stage, id(message))] = span
+        if span is not None:
+            self._task_spans[future] = span
+
+    def on_stage_end(self, stage, message, duration, error=None):
+        if stage not in _STAGE_KINDS or message is None:
+            return
+        key = (stage, id(message))
+        if key in self._suspended:
+            span = self._suspended.pop(key)
+        else:
+            stack = self._get_stack()
+            if not stack:
+                # tracer was registered while stage was running
+                return
+            span = stack.pop()
+        if span is None:
+            return
+        span.duration = duration
+        if error is not None:
+            span.error = utils.get_fqcn(error)
+        try:
+            self._exporter.export(span)
+        except Exception as e:
+            self.log.exception(e)
+
+
+def enable(exporter, sample_rate=1.0):
+    """
+    Starts tracing of messages processed by the current process
+
+    :param exporter: span sink or path of file to append spans to
+    :type exporter: SpanExporter or string
+    :param sample_rate: share of traced call chains, from 0 to 1
+    :type sample_rate: float
+    :return: tracer to pass to disable()
+    :rtype: Tracer
+    """
+    if not isinstance(exporter, SpanExporter):
+        exporter = FileExporter(exporter)
+    tracer = Tracer(exporter, Sampler(sample_rate))
+    instrumentation.register_observer(tracer)
+    return tracer
+
+
+def disable(tracer):
+    """
+    Stops tracing and closes exporter
+
+    :param tracer: tracer returned by enable()
+    :type tracer: Tracer
+    """
+    instrumentation.unregister_observer(tracer)
+    tracer.exporter.close()
@@ -14,6 +14,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+try:
+    import asyncio
+except ImportError:
+    try:
+        import trollius as asyncio
+    except ImportError:
+        asyncio = None
+
 
 class Singleton(object):
     """
@@ -40,3 +48,54 @@ def get_fqcn(obj):
     return "%(module_path)s.%(class_name)s" % dict(
         module_path=obj.__class__.__module__,
         class_name=obj.__class__.__name__)
+
+
+def is_awaitable(obj):
+    """Checks if object is coroutine or future that should be awaited
+    (asyncio on Python 3, trollius on Python 2).
+    """
+    if asyncio is None:
+        return False
+    return asyncio.iscoroutine(obj) or isinstance(obj, asyncio.Future)
+
+
+def get_current_task():
+    """Returns asyncio task that is running in the current thread or None.
+    """
+    if asyncio is None:
+        return None
+    current_task = getattr(asyncio, "current_task", None)
+    if current_task is None:
+        current_task = asyncio.Task.current_task
+    try:
+        return current_task()
+    except RuntimeError:
+        # thread has no event loop
+        return None
+
+
+def chain_awaitable(awaitable, callback):
+    """Schedules awaitable and calls callback with its future when it is done.
+
+    Returns future that is resolved by callback result (or exception).
+    """
+    future = asyncio.ensure_future(awaitable)
+    chained = asyncio.Future()
+
+    def on_done(done_future):
+        try:
+            chained.set_result(callback(done_future))
+        except Exception as e:
+            chained.set_exception(e)
+
+    future.add_done_callback(on_done)
+    return chained
+
+
+def gather_awaitables(results):
+    """Returns future that waits for all awaitable results or None if there
+    is nothing to await.
+    """
+    awaitables = [res for res in results if is_awaitable(res)]
+    if awaitables:
+        return asyncio.gather(*awaitables)
@@ -1,6 +1,7 @@
 import unittest
 
 import mock
+import pika
 
 from tavrida.amqp_driver import driver
 from tavrida.amqp_driver import pika_async
@@ -179,11 +180,11 @@ class AMQPDriverTestCase(unittest.TestCase):
         get_blocking_reader_mock().bind_queue.assert_called_once_with(
             exchange, service_name + ".#")
 
-    @mock.patch.object(driver.AMQPDriver, "create_writer")
-    def test_publish_message_via_new_writer(self, mock_get_writer):
+    @mock.patch.object(driver.AMQPDriver, "get_shared_writer")
+    def test_publish_message_via_shared_writer(self, mock_get_writer):
 
         """
-        Tests that message is published via existing reader
+        Tests that message is published via shared writer if there is no reader
         """
         self.driver._reader = None
         exchange = "exchange_name"
@@ -193,6 +194,70 @@ class AMQPDriverTestCase(unittest.TestCase):
         mock_get_writer().publish_message.assert_called_once_with(
             exchange, routing_key, message)
 
+    @mock.patch.object(pika, "BlockingConnection")
+    def test_reply_of_sync_reader_is_published_via_pool(self,
+                                                        connection_mock):
+
+        """
+        Tests that server with handlers in reader thread sends replies via
+        pool connection, not via channel of reader
+        """
+        reader = pika_sync.Reader(self.conf, "queue", mock.MagicMock())
+        reader._connection = mock.MagicMock()
+        reader._channel = mock.MagicMock()
+        self.assertFalse(reader.concurrent)
+        self.driver._reader = reader
+        message = mock.MagicMock()
+
+        self.driver.publish_message("exchange_name", "rk", message)
+        self.driver.publish_message("exchange_name", "rk", message)
+
+        self.assertIs(self.driver.writer, self.driver.get_shared_writer())
+        self.assertFalse(reader.channel.basic_publish.called)
+        self.assertEqual(connection_mock.call_count, 1)
+        self.assertEqual(
+            connection_mock().channel().basic_publish.call_count, 2)
+
+    def test_shared_writer_is_reused(self):
+
+        """
+        Tests that the same writer pool is used for all publications
+        """
+        self.assertIs(self.driver.get_shared_writer(),
+                      self.driver.get_shared_writer())
+        self.assertIsInstance(self.driver.get_shared_writer(),
+                              pika_sync.WriterPool)
+
+    @mock.patch.object(pika_async, "Publisher")
+    def test_publish_message_in_confirm_mode(self, publisher_mock):
+
+        """
+        Tests that in confirm mode message is published via confirming
+        publisher and confirmation is returned
+        """
+        self.conf.publisher_confirms = True
+        exchange = "exchange_name"
+        routing_key = "rk"
+        message = mock.MagicMock()
+        callback = mock.MagicMock()
+
+        res = self.driver.publish_message(exchange, routing_key, message,
+                                          callback)
+        self.driver.publish_message(exchange, routing_key, message)
+
+        publisher_mock.assert_called_once_with(self.conf)
+        publisher_mock().publish_message.assert_any_call(
+            exchange, routing_key, message, callback)
+        self.assertEqual(res, publisher_mock().publish_message())
+
+    def test_wait_for_confirms_without_publications(self):
+
+        """
+        Tests that there is nothing to wait if nothing was published in
+        confirm mode
+        """
+        self.assertTrue(self.driver.wait_for_confirms())
+
     @mock.patch.object(driver.AMQPDriver, "create_reader")
     def test_listen_starts(self, mock_get_reader):
 
@@ -205,3 +270,32 @@ class AMQPDriverTestCase(unittest.TestCase):
         self.driver.listen(queue, preprocessor)
         mock_get_reader().run.assert_called_once_with()
         self.driver._reader = mock_get_reader()
+
+    def test_heartbeat_in_background_async_reader(self):
+
+        """
+        Tests that heartbeats are not sent by hand if async reader runs
+        handlers out of ioloop
+        """
+        conf = config.ConnectionConfig(self.host, self.credentials,
+                                       async_engine=True,
+                                       background_heartbeats=True)
+        self.driver._reader = pika_async.Reader(conf, "queue",
+                                                mock.MagicMock())
+        self.assertTrue(self.driver._reader.concurrent)
+        self.assertTrue(self.driver.send_heartbeat_via_reader())
+
+    def test_heartbeat_in_background_sync_reader(self):
+
+        """
+        Tests that sync reader with background heartbeats doesn't touch
+        connection from handler
+        """
+        conf = config.ConnectionConfig(self.host, self.credentials,
+                                       background_heartbeats=True)
+        self.driver._reader = pika_sync.Reader(conf, "queue",
+                                               mock.MagicMock())
+        self.driver._reader._connection = mock.MagicMock()
+        self.assertTrue(self.driver.send_heartbeat_via_reader())
+        self.assertFalse(
+            self.driver._reader._connection.process_data_events.called)
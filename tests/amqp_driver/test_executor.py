@@ -0,0 +1,93 @@
+import threading
+import unittest
+
+import mock
+
+from tavrida.amqp_driver import executor
+
+
+class HandlerExecutorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(HandlerExecutorTestCase, self).setUp()
+        self.handler = mock.MagicMock()
+        self.executor = executor.HandlerExecutor(2, self.handler)
+
+    def _message(self, correlation_id):
+        message = mock.MagicMock()
+        message.headers = {"correlation_id": correlation_id}
+        return message
+
+    def _wait_completed(self, count):
+        result = []
+        while len(result) < count:
+            result.extend(self.executor.completed())
+        return result
+
+    def test_messages_are_handled_in_workers(self):
+        """
+        Tests that submitted messages are handled and returned as completed
+        """
+        self.executor.start()
+        self.addCleanup(self.executor.stop)
+        frames = [mock.MagicMock(), mock.MagicMock()]
+        self.executor.submit(self._message("1"), frames[0])
+        self.executor.submit(self._message("2"), frames[1])
+
+        completed = self._wait_completed(2)
+
+        self.assertEqual(set(f for f, e in completed), set(frames))
+        self.assertEqual(self.handler.call_count, 2)
+        self.assertEqual(self.executor.in_progress, 0)
+
+    def test_handler_error_is_returned(self):
+        """
+        Tests that exception raised by handler is returned with frame
+        """
+        error = ValueError()
+        self.handler.side_effect = error
+        self.executor.start()
+        self.addCleanup(self.executor.stop)
+        frame = mock.MagicMock()
+        self.executor.submit(self._message("1"), frame)
+
+        self.assertEqual(self._wait_completed(1), [(frame, error)])
+
+    def test_same_correlation_id_is_handled_in_order(self):
+        """
+        Tests that messages with the same correlation_id are handled
+        sequentially in order of submission
+        """
+        handled = []
+        lock = threading.Lock()
+
+        def handler(message):
+            with lock:
+                handled.append(message.headers["number"])
+
+        self.executor = executor.HandlerExecutor(4, handler)
+        self.executor.start()
+        self.addCleanup(self.executor.stop)
+        for number in range(20):
+            message = self._message("same")
+            message.headers["number"] = number
+            self.executor.submit(message, mock.MagicMock())
+
+        self._wait_completed(20)
+        self.assertEqual(handled, list(range(20)))
+
+    def test_reset_drops_old_results(self):
+        """
+        Tests that results of messages submitted before reset are dropped
+        """
+        self.executor.submit(self._message("1"), mock.MagicMock())
+        self.executor.reset()
+        self.executor.start()
+        self.addCleanup(self.executor.stop)
+        frame = mock.MagicMock()
+        self.executor.submit(self._message("2"), frame)
+
+        while self.executor.in_progress:
+            completed = list(self.executor.completed())
+            if completed:
+                self.assertEqual(completed, [(frame, None)])
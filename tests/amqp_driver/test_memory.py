@@ -0,0 +1,314 @@
+import threading
+import unittest
+
+import mock
+
+from tavrida.amqp_driver import driver
+from tavrida.amqp_driver import memory
+from tavrida import config
+from tavrida import exceptions
+from tavrida import messages
+from tavrida import timings
+from tavrida import topology
+
+
+class TopicMatchesTestCase(unittest.TestCase):
+
+    def test_hash_matches_zero_or_more_words(self):
+        """
+        Tests that "#" matches any number of words including zero
+        """
+        self.assertTrue(memory.topic_matches("service.#", "service"))
+        self.assertTrue(memory.topic_matches("service.#", "service.method"))
+        self.assertTrue(memory.topic_matches("service.#", "service.a.b"))
+        self.assertFalse(memory.topic_matches("service.#", "other.method"))
+        self.assertFalse(memory.topic_matches("service.#", "services"))
+
+    def test_star_matches_one_word(self):
+        """
+        Tests that "*" matches exactly one word
+        """
+        self.assertTrue(memory.topic_matches("*.method", "service.method"))
+        self.assertFalse(memory.topic_matches("*.method", "method"))
+        self.assertFalse(memory.topic_matches("*", "service.method"))
+
+
+class MemoryQueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(MemoryQueueTestCase, self).setUp()
+        self.queue = memory.MemoryQueue("queue", 2)
+
+    def test_full_queue_raises_after_timeout(self):
+        """
+        Tests that publication to full queue fails when timeout expires
+        """
+        self.queue.put("first")
+        self.queue.put("second")
+        self.assertRaises(exceptions.QueueIsFull, self.queue.put, "third", 0)
+
+    def test_ack_removes_message(self):
+        """
+        Tests that acked message is not delivered again
+        """
+        self.queue.put("message")
+        delivery, message = self.queue.get(0)
+        self.assertEqual(message, "message")
+        self.assertEqual(self.queue.unacked_count, 1)
+        self.queue.ack(delivery.delivery_tag)
+        self.assertEqual(self.queue.unacked_count, 0)
+        self.assertIsNone(self.queue.get(0))
+
+    def test_rejected_message_is_requeued_first(self):
+        """
+        Tests that rejected message is returned to the head of queue
+        """
+        self.queue.put("first")
+        self.queue.put("second")
+        delivery, _ = self.queue.get(0)
+        self.queue.reject(delivery.delivery_tag)
+        self.assertEqual(self.queue.get(0)[1], "first")
+
+    def test_prefetch_limits_unacked_messages(self):
+        """
+        Tests that no message is delivered while prefetch count of unacked
+        messages is reached
+        """
+        self.queue.put("first")
+        self.queue.put("second")
+        self.queue.get(0, prefetch_count=1)
+        self.assertIsNone(self.queue.get(0, prefetch_count=1))
+
+
+class BrokerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(BrokerTestCase, self).setUp()
+        self.broker = memory.Broker()
+        self.broker.declare_exchange("exchange")
+        self.queue = self.broker.declare_queue("queue")
+        self.broker.bind_queue("queue", "exchange", "service.#")
+        self.message = messages.AMQPMessage("body", {"key": "value"},
+                                            "application/json")
+
+    def test_message_is_routed_by_binding_key(self):
+        """
+        Tests that message is delivered to queue bound by service name
+        """
+        self.assertEqual(self.broker.publish("exchange", "service.method",
+                                             self.message), 1)
+        self.assertEqual(self.broker.publish("exchange", "other.method",
+                                             self.message), 0)
+        self.assertEqual(len(self.queue), 1)
+
+    def test_queue_gets_copy_of_headers(self):
+        """
+        Tests that delivered message doesn't share headers with published
+        one
+        """
+        self.broker.publish("exchange", "service.method", self.message)
+        delivered = self.queue.get(0)[1]
+        self.assertEqual(delivered.headers, self.message.headers)
+        self.assertIsNot(delivered.headers, self.message.headers)
+        self.assertEqual(delivered.content_type, "application/json")
+
+    def test_new_binding_resets_routes(self):
+        """
+        Tests that binding added after publication is used by next
+        publications
+        """
+        self.broker.publish("exchange", "other.method", self.message)
+        other = self.broker.declare_queue("other")
+        self.broker.bind_queue("other", "exchange", "other.#")
+        self.broker.publish("exchange", "other.method", self.message)
+        self.assertEqual(len(other), 1)
+
+    def test_unknown_exchange(self):
+        """
+        Tests that publication to not declared exchange fails
+        """
+        self.assertRaises(exceptions.ExchangeNotFound, self.broker.publish,
+                          "unknown", "service.method", self.message)
+
+    def test_default_exchange_routes_to_queue_by_name(self):
+        """
+        Tests that default exchange delivers message to queue named by
+        routing key
+        """
+        self.assertEqual(self.broker.publish("", "queue", self.message), 1)
+        self.assertEqual(self.broker.publish("", "unknown", self.message), 0)
+        self.assertEqual(len(self.queue), 1)
+
+    def test_deleted_queue_is_unbound(self):
+        """
+        Tests that deleted queue doesn't get messages
+        """
+        self.broker.publish("exchange", "service.method", self.message)
+        self.broker.delete_queue("queue")
+        self.assertEqual(self.broker.publish("exchange", "service.method",
+                                             self.message), 0)
+        self.assertRaises(exceptions.QueueNotFound, self.broker.get_queue,
+                          "queue")
+
+
+class ReaderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(ReaderTestCase, self).setUp()
+        memory.reset_brokers()
+        self.addCleanup(memory.reset_brokers)
+        self.conf = config.ConnectionConfig(
+            "host", config.Credentials("user", "password"),
+            memory_engine=True)
+        self.broker = memory.get_broker()
+        self.broker.declare_exchange("exchange")
+        self.queue = self.broker.declare_queue("queue")
+        self.broker.bind_queue("queue", "exchange", "service.#")
+        self.preprocessor = mock.MagicMock()
+        self.reader = memory.Reader(self.conf, "queue", self.preprocessor)
+        self.message = messages.AMQPMessage("body", {}, "application/json")
+
+    def _stop_after(self, count):
+        def process(msg):
+            if self.preprocessor.process.call_count >= count:
+                self.reader.request_stop()
+        self.preprocessor.process.side_effect = process
+
+    def test_handled_message_is_acked(self):
+        """
+        Tests that reader passes message to preprocessor and acks it
+        """
+        self._stop_after(1)
+        self.broker.publish("exchange", "service.method", self.message)
+        self.reader.run()
+        self.assertEqual(self.preprocessor.process.call_count, 1)
+        self.assertEqual(len(self.queue), 0)
+        self.assertEqual(self.queue.unacked_count, 0)
+
+    def test_nackable_error_requeues_message(self):
+        """
+        Tests that message is requeued if handling raised NackableException
+        """
+        error = exceptions.BaseNackableException()
+
+        def process(msg):
+            self.reader.request_stop()
+            raise error
+
+        self.preprocessor.process.side_effect = process
+        self.broker.publish("exchange", "service.method", self.message)
+        self.reader.run()
+        self.assertEqual(len(self.queue), 1)
+
+    def test_concurrent_reader_acks_handled_messages(self):
+        """
+        Tests that messages handled by worker threads are acked
+        """
+        self.conf.handler_workers = 2
+        self.reader = memory.Reader(self.conf, "queue", self.preprocessor)
+        handled = threading.Event()
+        self.preprocessor.process.side_effect = (
+            lambda msg: handled.set()
+            if self.preprocessor.process.call_count == 3 else None)
+        for _ in range(3):
+            self.broker.publish("exchange", "service.method", self.message)
+        thread = threading.Thread(target=self.reader.run)
+        thread.start()
+        handled.wait(5)
+        self.reader.request_stop()
+        thread.join(5)
+        self.assertEqual(self.preprocessor.process.call_count, 3)
+        self.assertEqual(self.queue.unacked_count, 0)
+
+    def test_background_heartbeats_use_worker(self):
+        """
+        Tests that handlers run in worker thread with background heartbeats
+        as in other engines
+        """
+        self.conf.background_heartbeats = True
+        reader = memory.Reader(self.conf, "queue", self.preprocessor)
+        self.assertTrue(reader.concurrent)
+        self.assertEqual(reader._prefetch_count, 2)
+
+    def test_unknown_queue(self):
+        """
+        Tests that consuming from not declared queue fails
+        """
+        reader = memory.Reader(self.conf, "unknown", self.preprocessor)
+        self.assertRaises(exceptions.QueueNotFound, reader.run)
+
+
+class ReplyReaderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(ReplyReaderTestCase, self).setUp()
+        memory.reset_brokers()
+        self.addCleanup(memory.reset_brokers)
+        self.conf = config.ConnectionConfig(
+            "host", config.Credentials("user", "password"),
+            memory_engine=True, handler_workers=2)
+        self.preprocessor = mock.MagicMock()
+        self.reader = memory.ReplyReader(self.conf, "replies",
+                                         self.preprocessor)
+
+    def test_queue_lives_while_reader_is_connected(self):
+        """
+        Tests that reply queue is declared on connect and deleted on
+        disconnect
+        """
+        broker = self.reader.connect()
+        message = messages.AMQPMessage("body", {})
+        self.assertEqual(broker.publish("", "replies", message), 1)
+        self.preprocessor.process.side_effect = (
+            lambda msg: self.reader.request_stop())
+
+        self.reader.run()
+
+        self.assertEqual(self.preprocessor.process.call_count, 1)
+        self.assertFalse(self.reader.concurrent)
+        self.assertRaises(exceptions.QueueNotFound, broker.get_queue,
+                          "replies")
+
+
+class MemoryDriverTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(MemoryDriverTestCase, self).setUp()
+        memory.reset_brokers()
+        self.addCleanup(memory.reset_brokers)
+        self.conf = config.ConnectionConfig(
+            "host", config.Credentials("user", "password"),
+            memory_engine=True)
+        self.driver = driver.AMQPDriver(self.conf)
+
+    def test_driver_uses_memory_engine(self):
+        """
+        Tests that driver uses in-memory engine if memory_engine=True
+        """
+        self.assertEqual(self.driver._engine, memory)
+        self.assertIsInstance(self.driver.create_writer(), memory.Writer)
+
+    def test_published_message_is_consumed(self):
+        """
+        Tests that message published via driver is consumed from queue
+        bound by server binding key
+        """
+        plan = topology.Topology()
+        plan.add_exchange("exchange")
+        plan.add_queue("queue")
+        plan.add_binding("queue", "exchange", "service.#")
+        self.driver.declare_topology(plan)
+        preprocessor = mock.MagicMock()
+        preprocessor.process.side_effect = (
+            lambda msg: self.driver.stop_listening())
+
+        self.driver.publish_message(
+            "exchange", "service.method",
+            messages.AMQPMessage("body", {"key": "value"}))
+        self.driver.listen("queue", preprocessor)
+
+        msg = preprocessor.process.call_args[0][0]
+        received_at = msg.headers.pop(timings.RECEIVED_AT)
+        self.assertIsInstance(received_at, long)
+        self.assertEqual(msg.headers, {"key": "value"})
+        self.assertEqual(msg.body, "body")
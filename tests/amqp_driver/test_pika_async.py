@@ -0,0 +1,470 @@
+import unittest
+
+import mock
+import pika
+
+from tavrida.amqp_driver import pika_async
+from tavrida import config
+from tavrida import topology
+
+
+class PublisherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(PublisherTestCase, self).setUp()
+        self.credentials = config.Credentials("user", "password")
+        self.conf = config.ConnectionConfig("host", self.credentials)
+        self.publisher = pika_async.Publisher(self.conf)
+        self.connections = []
+        connect_patcher = mock.patch.object(self.publisher, "connect",
+                                            side_effect=self._connect)
+        connect_patcher.start()
+        self.addCleanup(connect_patcher.stop)
+
+    def _connect(self):
+        connection = mock.MagicMock()
+        connection.is_open = True
+        connection.is_closed = False
+        connection.is_closing = False
+        connection.close.side_effect = (
+            lambda: setattr(connection, "is_closed", True))
+        connection.outbound_buffer = []
+        self.publisher._channel = connection.channel()
+        self.publisher._channel.is_open = True
+        self.connections.append(connection)
+        return connection
+
+    def test_connection_is_reused(self):
+        """
+        Tests that sequential publications use the same connection
+        """
+        message = mock.MagicMock()
+        self.publisher.publish_message("exchange", "rk", message)
+        self.publisher.publish_message("exchange", "rk", message)
+        self.assertEqual(len(self.connections), 1)
+        self.assertEqual(
+            self.connections[0].channel().basic_publish.call_count, 2)
+        self.assertFalse(self.connections[0].close.called)
+        self.assertEqual(self.publisher.pending_count, 0)
+
+    def test_unflushed_message_is_replayed_after_reconnect(self):
+        """
+        Tests that message which was not flushed to socket before connection
+        loss is published again via new connection
+        """
+        message = mock.MagicMock()
+
+        def lose_connection(*args, **kwargs):
+            connection = self.connections[0]
+            connection.is_open = False
+            self.publisher._on_connection_closed(connection, 320, "closed")
+
+        self.publisher.connect()
+        self.publisher._connection = self.connections[0]
+        self.connections[0].channel().basic_publish.side_effect = \
+            lose_connection
+
+        self.publisher.publish_message("exchange", "rk", message)
+
+        self.assertEqual(len(self.connections), 2)
+        self.assertEqual(
+            self.connections[1].channel().basic_publish.call_count, 1)
+        self.assertEqual(self.publisher.pending_count, 0)
+
+    def test_publish_retried_on_channel_closed(self):
+        """
+        Tests that message is published again via new connection if channel
+        was closed during publication
+        """
+        message = mock.MagicMock()
+        self.publisher.connect()
+        self.publisher._connection = self.connections[0]
+        channel = self.connections[0].channel()
+        channel.basic_publish.side_effect = pika.exceptions.ChannelClosed()
+
+        self.publisher.publish_message("exchange", "rk", message)
+
+        self.assertEqual(len(self.connections), 2)
+        self.assertEqual(
+            self.connections[1].channel().basic_publish.call_count, 1)
+        self.connections[0].close.assert_called_once_with()
+        self.assertFalse(self.connections[1].close.called)
+
+    def test_reset_connection_skips_closed_connection(self):
+        """
+        Tests that connection closed by broker is forgotten without close
+        """
+        self.publisher.connect()
+        connection = self.connections[0]
+        self.publisher._connection = connection
+        connection.is_closed = True
+
+        self.publisher.reset_connection()
+
+        self.assertFalse(connection.close.called)
+        self.assertIsNone(self.publisher.connection)
+
+    def test_reset_connection_ignores_close_errors(self):
+        """
+        Tests that error on close of broken connection doesn't break
+        reconnect and doesn't return messages to buffer twice
+        """
+        self.publisher.connect()
+        connection = self.connections[0]
+        self.publisher._connection = connection
+        self.publisher._unflushed = [("exchange", "rk", "message", None)]
+
+        def close():
+            self.publisher._on_connection_closed(connection, 320, "closed")
+            raise pika.exceptions.ConnectionClosed()
+
+        connection.close.side_effect = close
+
+        self.publisher.reset_connection()
+
+        self.assertIsNone(self.publisher.connection)
+        self.assertEqual(self.publisher.pending_count, 1)
+        self.assertFalse(self.publisher._closing)
+
+    def test_wait_for_flush_drives_ioloop(self):
+        """
+        Tests that publisher polls ioloop until outbound buffer is written
+        """
+        self.publisher.connect()
+        connection = self.connections[0]
+        self.publisher._connection = connection
+        connection.outbound_buffer = ["frame"]
+
+        def poll(write_only=False):
+            if write_only:
+                connection.outbound_buffer.pop()
+
+        connection.ioloop.poll.side_effect = poll
+
+        self.publisher.publish_message("exchange", "rk", mock.MagicMock())
+
+        connection.ioloop.poll.assert_called_with(write_only=True)
+        self.assertEqual(self.publisher.pending_count, 0)
+
+    def test_publish_messages_flushes_once(self):
+        """
+        Tests that batch of messages is written to channel before flush
+        """
+        message = mock.MagicMock()
+        with mock.patch.object(self.publisher, "_wait_for_flush") as flush:
+            self.publisher.publish_messages([("exchange", "rk", message),
+                                             ("exchange", "rk", message)])
+            flush.assert_called_once_with()
+        self.assertEqual(
+            self.connections[0].channel().basic_publish.call_count, 2)
+
+    def test_close_connection(self):
+        """
+        Tests that publisher closes its connection
+        """
+        self.publisher.publish_message("exchange", "rk", mock.MagicMock())
+        connection = self.connections[0]
+        connection.close.side_effect = (
+            lambda: setattr(connection, "is_closed", True))
+
+        self.publisher.close_connection()
+
+        connection.close.assert_called_once_with()
+        self.assertIsNone(self.publisher.connection)
+
+
+class WriterTestCase(unittest.TestCase):
+
+    @mock.patch.object(pika_async, "Publisher")
+    def test_writer_publishes_via_publisher(self, publisher_mock):
+        """
+        Tests that writer publishes all messages via one publisher
+        """
+        conf = config.ConnectionConfig("host",
+                                       config.Credentials("user", "password"))
+        writer = pika_async.Writer(conf)
+        message = mock.MagicMock()
+        writer.publish_message("exchange", "rk", message)
+        writer.publish_message("exchange", "rk", message)
+        publisher_mock.assert_called_once_with(conf)
+        self.assertEqual(publisher_mock().publish_message.call_count, 2)
+
+
+class ConfirmingPublisherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(ConfirmingPublisherTestCase, self).setUp()
+        self.credentials = config.Credentials("user", "password")
+        self.conf = config.ConnectionConfig("host", self.credentials,
+                                            publisher_confirms=True,
+                                            confirm_window=2)
+        self.publisher = pika_async.Publisher(self.conf)
+        self.connections = []
+        connect_patcher = mock.patch.object(self.publisher, "connect",
+                                            side_effect=self._connect)
+        connect_patcher.start()
+        self.addCleanup(connect_patcher.stop)
+
+    def _connect(self):
+        connection = mock.MagicMock()
+        connection.is_open = True
+        connection.is_closed = False
+        connection.outbound_buffer = []
+        self.publisher._connection = connection
+        channel = connection.channel()
+        channel.is_open = True
+        self.publisher._on_channel_open(channel)
+        self.connections.append(connection)
+        return connection
+
+    def _confirm(self, delivery_tag, multiple=False, ack=True):
+        method_cls = pika.spec.Basic.Ack if ack else pika.spec.Basic.Nack
+        frame = mock.MagicMock()
+        frame.method = method_cls(delivery_tag=delivery_tag,
+                                  multiple=multiple)
+        self.publisher._on_delivery_confirmation(frame)
+
+    def test_channel_is_in_confirm_mode(self):
+        """
+        Tests that publisher enables confirm mode on channel
+        """
+        self.publisher.publish_message("exchange", "rk", mock.MagicMock())
+        self.connections[0].channel().confirm_delivery.assert_called_once_with(
+            self.publisher._on_delivery_confirmation)
+
+    def test_ack_resolves_confirmation(self):
+        """
+        Tests that Basic.Ack resolves confirmation and calls callback
+        """
+        callback = mock.MagicMock()
+        confirmation = self.publisher.publish_message(
+            "exchange", "rk", mock.MagicMock(), callback)
+        self.assertFalse(confirmation.done())
+
+        self._confirm(1)
+
+        self.assertTrue(confirmation.acked)
+        callback.assert_called_once_with(confirmation)
+        self.assertEqual(self.publisher.unconfirmed_count, 0)
+
+    def test_multiple_ack_resolves_all_previous(self):
+        """
+        Tests that Basic.Ack with multiple flag confirms all messages up to
+        delivery tag
+        """
+        first = self.publisher.publish_message("exchange", "rk",
+                                               mock.MagicMock())
+        second = self.publisher.publish_message("exchange", "rk",
+                                                mock.MagicMock())
+
+        self._confirm(2, multiple=True)
+
+        self.assertTrue(first.acked)
+        self.assertTrue(second.acked)
+
+    def test_nack_rejects_confirmation(self):
+        """
+        Tests that Basic.Nack resolves confirmation as not acknowledged
+        """
+        confirmation = self.publisher.publish_message("exchange", "rk",
+                                                      mock.MagicMock())
+        self._confirm(1, ack=False)
+        self.assertIs(confirmation.acked, False)
+
+    def test_full_window_waits_for_confirmation(self):
+        """
+        Tests that publisher processes ioloop events when window of
+        unconfirmed messages is full
+        """
+        self.publisher.publish_message("exchange", "rk", mock.MagicMock())
+        self.publisher.publish_message("exchange", "rk", mock.MagicMock())
+        connection = self.connections[0]
+        connection.ioloop.poll.side_effect = (
+            lambda write_only=False: self._confirm(1))
+
+        self.publisher.publish_message("exchange", "rk", mock.MagicMock())
+
+        self.assertEqual(self.publisher.unconfirmed_count, 2)
+        self.assertEqual(connection.channel().basic_publish.call_count, 3)
+
+    def test_unconfirmed_messages_are_lost_after_reconnect(self):
+        """
+        Tests that messages that are not confirmed when connection is lost
+        are reported as lost and are not published again
+        """
+        callback = mock.MagicMock()
+        confirmation = self.publisher.publish_message(
+            "exchange", "rk", mock.MagicMock(), callback)
+        connection = self.connections[0]
+        connection.is_open = False
+        self.publisher._on_connection_closed(connection, 320, "closed")
+
+        self.assertTrue(self.publisher.wait_for_confirms(timeout=0.01))
+        self.assertIs(confirmation.acked, False)
+        self.assertTrue(confirmation.lost)
+        callback.assert_called_once_with(confirmation)
+
+        self.publisher.publish_message("exchange", "rk", mock.MagicMock())
+        self.assertEqual(len(self.connections), 2)
+        self.assertEqual(
+            self.connections[1].channel().basic_publish.call_count, 1)
+
+    def test_wait_for_given_confirmations(self):
+        """
+        Tests that publisher waits only for given confirmations
+        """
+        first = self.publisher.publish_message("exchange", "rk",
+                                               mock.MagicMock())
+        self.publisher.publish_message("exchange", "rk", mock.MagicMock())
+        self.connections[0].ioloop.poll.side_effect = (
+            lambda write_only=False: self._confirm(1))
+
+        self.assertTrue(self.publisher.wait_for_confirms(
+            timeout=1, confirmations=[first]))
+        self.assertTrue(first.acked)
+        self.assertEqual(self.publisher.unconfirmed_count, 1)
+
+
+class ReaderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(ReaderTestCase, self).setUp()
+        self.conf = config.ConnectionConfig(
+            "host", config.Credentials("user", "password"),
+            async_engine=True, handler_workers=2)
+        self.reader = pika_async.Reader(self.conf, "queue", mock.MagicMock())
+        self.reader._connection = mock.MagicMock()
+        self.reader._channel = mock.MagicMock()
+        self.reader._executor = mock.MagicMock()
+
+    def test_consuming_sets_prefetch_and_schedules_acks(self):
+        """
+        Tests that reader sets prefetch count and schedules ack of handled
+        messages in ioloop
+        """
+        self.reader._start_consuming()
+        self.reader._channel.basic_qos.assert_called_once_with(
+            prefetch_count=4)
+        self.reader._executor.start.assert_called_once_with()
+        self.reader._connection.add_timeout.assert_called_once_with(
+            self.reader.ACK_INTERVAL, self.reader._finish_completed)
+
+    def test_handled_messages_are_acked_by_ioloop(self):
+        """
+        Tests that messages handled by workers are acked in ioloop timer
+        """
+        frame = mock.MagicMock()
+        self.reader._executor.completed.return_value = [(frame, None)]
+        self.reader._finish_completed()
+        self.reader._channel.basic_ack.assert_called_once_with(
+            frame.delivery_tag)
+        self.assertTrue(self.reader._connection.add_timeout.called)
+
+    def test_concurrent_reader_publishes_via_shared_writer(self):
+        """
+        Tests that handlers running in workers don't publish via ioloop
+        channel of reader
+        """
+        factory = pika_async.WriterFactory()
+        self.assertIsInstance(factory.get_writer_by_reader(self.reader),
+                              pika_async.Writer)
+
+
+class TopologyDeclarerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(TopologyDeclarerTestCase, self).setUp()
+        self.plan = topology.Topology()
+        self.plan.add_exchange("exchange")
+        self.plan.add_queue("queue")
+        self.plan.add_binding("queue", "exchange", "rk.#")
+        self.conf = config.ConnectionConfig(
+            "host", config.Credentials("user", "password"),
+            reconnect_attempts=2, retry_delay=0)
+        self.declarer = pika_async.TopologyDeclarer(self.conf, self.plan)
+        self.declarer._connection = mock.MagicMock()
+        self.channel = mock.MagicMock()
+
+    def test_declarations_are_pipelined(self):
+        """
+        Tests that all declarations but the last one don't wait for response
+        """
+        self.declarer._on_channel_open(self.channel)
+        self.channel.exchange_declare.assert_called_once_with(
+            exchange="exchange", exchange_type="topic", durable=True,
+            callback=None, nowait=True)
+        self.channel.queue_declare.assert_called_once_with(
+            queue="queue", durable=True, callback=None, nowait=True)
+        self.channel.queue_bind.assert_called_once_with(
+            queue="queue", exchange="exchange", routing_key="rk.#",
+            callback=self.declarer._on_declareok)
+
+    def test_failed_declaration_raises(self):
+        """
+        Tests that channel closed before the last response is reported as
+        error
+        """
+        connection = mock.MagicMock()
+        connection.ioloop.start.side_effect = (
+            lambda: self.declarer._on_channel_closed(self.channel, 406,
+                                                     "PRECONDITION_FAILED"))
+        with mock.patch.object(self.declarer, "connect",
+                               return_value=connection):
+            self.assertRaises(pika.exceptions.ChannelClosed,
+                              self.declarer.declare)
+        connection.close.assert_called_once_with()
+
+    def test_declaration_is_repeated_if_broker_is_unavailable(self):
+        """
+        Tests that declarer reconnects if connection can't be opened
+        """
+        failed = mock.MagicMock()
+        succeeded = mock.MagicMock()
+        succeeded.ioloop.start.side_effect = (
+            lambda: (self.declarer._on_channel_open(self.channel),
+                     self.declarer._on_declareok(None)))
+        connections = iter([failed, succeeded])
+
+        def connect():
+            connection = next(connections)
+            if connection is failed:
+                self.declarer._on_connection_open_error(
+                    connection, "Connection refused")
+            return connection
+
+        with mock.patch.object(self.declarer, "connect", side_effect=connect):
+            self.declarer.declare()
+        self.assertFalse(failed.ioloop.start.called)
+        self.assertTrue(self.channel.queue_bind.called)
+        succeeded.close.assert_called_once_with()
+
+    def test_reconnect_attempts_are_limited(self):
+        """
+        Tests that connection error is raised when reconnect attempts are
+        exhausted
+        """
+        connection = mock.MagicMock()
+
+        def connect():
+            self.declarer._on_connection_open_error(connection,
+                                                    "Connection refused")
+            return connection
+
+        with mock.patch.object(self.declarer, "connect",
+                               side_effect=connect) as connect_mock:
+            self.assertRaises(pika.exceptions.AMQPConnectionError,
+                              self.declarer.declare)
+        self.assertEqual(connect_mock.call_count, 3)
+
+    def test_connection_lost_before_confirmation(self):
+        """
+        Tests that declaration is repeated if connection is closed before
+        the last declaration is confirmed
+        """
+        connection = mock.MagicMock()
+        self.declarer._connection = connection
+        self.declarer._on_channel_open(self.channel)
+        self.declarer._on_connection_closed(connection, 320, "closed")
+        self.assertIsInstance(self.declarer._error,
+                              pika.exceptions.ConnectionClosed)
+        connection.ioloop.stop.assert_called_once_with()
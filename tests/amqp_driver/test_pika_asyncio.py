@@ -0,0 +1,132 @@
+import unittest
+
+import mock
+
+from tavrida.amqp_driver import driver
+from tavrida.amqp_driver import pika_asyncio
+from tavrida import config
+from tavrida import exceptions
+from tavrida import utils
+
+
+class IOLoopAdapterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(IOLoopAdapterTestCase, self).setUp()
+        self.loop = mock.MagicMock()
+        self.adapter = pika_asyncio.IOLoopAdapter(self.loop)
+
+    def test_add_read_handler(self):
+        """
+        Tests that read events are watched by loop reader
+        """
+        handler = mock.MagicMock()
+        self.adapter.add_handler(5, handler, self.adapter.READ)
+        self.loop.add_reader.assert_called_once_with(5, handler, 5,
+                                                     self.adapter.READ)
+        self.assertFalse(self.loop.add_writer.called)
+
+    def test_update_handler_watches_write(self):
+        """
+        Tests that write events are watched after handler update
+        """
+        handler = mock.MagicMock()
+        self.adapter.add_handler(5, handler, self.adapter.READ)
+        self.adapter.update_handler(5, self.adapter.READ | self.adapter.WRITE)
+        self.loop.add_writer.assert_called_once_with(5, handler, 5,
+                                                     self.adapter.WRITE)
+
+    def test_timeouts(self):
+        """
+        Tests that timeouts are scheduled by loop
+        """
+        callback = mock.MagicMock()
+        timeout_id = self.adapter.add_timeout(1, callback)
+        self.loop.call_later.assert_called_once_with(1, callback)
+        self.adapter.remove_timeout(timeout_id)
+        timeout_id.cancel.assert_called_once_with()
+
+
+@unittest.skipIf(utils.asyncio is None, "asyncio is not available")
+class ReaderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(ReaderTestCase, self).setUp()
+        self.conf = config.ConnectionConfig(
+            "host", config.Credentials("user", "password"),
+            asyncio_engine=True)
+        self.loop = utils.asyncio.get_event_loop()
+        self.preprocessor = mock.MagicMock()
+        self.reader = pika_asyncio.Reader(self.conf, "queue",
+                                          self.preprocessor, loop=self.loop)
+        self.reader._channel = mock.MagicMock()
+
+    def test_driver_uses_asyncio_engine(self):
+        """
+        Tests that driver uses asyncio engine if asyncio_engine parameter is
+        set
+        """
+        self.assertEqual(driver.AMQPDriver(self.conf)._engine, pika_asyncio)
+
+    def test_sync_result_is_acked_immediately(self):
+        """
+        Tests that message is acked right after sync handler
+        """
+        frame = mock.MagicMock()
+        self.preprocessor.process.return_value = None
+        self.reader._on_message(mock.MagicMock(), frame)
+        self.reader._channel.basic_ack.assert_called_once_with(
+            frame.delivery_tag)
+
+    def test_coroutine_result_is_acked_when_done(self):
+        """
+        Tests that message is acked when handler future is done
+        """
+        frame = mock.MagicMock()
+        future = utils.asyncio.Future(loop=self.loop)
+        self.preprocessor.process.return_value = future
+
+        self.reader._on_message(mock.MagicMock(), frame)
+        self.assertFalse(self.reader._channel.basic_ack.called)
+
+        future.set_result(None)
+        self.loop.run_until_complete(future)
+        self.loop.run_until_complete(utils.asyncio.sleep(0))
+        self.reader._channel.basic_ack.assert_called_once_with(
+            frame.delivery_tag)
+
+    def test_nackable_coroutine_error_rejects_message(self):
+        """
+        Tests that message is rejected if handler future raised nackable
+        exception
+        """
+        frame = mock.MagicMock()
+        future = utils.asyncio.Future(loop=self.loop)
+        self.preprocessor.process.return_value = future
+
+        self.reader._on_message(mock.MagicMock(), frame)
+        future.set_exception(exceptions.BaseNackableException())
+        self.loop.run_until_complete(utils.asyncio.sleep(0))
+        self.reader._channel.basic_reject.assert_called_once_with(
+            frame.delivery_tag)
+
+    def test_background_heartbeats_handle_coroutines_in_loop(self):
+        """
+        Tests that with background heartbeats handlers of asyncio engine
+        still run in event loop, so coroutine handlers are scheduled
+        """
+        self.conf.background_heartbeats = True
+        self.conf.handler_workers = 2
+        reader = pika_asyncio.Reader(self.conf, "queue", self.preprocessor,
+                                     loop=self.loop)
+        reader._channel = mock.MagicMock()
+        self.assertFalse(reader.concurrent)
+        self.assertIsNone(reader._prefetch_count)
+
+        frame = mock.MagicMock()
+        self.preprocessor.process.side_effect = (
+            lambda msg: utils.chain_awaitable(
+                utils.asyncio.sleep(0, loop=self.loop), lambda f: None))
+        reader._on_message(mock.MagicMock(), frame)
+        self.loop.run_until_complete(utils.asyncio.sleep(0.01))
+        reader._channel.basic_ack.assert_called_once_with(frame.delivery_tag)
@@ -0,0 +1,207 @@
+import unittest
+
+import mock
+import pika
+
+from tavrida.amqp_driver import pika_sync
+from tavrida import config
+from tavrida import exceptions
+
+
+class WriterPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(WriterPoolTestCase, self).setUp()
+        self.credentials = config.Credentials("user", "password")
+        self.conf = config.ConnectionConfig("host", self.credentials,
+                                            writer_pool_size=2)
+        self.pool = pika_sync.WriterPool(self.conf)
+
+    @mock.patch.object(pika, "BlockingConnection")
+    def test_connection_is_reused(self, connection_mock):
+        """
+        Tests that sequential publications use the same connection
+        """
+        message = mock.MagicMock()
+        self.pool.publish_message("exchange", "rk", message)
+        self.pool.publish_message("exchange", "rk", message)
+        self.assertEqual(connection_mock.call_count, 1)
+        self.assertEqual(
+            connection_mock().channel().basic_publish.call_count, 2)
+        self.assertFalse(connection_mock().close.called)
+
+    @mock.patch.object(pika, "BlockingConnection")
+    def test_pool_is_bounded(self, connection_mock):
+        """
+        Tests that pool doesn't create more writers than configured
+        """
+        writers = [self.pool._acquire(), self.pool._acquire()]
+        self.pool._release(writers[0])
+        self.assertIs(self.pool._acquire(), writers[0])
+        self.assertEqual(self.pool._created, 2)
+
+    @mock.patch.object(pika, "BlockingConnection")
+    def test_closed_connection_is_reopened(self, connection_mock):
+        """
+        Tests that connection closed by broker is reopened on next publish
+        """
+        message = mock.MagicMock()
+        self.pool.publish_message("exchange", "rk", message)
+        connection_mock().is_open = False
+        self.pool.publish_message("exchange", "rk", message)
+        self.assertEqual(connection_mock.call_count, 3)
+
+    @mock.patch.object(pika, "BlockingConnection")
+    def test_publish_retried_on_connection_closed(self, connection_mock):
+        """
+        Tests that message is published again via new connection if broker
+        closed connection during publication
+        """
+        message = mock.MagicMock()
+        channel = connection_mock().channel()
+        channel.basic_publish.side_effect = [
+            pika.exceptions.ConnectionClosed(), None]
+        self.pool.publish_message("exchange", "rk", message)
+        self.assertEqual(channel.basic_publish.call_count, 2)
+
+    @mock.patch.object(pika, "BlockingConnection")
+    def test_close_connection_closes_idle_writers(self, connection_mock):
+        """
+        Tests that pool closes connections of all idle writers
+        """
+        self.pool.publish_message("exchange", "rk", mock.MagicMock())
+        self.pool.close_connection()
+        connection_mock().close.assert_called_once_with()
+        self.assertEqual(self.pool._created, 0)
+
+    @mock.patch.object(pika, "BlockingConnection")
+    def test_busy_writer_is_closed_on_release(self, connection_mock):
+        """
+        Tests that writer used by another thread while pool is closed is
+        closed when it is released and is not reused
+        """
+        busy = self.pool._acquire()
+        busy.ensure_connection()
+        self.pool.close_connection()
+        self.assertFalse(connection_mock().close.called)
+
+        self.pool._release(busy)
+        connection_mock().close.assert_called_once_with()
+        self.assertEqual(self.pool._created, 0)
+        self.assertEqual(self.pool._writers, {})
+        self.assertIsNot(self.pool._acquire(), busy)
+
+    @mock.patch.object(pika, "BlockingConnection")
+    def test_publish_messages_via_one_writer(self, connection_mock):
+        """
+        Tests that batch of messages is published via one connection
+        """
+        message = mock.MagicMock()
+        self.pool.publish_messages([("exchange", "rk", message),
+                                    ("exchange", "rk", message)])
+        self.assertEqual(connection_mock.call_count, 1)
+        self.assertEqual(
+            connection_mock().channel().basic_publish.call_count, 2)
+        self.assertEqual(self.pool._created, 1)
+
+
+class ReaderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(ReaderTestCase, self).setUp()
+        self.credentials = config.Credentials("user", "password")
+        self.preprocessor = mock.MagicMock()
+
+    def _reader(self, **kwargs):
+        conf = config.ConnectionConfig("host", self.credentials, **kwargs)
+        return pika_sync.Reader(conf, "queue", self.preprocessor)
+
+    @mock.patch.object(pika, "BlockingConnection")
+    def test_prefetch_count_is_set(self, connection_mock):
+        """
+        Tests that reader sets prefetch count on channel
+        """
+        reader = self._reader(prefetch_count=10)
+        reader.connect()
+        connection_mock().channel().basic_qos.assert_called_once_with(
+            prefetch_count=10)
+
+    @mock.patch.object(pika, "BlockingConnection")
+    def test_no_prefetch_count_by_default(self, connection_mock):
+        """
+        Tests that reader doesn't limit prefetch count by default
+        """
+        reader = self._reader()
+        reader.connect()
+        self.assertFalse(connection_mock().channel().basic_qos.called)
+        self.assertFalse(reader.concurrent)
+
+    @mock.patch.object(pika, "BlockingConnection")
+    def test_reply_reader_declares_exclusive_queue(self, connection_mock):
+        """
+        Tests that reply reader declares its queue once on its own
+        connection as exclusive and auto-delete
+        """
+        conf = config.ConnectionConfig("host", self.credentials,
+                                       handler_workers=2)
+        reader = pika_sync.ReplyReader(conf, "replies", self.preprocessor)
+        reader.connect()
+        reader.connect()
+        connection_mock().channel().queue_declare.assert_called_once_with(
+            queue="replies", exclusive=True, auto_delete=True, durable=False)
+        self.assertFalse(reader.concurrent)
+
+    def test_message_is_submitted_to_workers(self):
+        """
+        Tests that in concurrent mode message is passed to executor and is
+        acked after handling in connection thread
+        """
+        reader = self._reader(handler_workers=2)
+        reader._channel = mock.MagicMock()
+        reader._executor = mock.MagicMock()
+        msg, frame = mock.MagicMock(), mock.MagicMock()
+
+        reader._on_message(msg, frame)
+        reader._executor.submit.assert_called_once_with(msg, frame)
+        self.assertFalse(reader._channel.basic_ack.called)
+
+        reader._executor.completed.return_value = [(frame, None)]
+        reader._finish_completed()
+        reader._channel.basic_ack.assert_called_once_with(frame.delivery_tag)
+
+    def test_nackable_error_rejects_message(self):
+        """
+        Tests that message is rejected if worker raised nackable exception
+        """
+        reader = self._reader(handler_workers=2)
+        reader._channel = mock.MagicMock()
+        reader._executor = mock.MagicMock()
+        frame = mock.MagicMock()
+        error = exceptions.BaseNackableException()
+        reader._executor.completed.return_value = [(frame, error)]
+
+        reader._finish_completed()
+
+        reader._channel.basic_reject.assert_called_once_with(
+            frame.delivery_tag)
+
+    def test_stop_request_drains_consumer(self):
+        """
+        Tests that after stop request consumer is cancelled, messages handled
+        by workers are acked and connection is closed
+        """
+        reader = self._reader(handler_workers=2)
+        reader._connection = mock.MagicMock()
+        reader._channel = mock.MagicMock()
+        reader._executor = mock.MagicMock()
+        frame = mock.MagicMock()
+        reader._executor.completed.return_value = [(frame, None)]
+        reader._channel.consume.return_value = iter([None, None])
+
+        reader.request_stop()
+        reader.run()
+
+        reader._channel.cancel.assert_called_once_with()
+        reader._executor.stop.assert_called_once_with()
+        reader._channel.basic_ack.assert_called_with(frame.delivery_tag)
+        reader._connection.close.assert_called_once_with()
@@ -0,0 +1,179 @@
+import threading
+import unittest
+
+import mock
+
+from tavrida import client
+from tavrida import exceptions
+from tavrida import postprocessor
+
+
+class RPCBatchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(RPCBatchTestCase, self).setUp()
+        self.config = mock.MagicMock()
+        self.config.serializer = "json"
+        self.discovery = mock.MagicMock()
+        self.client = client.RPCClient(self.config, self.discovery,
+                                       source="src")
+
+    @mock.patch.object(postprocessor.PostProcessor, "process_batch")
+    @mock.patch.object(client.RPCClient, "_get_driver")
+    def test_batch_publishes_calls_on_exit(self, driver_mock, batch_mock):
+        """
+        Tests that calls made in batch context are published together on
+        exit
+        """
+        with self.client.batch(max_size=10) as batch:
+            batch.some_service.some_method(param=1).cast()
+            batch.some_service.some_method(param=2).cast()
+            self.assertFalse(batch_mock.called)
+
+        self.assertEqual(batch_mock.call_count, 1)
+        requests = batch_mock.call_args[0][0]
+        self.assertEqual([r.payload for r in requests],
+                         [{"param": 1}, {"param": 2}])
+
+    @mock.patch.object(postprocessor.PostProcessor, "process_batch")
+    @mock.patch.object(client.RPCClient, "_get_driver")
+    def test_batch_is_discarded_on_exception(self, driver_mock, batch_mock):
+        """
+        Tests that collected calls are not published if context exits by
+        exception
+        """
+        def make_calls():
+            with self.client.batch() as batch:
+                batch.some_service.some_method(param=1).cast()
+                raise ValueError()
+
+        self.assertRaises(ValueError, make_calls)
+        self.assertFalse(batch_mock.called)
+
+
+class RPCClientTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(RPCClientTestCase, self).setUp()
+        self.config = mock.MagicMock()
+        self.config.serializer = "json"
+        self.discovery = mock.MagicMock()
+        driver_patcher = mock.patch.object(client.RPCClient, "_get_driver")
+        self.driver_mock = driver_patcher.start()
+        self.addCleanup(driver_patcher.stop)
+
+    @mock.patch.object(postprocessor.PostProcessor, "process")
+    def test_driver_and_proxies_are_reused(self, process_mock):
+        """
+        Tests that driver and service proxies are created once for all calls
+        """
+        cli = client.RPCClient(self.config, self.discovery, source="src")
+        cli.some_service.some_method(param=1).cast()
+        cli.some_service.some_method(param=2).cast()
+        cli.other_service.some_method(param=3).cast()
+
+        self.assertEqual(self.driver_mock.call_count, 1)
+        self.assertIs(cli.some_service, cli.some_service)
+        self.assertIs(cli.some_service.some_method,
+                      cli.some_service.some_method)
+        self.assertEqual(process_mock.call_count, 3)
+        self.assertEqual(self.discovery.get_remote.call_count, 2)
+
+    def test_private_attributes_are_not_proxied(self):
+        """
+        Tests that lookup of missing private attribute doesn't make service
+        proxy
+        """
+        cli = client.RPCClient(self.config, self.discovery, source="src")
+        self.assertRaises(AttributeError, getattr, cli, "_missing")
+        self.assertFalse(self.driver_mock.called)
+
+    @mock.patch.object(postprocessor.PostProcessor, "process")
+    def test_thread_safe_client_uses_driver_per_thread(self, process_mock):
+        """
+        Tests that every thread calls via its own driver and proxies
+        """
+        cli = client.ThreadSafeRPCClient(self.config, self.discovery,
+                                         source="src")
+        proxies = []
+
+        def call():
+            proxies.append(cli.some_service)
+            cli.some_service.some_method(param=1).cast()
+
+        threads = [threading.Thread(target=call) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        call()
+
+        self.assertEqual(self.driver_mock.call_count, 3)
+        self.assertEqual(len(set(map(id, proxies))), 3)
+        self.assertEqual(process_mock.call_count, 3)
+
+
+class BlockingRPCClientTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(BlockingRPCClientTestCase, self).setUp()
+        self.config = mock.MagicMock()
+        self.config.serializer = "json"
+        self.discovery = mock.MagicMock()
+        driver_patcher = mock.patch.object(client.driver, "AMQPDriver")
+        self.driver = driver_patcher.start()()
+        self.addCleanup(driver_patcher.stop)
+        self.client = client.BlockingRPCClient(self.config, self.discovery,
+                                               source="src", timeout=0.01)
+        self.addCleanup(self.client.close)
+
+    def test_reply_queue_is_consumed(self):
+        """
+        Tests that client starts to consume its own reply queue
+        """
+        self.assertTrue(
+            self.client.reply_queue.startswith(
+                client.BlockingRPCClient.REPLY_QUEUE_PREFIX))
+        self.driver.create_reply_reader.assert_called_once_with(
+            self.client.reply_queue, self.client._consumer)
+        self.driver.create_reply_reader().connect.assert_called_once_with()
+
+    @mock.patch.object(postprocessor.PostProcessor, "process")
+    def test_call_returns_response_payload(self, process_mock):
+        """
+        Tests that request carries reply queue and call returns payload of
+        response
+        """
+        def respond(request):
+            self.client._consumer._futures[request.request_id].set_result(
+                {"result": 1})
+
+        process_mock.side_effect = respond
+        result = self.client.some_service.some_method(param=1).call()
+
+        self.assertEqual(result, {"result": 1})
+        request = process_mock.call_args[0][0]
+        self.assertEqual(request.headers["reply_queue"],
+                         self.client.reply_queue)
+
+    @mock.patch.object(postprocessor.PostProcessor, "process")
+    def test_call_timeout(self, process_mock):
+        """
+        Tests that ReplyTimeout is raised and request is forgotten if there
+        is no response in timeout
+        """
+        call = self.client.some_service.some_method(param=1)
+        self.assertRaises(exceptions.ReplyTimeout, call.call)
+        self.assertEqual(self.client._consumer.pending_count, 0)
+
+    @mock.patch.object(postprocessor.PostProcessor, "process")
+    def test_concurrent_calls_share_consumer(self, process_mock):
+        """
+        Tests that futures of several calls are resolved independently
+        """
+        first = self.client.some_service.some_method(param=1).call_async()
+        second = self.client.some_service.some_method(param=2).call_async()
+        self.assertEqual(self.client._consumer.pending_count, 2)
+        second.set_result({"param": 2})
+        self.assertFalse(first.done())
+        self.assertEqual(second.result(0), {"param": 2})
@@ -20,3 +20,33 @@ class ConnectionConfigTestCase(unittest.TestCase):
         self.assertEqual((lambda: isinstance(res,
                                              pika.ConnectionParameters))(),
                          True)
+
+    def test_handlers_run_in_connection_thread_by_default(self):
+        """
+        Tests that there are no handler workers and prefetch is unlimited
+        by default
+        """
+        self.assertEqual(self.config.get_handler_workers(), 0)
+        self.assertIsNone(self.config.get_prefetch_count())
+
+    def test_background_heartbeats_use_one_worker(self):
+        """
+        Tests that with background heartbeats messages are handled by one
+        worker if workers are not set
+        """
+        conf = config.ConnectionConfig(self.host, self.credentials,
+                                       background_heartbeats=True)
+        self.assertEqual(conf.get_handler_workers(), 1)
+        self.assertEqual(conf.get_prefetch_count(), 2)
+        conf.handler_workers = 4
+        self.assertEqual(conf.get_handler_workers(), 4)
+
+    def test_background_heartbeats_are_not_passed_to_pika(self):
+        """
+        Tests that tavrida parameters are not passed to pika
+        """
+        conf = config.ConnectionConfig(self.host, self.credentials,
+                                       heartbeat_interval=10,
+                                       background_heartbeats=True)
+        params = conf.to_pika_params()
+        self.assertEqual(params.heartbeat, 10)
@@ -101,6 +101,28 @@ class DispatcherTestCase(unittest.TestCase):
                           self.dispatcher.get_handler,
                           ep, message_type)
 
+    def test_resolve_handler_for_response(self):
+        """
+        Tests that handler of response is resolved by source entry point
+        """
+        ep = entry_point.EntryPoint("service", "method")
+        self.dispatcher.register(ep, "response", "on_response")
+        message = mock.MagicMock(spec=messages.IncomingResponse)
+        message.type = "response"
+        message.source = ep
+        self.assertEqual(self.dispatcher._resolve_handler(message),
+                         "on_response")
+
+    def test_resolve_handler_for_unregistered_entry_point(self):
+        """
+        Tests that resolving handler for unregistered entry point fails
+        """
+        message = mock.MagicMock(spec=messages.IncomingRequest)
+        message.type = "request"
+        message.destination = entry_point.EntryPoint("service", "method")
+        self.assertRaises(exceptions.HandlerNotFound,
+                          self.dispatcher._resolve_handler, message)
+
     def test_get_publishers(self):
         """
         Tests entry points for publishers
@@ -1,5 +1,7 @@
 import unittest
 
+import mock
+
 from tavrida import entry_point
 
 
@@ -42,6 +44,36 @@ class EntryPointFactoryTestCase(unittest.TestCase):
         self.assertEqual(res.service, "service")
         self.assertIsNone(res.method)
 
+    def test_entry_points_are_cached(self):
+        """
+        Tests that factory returns the same object for the same string and
+        kind of entry point
+        """
+        src = self.ep_factory.create("service.method", source=True)
+        self.assertIs(self.ep_factory.create("service.method", source=True),
+                      src)
+        dst = self.ep_factory.create("service.method", destination=True)
+        self.assertIsInstance(dst, entry_point.Destination)
+        self.assertIsNot(dst, src)
+
+    def test_cache_is_bounded(self):
+        """
+        Tests that cache is cleared when it reaches maximal size
+        """
+        with mock.patch.object(entry_point.EntryPointFactory, "CACHE_SIZE",
+                               2):
+            self.ep_factory.create("service.first")
+            self.ep_factory.create("service.second")
+            self.ep_factory.create("service.third")
+            self.assertLessEqual(len(entry_point.EntryPointFactory._cache), 2)
+
+    def test_entry_point_has_no_dict(self):
+        """
+        Tests that entry points don't allocate instance dict
+        """
+        ep = self.ep_factory.create("service.method", source=True)
+        self.assertFalse(hasattr(ep, "__dict__"))
+
 
 class NullEntryPointTestCase(unittest.TestCase):
 
@@ -0,0 +1,210 @@
+import unittest
+
+import mock
+
+from tavrida import instrumentation
+from tavrida import messages
+from tavrida import postprocessor
+from tavrida import preprocessor
+from tavrida import service
+from tavrida import utils
+
+
+class RecordingObserver(instrumentation.Observer):
+
+    def __init__(self):
+        super(RecordingObserver, self).__init__()
+        self.events = []
+
+    def on_stage_start(self, stage, message):
+        self.events.append(("start", stage))
+
+    def on_stage_end(self, stage, message, duration, error=None):
+        self.events.append(("end", stage, error))
+
+    @property
+    def stages(self):
+        return [event[1] for event in self.events if event[0] == "end"]
+
+
+class ObserveTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(ObserveTestCase, self).setUp()
+        self.observer = RecordingObserver()
+
+    def _register(self, observer):
+        instrumentation.register_observer(observer)
+        self.addCleanup(instrumentation.unregister_observer, observer)
+
+    def test_no_observers(self):
+        """
+        Tests that stage is just called if there are no observers
+        """
+        func = mock.MagicMock()
+        res = instrumentation.observe("stage", "message", func, (1,),
+                                      {"message": 2})
+        func.assert_called_once_with(1, message=2)
+        self.assertEqual(res, func())
+        self.assertEqual(instrumentation.get_observers(), ())
+
+    def test_observer_gets_stage_duration(self):
+        """
+        Tests that observer is notified before and after stage with its
+        duration
+        """
+        observer = mock.MagicMock()
+        self._register(observer)
+        instrumentation.observe("stage", "message", lambda x: x, (1,))
+        observer.on_stage_start.assert_called_once_with("stage", "message")
+        args = observer.on_stage_end.call_args[0]
+        self.assertEqual(args[:2], ("stage", "message"))
+        self.assertGreaterEqual(args[2], 0)
+        self.assertIsNone(args[3])
+
+    def test_observer_gets_error(self):
+        """
+        Tests that exception of stage is passed to observer and raised
+        """
+        self._register(self.observer)
+        error = ValueError()
+
+        def fail():
+            raise error
+
+        self.assertRaises(ValueError, instrumentation.observe, "stage",
+                          "message", fail, ())
+        self.assertEqual(self.observer.events[-1], ("end", "stage", error))
+
+    def test_failed_observer_is_ignored(self):
+        """
+        Tests that exception of observer doesn't break processing
+        """
+        observer = mock.MagicMock()
+        observer.on_stage_start.side_effect = ValueError()
+        observer.on_stage_end.side_effect = ValueError()
+        self._register(observer)
+        self.assertEqual(
+            instrumentation.observe("stage", None, lambda: 1, ()), 1)
+
+    def test_observer_is_registered_once(self):
+        """
+        Tests that repeated registration doesn't duplicate notifications
+        """
+        self._register(self.observer)
+        self._register(self.observer)
+        self.assertEqual(instrumentation.get_observers(), (self.observer,))
+
+    def test_preprocessor_stages(self):
+        """
+        Tests that every step of preprocessor is observed inside processing
+        stage
+        """
+        self._register(self.observer)
+        router = mock.MagicMock()
+        preproc = preprocessor.PreProcessor(router, [])
+        for step in preproc._steps:
+            step.process = mock.MagicMock()
+        preproc.process(mock.MagicMock())
+        self.assertEqual(self.observer.stages,
+                         [instrumentation.VALIDATION,
+                          instrumentation.DECOMPRESSION,
+                          instrumentation.LOGGING,
+                          instrumentation.DESERIALIZATION,
+                          instrumentation.PROCESSING])
+
+    def test_postprocessor_stages(self):
+        """
+        Tests that serialization and publication are observed
+        """
+        self._register(self.observer)
+        postproc = postprocessor.PostProcessor(mock.MagicMock(),
+                                               mock.MagicMock())
+        for step in postproc._steps:
+            step.process = mock.MagicMock()
+        with mock.patch.object(postproc, "_get_destination",
+                               return_value=("exchange", "rk")):
+            postproc.process(mock.MagicMock())
+        self.assertEqual(self.observer.stages,
+                         [instrumentation.SERIALIZATION,
+                          instrumentation.VALIDATION,
+                          instrumentation.LOGGING,
+                          instrumentation.PUBLISH])
+
+    def test_handler_stage(self):
+        """
+        Tests that middlewares and handler call are observed and payload
+        parameters don't clash with stage arguments
+        """
+        self._register(self.observer)
+        controller = service.ServiceController(mock.MagicMock())
+        controller.method = mock.MagicMock()
+        notification = mock.MagicMock(spec=messages.IncomingNotification)
+        notification.payload = {"message": "value", "stage": 1}
+
+        controller.process("method", notification, mock.MagicMock())
+
+        controller.method.assert_called_once_with(
+            notification, mock.ANY, message="value", stage=1)
+        self.assertEqual(self.observer.stages,
+                         [instrumentation.INCOMING_MIDDLEWARES,
+                          instrumentation.HANDLER])
+
+
+@unittest.skipIf(utils.asyncio is None, "asyncio is not available")
+class ObserveAwaitableTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(ObserveAwaitableTestCase, self).setUp()
+        self.observer = RecordingObserver()
+        instrumentation.register_observer(self.observer)
+        self.addCleanup(instrumentation.unregister_observer, self.observer)
+        self.loop = utils.asyncio.get_event_loop()
+
+    def _handle(self, error=None):
+        @utils.asyncio.coroutine
+        def handler(notification, proxy):
+            self.observer.events.append(("awaited",))
+            yield utils.asyncio.From(utils.asyncio.sleep(0.01,
+                                                         loop=self.loop))
+            if error:
+                raise error
+        controller = service.ServiceController(mock.MagicMock())
+        controller.method = handler
+        notification = mock.MagicMock(spec=messages.IncomingNotification)
+        notification.payload = {}
+        return controller.process("method", notification, mock.MagicMock())
+
+    def test_handler_stage_ends_when_coroutine_is_done(self):
+        """
+        Tests that handler stage of coroutine handler covers coroutine
+        execution
+        """
+        future = self._handle()
+        self.assertEqual(self.observer.stages,
+                         [instrumentation.INCOMING_MIDDLEWARES])
+        self.loop.run_until_complete(future)
+        self.assertEqual(self.observer.events[-2:],
+                         [("awaited",),
+                          ("end", instrumentation.HANDLER, None)])
+
+    def test_handler_stage_gets_coroutine_error(self):
+        """
+        Tests that exception raised by coroutine is reported as stage error
+        """
+        error = ValueError()
+        future = self._handle(error)
+        self.assertRaises(ValueError, self.loop.run_until_complete, future)
+        self.assertEqual(self.observer.events[-1],
+                         ("end", instrumentation.HANDLER, error))
+
+    def test_sync_result_ends_stage_immediately(self):
+        """
+        Tests that stage of func that doesn't return awaitable ends at once
+        """
+        result = instrumentation.observe_awaitable(
+            instrumentation.HANDLER, None, lambda: 1, ())
+        self.assertEqual(result, 1)
+        self.assertEqual(self.observer.events,
+                         [("start", instrumentation.HANDLER),
+                          ("end", instrumentation.HANDLER, None)])
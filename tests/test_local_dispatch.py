@@ -0,0 +1,155 @@
+import unittest
+
+import mock
+
+from tavrida import exceptions
+from tavrida import instrumentation
+from tavrida import local_dispatch
+from tavrida import messages
+from tavrida import timings
+
+
+class LocalDispatcherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(LocalDispatcherTestCase, self).setUp()
+        self.routing_table = mock.MagicMock()
+        self.preprocessor = mock.MagicMock()
+        self.local = local_dispatch.LocalDispatcher()
+        self.local.bind(self.routing_table, self.preprocessor)
+        headers = {
+            "source": "src_service.src_method",
+            "destination": "dst_service.dst_method",
+            "reply_to": "src_service.on_method",
+            "correlation_id": "123",
+            "request_id": "456",
+            "message_id": "789",
+            "message_type": "request"
+        }
+        self.message = messages.Request(headers, {"key": "value"},
+                                        {"param": ["value"]})
+        self.local_message = messages.LocalAMQPMessage.create_from_message(
+            self.message)
+
+    def test_message_is_not_serialized(self):
+        """
+        Tests that local message carries copies of payload and context
+        """
+        self.local.dispatch(self.local_message)
+        amqp_message = self.preprocessor.process.call_args[0][0]
+        self.assertIsInstance(amqp_message, messages.LocalAMQPMessage)
+        body = amqp_message.body_deserialize()
+        self.assertEqual(body, {"payload": {"param": ["value"]},
+                                "context": {"key": "value"}})
+        self.assertIsNot(body["payload"]["param"],
+                         self.message.payload["param"])
+        self.assertIn(timings.RECEIVED_AT, amqp_message.headers)
+        headers = dict(amqp_message.headers)
+        del headers[timings.RECEIVED_AT]
+        self.assertEqual(headers, self.message.headers)
+        self.assertIsNot(amqp_message.headers, self.message.headers)
+
+    def test_local_delivery_is_observed_as_publish(self):
+        """
+        Tests that putting of message to local queue is observed as
+        publish stage
+        """
+        observer = mock.MagicMock()
+        instrumentation.register_observer(observer)
+        self.addCleanup(instrumentation.unregister_observer, observer)
+        self.local.dispatch(self.local_message)
+        amqp_message = self.preprocessor.process.call_args[0][0]
+        observer.on_stage_start.assert_called_once_with(
+            instrumentation.PUBLISH, amqp_message)
+
+    def test_incoming_message_is_created(self):
+        """
+        Tests that local message is turned into incoming message by
+        preprocessor steps
+        """
+        amqp_message = messages.LocalAMQPMessage.create_from_message(
+            self.message)
+        amqp_message.validate()
+        incoming = messages.IncomingMessageFactory().create(amqp_message)
+        self.assertIsInstance(incoming, messages.IncomingRequestCall)
+        self.assertEqual(incoming.payload, {"param": ["value"]})
+        self.assertEqual(incoming.context, {"key": "value"})
+
+    def test_messages_sent_by_handler_are_handled_after_it(self):
+        """
+        Tests that message sent during handling is processed after the
+        handler returns
+        """
+        calls = []
+
+        def process(amqp_message):
+            calls.append(amqp_message)
+            if len(calls) == 1:
+                self.local.dispatch(self.local_message)
+                self.assertEqual(len(calls), 1)
+            return "result"
+
+        self.preprocessor.process.side_effect = process
+        received = mock.MagicMock()
+        self.assertEqual(self.local.process(received), "result")
+        self.assertEqual(len(calls), 2)
+        self.assertIs(calls[0], received)
+
+    def test_local_error_does_not_fail_received_message(self):
+        """
+        Tests that error of local message handling is not raised to reader
+        """
+        def process(amqp_message):
+            if isinstance(amqp_message, messages.LocalAMQPMessage):
+                raise ValueError()
+            self.local.dispatch(self.local_message)
+
+        self.preprocessor.process.side_effect = process
+        self.local.process(mock.MagicMock())
+        self.assertEqual(self.preprocessor.process.call_count, 2)
+
+    def test_nacked_local_message_is_sent_via_broker(self):
+        """
+        Tests that local message rejected with NackableException is sent
+        by fallback and doesn't fail received message
+        """
+        fallback = mock.MagicMock()
+
+        def process(amqp_message):
+            if isinstance(amqp_message, messages.LocalAMQPMessage):
+                raise exceptions.BaseNackableException()
+            self.local.dispatch(self.local_message, fallback)
+            return "result"
+
+        self.preprocessor.process.side_effect = process
+        self.assertEqual(self.local.process(mock.MagicMock()), "result")
+        fallback.assert_called_once_with()
+
+    def test_fallback_is_not_called_on_other_errors(self):
+        """
+        Tests that local message that failed with ackable error is only
+        logged
+        """
+        fallback = mock.MagicMock()
+        self.preprocessor.process.side_effect = exceptions.HandlerNotFound(
+            entry_point="dst_service.dst_method", message_type="request")
+        self.local.dispatch(self.local_message, fallback)
+        self.assertFalse(fallback.called)
+
+    def test_is_local_uses_routing_table(self):
+        """
+        Tests that locality of message is checked by routing table
+        """
+        self.routing_table.is_local.return_value = False
+        self.assertFalse(self.local.is_local(self.message))
+        self.routing_table.is_local.assert_called_once_with(self.message)
+
+    def test_reply_to_client_queue_is_not_local(self):
+        """
+        Tests that response to blocking client is always sent to its reply
+        queue
+        """
+        self.routing_table.is_local.return_value = True
+        response = messages.Response.create_by_request(self.message, {})
+        response.headers["reply_queue"] = "tavrida_reply_123"
+        self.assertFalse(self.local.is_local(response))
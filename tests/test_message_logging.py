@@ -0,0 +1,191 @@
+import json
+import unittest
+
+import mock
+
+from tavrida import message_logging
+from tavrida import messages
+from tavrida import preprocessor
+from tavrida import steps
+
+
+class MessageLogTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(MessageLogTestCase, self).setUp()
+        self.headers = {
+            "source": "src_service.src_method",
+            "destination": "dst_service.dst_method",
+            "reply_to": "src_service.on_method",
+            "correlation_id": "123",
+            "message_id": "789",
+            "request_id": "456",
+            "message_type": "request",
+            "Authorization": "secret"
+        }
+        self.message = messages.AMQPMessage('{"payload": {}}', self.headers)
+
+    def _get_records(self, message_log):
+        records = []
+        while not message_log._queue.empty():
+            records.append(message_log._queue.get_nowait())
+        return records
+
+    def test_hide_sensitive_data(self):
+        """
+        Tests that sensitive headers are hidden regardless of case and
+        original headers are not changed
+        """
+        self.assertEqual(
+            message_logging.hide_sensitive_data(self.headers)[
+                "Authorization"], "<authorization>")
+        self.assertEqual(self.headers["Authorization"], "secret")
+
+    def test_sample_rate_by_entry_point(self):
+        """
+        Tests that rate of entry point takes precedence over rate of service
+        and default rate
+        """
+        message_log = message_logging.MessageLog(
+            sample_rates={"dst_service": 0.5, "dst_service.other": 0},
+            default_rate=1)
+        self.assertEqual(message_log.get_sample_rate("dst_service.method"),
+                         0.5)
+        self.assertEqual(message_log.get_sample_rate("dst_service.other"), 0)
+        self.assertEqual(message_log.get_sample_rate("service.method"), 1)
+
+    def test_not_sampled_message_is_not_queued(self):
+        """
+        Tests that message with zero rate is skipped
+        """
+        message_log = message_logging.MessageLog(
+            sample_rates={"dst_service.dst_method": 0})
+        message_log.log_message(message_logging.INCOMING, self.message)
+        self.assertEqual(self._get_records(message_log), [])
+
+    @mock.patch("random.random", return_value=0.3)
+    def test_partial_sampling(self, random_mock):
+        """
+        Tests that message is logged with probability of its rate
+        """
+        message_log = message_logging.MessageLog(default_rate=0.5)
+        message_log.log_message(message_logging.INCOMING, self.message)
+        random_mock.return_value = 0.7
+        message_log.log_message(message_logging.INCOMING, self.message)
+        self.assertEqual(len(self._get_records(message_log)), 1)
+
+    def test_full_queue_drops_records(self):
+        """
+        Tests that logging doesn't block when queue is full
+        """
+        message_log = message_logging.MessageLog(queue_size=1)
+        message_log.log_message(message_logging.INCOMING, self.message)
+        message_log.log_message(message_logging.INCOMING, self.message)
+        self.assertEqual(message_log.dropped, 1)
+
+    def test_headers_are_copied(self):
+        """
+        Tests that queued record is not affected by later changes of headers
+        """
+        message_log = message_logging.MessageLog()
+        message_log.log_message(message_logging.OUTGOING, self.message)
+        self.headers["correlation_id"] = "changed"
+        direction, entry_point, headers, body, body_size = \
+            self._get_records(message_log)[0]
+        self.assertEqual(direction, message_logging.OUTGOING)
+        self.assertEqual(entry_point, "dst_service.dst_method")
+        self.assertEqual(headers["correlation_id"], "123")
+
+    def test_record_format(self):
+        """
+        Tests that record is JSON with hidden headers and truncated body
+        """
+        message_log = message_logging.MessageLog(max_body_size=5)
+        record = json.loads(message_log.format_record(
+            message_logging.INCOMING, "dst_service.dst_method",
+            self.headers, "0123456789", 10))
+        self.assertEqual(record["body"], "01234")
+        self.assertTrue(record["truncated"])
+        self.assertEqual(record["body_size"], 10)
+        self.assertEqual(record["headers"]["Authorization"],
+                         "<authorization>")
+        self.assertEqual(record["direction"], message_logging.INCOMING)
+
+    def test_local_message_body(self):
+        """
+        Tests that not serialized body of local message is formatted before
+        handler could change it
+        """
+        message_log = message_logging.MessageLog()
+        body = {"payload": {}}
+        message_log.log_message(
+            message_logging.INCOMING,
+            messages.LocalAMQPMessage(body, self.headers))
+        body["payload"]["changed"] = True
+        record = json.loads(message_log.format_record(
+            *self._get_records(message_log)[0]))
+        self.assertEqual(record["body"], "{'payload': {}}")
+        self.assertIsNone(record["body_size"])
+        self.assertFalse(record["truncated"])
+
+    def test_preprocessor_logs_wire_body(self):
+        """
+        Tests that preprocessor logs raw body of received message, not its
+        deserialized payload
+        """
+        body = '{"payload": {"k": "v"}, "context": {}}'
+        message_log = message_logging.MessageLog()
+        router = mock.MagicMock()
+        preproc = preprocessor.PreProcessor(router, [])
+        with mock.patch.object(message_logging, "_message_log", message_log):
+            preproc.process(messages.AMQPMessage(body, self.headers,
+                                                 "application/json"))
+        self.assertIsInstance(router.process.call_args[0][0],
+                              messages.IncomingRequestCall)
+        record = json.loads(message_log.format_record(
+            *self._get_records(message_log)[0]))
+        self.assertEqual(record["body"], body)
+        self.assertEqual(record["body_size"], len(body))
+        self.assertEqual(record["entry_point"], "dst_service.dst_method")
+
+    def test_records_are_written_in_background(self):
+        """
+        Tests that queued records are written to log before stop
+        """
+        message_log = message_logging.MessageLog()
+        with mock.patch.object(message_log, "_records_log") as log_mock:
+            message_logging.enable(message_log)
+            self.assertIs(message_logging.get_message_log(), message_log)
+            message_log.log_message(message_logging.INCOMING, self.message)
+            message_logging.disable()
+        self.assertIsNone(message_logging.get_message_log())
+        record = json.loads(log_mock.info.call_args[0][0])
+        self.assertEqual(record["body"], '{"payload": {}}')
+
+
+class LogMiddlewareTestCase(unittest.TestCase):
+
+    def test_message_log_is_used_if_enabled(self):
+        """
+        Tests that logging steps pass messages to message log of process
+        """
+        message_log = mock.MagicMock()
+        message = mock.MagicMock()
+        with mock.patch.object(message_logging, "_message_log", message_log):
+            steps.LogIncomingAMQPMessageMiddleware().process(message)
+            steps.LogOutgoingAMQPMessageMiddleware().process(message)
+        self.assertEqual(message_log.log_message.call_args_list,
+                         [mock.call(message_logging.INCOMING, message),
+                          mock.call(message_logging.OUTGOING, message)])
+
+    @mock.patch("logging.getLogger")
+    def test_debug_is_disabled(self, get_logger):
+        """
+        Tests that message is not formatted if debug logging is disabled
+        """
+        get_logger.return_value.isEnabledFor.return_value = False
+        middleware = steps.LogIncomingAMQPMessageMiddleware()
+        with mock.patch.object(middleware, "_hide_sensitive_data") as hide:
+            middleware.process(mock.MagicMock())
+        self.assertFalse(hide.called)
+        self.assertFalse(get_logger.return_value.debug.called)
@@ -0,0 +1,129 @@
+import unittest
+
+import mock
+
+from tavrida import entry_point
+from tavrida import messages
+
+
+class LazyMessageTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(LazyMessageTestCase, self).setUp()
+        self.headers = {
+            "source": "src_service.src_method",
+            "destination": "dst_service.dst_method",
+            "reply_to": "rpl_service.rpl_method",
+            "correlation_id": "123",
+            "request_id": "456",
+            "message_id": "789",
+            "message_type": "request"
+        }
+        self.amqp_message = mock.MagicMock()
+        self.amqp_message.headers = self.headers
+        self.amqp_message.body_deserialize.return_value = {
+            "payload": {"param": "value"},
+            "context": {"key": "value"}
+        }
+
+    def test_routing_does_not_decode_body(self):
+        """
+        Tests that entry points of incoming message are available without
+        body deserialization
+        """
+        message = messages.IncomingMessageFactory().create(self.amqp_message)
+        self.assertIsInstance(message, messages.IncomingRequestCall)
+        self.assertEqual(message.destination,
+                         entry_point.EntryPoint("dst_service", "dst_method"))
+        self.assertEqual(message.source.service, "src_service")
+        self.assertFalse(self.amqp_message.body_deserialize.called)
+
+    def test_body_is_decoded_once(self):
+        """
+        Tests that payload and context are deserialized on first access
+        """
+        message = messages.IncomingMessageFactory().create(self.amqp_message)
+        self.assertEqual(message.payload, {"param": "value"})
+        self.assertEqual(message.context, {"key": "value"})
+        self.amqp_message.body_deserialize.assert_called_once_with()
+
+    def test_context_update_before_decoding(self):
+        """
+        Tests that context updated before deserialization overrides context
+        of body
+        """
+        message = messages.IncomingMessageFactory().create(self.amqp_message)
+        message.update_context({"key": "new", "other": 1})
+        self.assertEqual(message.context, {"key": "new", "other": 1})
+
+    def test_payload_is_merged_to_context_lazily(self):
+        """
+        Tests that payload is merged to context without deserialization and
+        context updates made after the merge take precedence over payload
+        """
+        message = messages.IncomingMessageFactory().create(self.amqp_message)
+        message.update_context({"param": "old", "other": 1})
+        message.update_context_by_payload()
+        message.update_context({"key": "new"})
+        self.assertFalse(self.amqp_message.body_deserialize.called)
+        self.assertEqual(message.context, {"key": "new", "param": "value",
+                                           "other": 1})
+        self.assertEqual(message.payload, {"param": "value"})
+
+    def test_payload_is_merged_to_context(self):
+        """
+        Tests that payload of deserialized message is merged to context
+        """
+        message = messages.IncomingMessageFactory().create(self.amqp_message)
+        self.assertEqual(message.payload, {"param": "value"})
+        message.update_context_by_payload()
+        self.assertEqual(message.context, {"key": "value", "param": "value"})
+
+    def test_wrong_source_is_detected_on_creation(self):
+        """
+        Tests that malformed source header is rejected before body
+        deserialization
+        """
+        self.headers["source"] = "src.service.src.method"
+        self.assertRaises(TypeError,
+                          messages.IncomingMessageFactory().create,
+                          self.amqp_message)
+        self.assertFalse(self.amqp_message.body_deserialize.called)
+
+    def test_wrong_payload_is_detected_on_access(self):
+        """
+        Tests that payload that is not dict raises error on access
+        """
+        self.amqp_message.body_deserialize.return_value = {
+            "payload": [], "context": {}}
+        message = messages.IncomingMessageFactory().create(self.amqp_message)
+        self.assertRaises(TypeError, getattr, message, "payload")
+
+
+class SlotsTestCase(unittest.TestCase):
+
+    def test_messages_have_no_dict(self):
+        """
+        Tests that messages don't allocate instance dict
+        """
+        headers = {
+            "source": "src_service.src_method",
+            "destination": "dst_service.dst_method",
+            "reply_to": "",
+            "correlation_id": "123",
+            "request_id": "456",
+            "message_id": "789",
+            "message_type": "request"
+        }
+        for cls in (messages.IncomingRequestCall, messages.IncomingResponse,
+                    messages.IncomingError, messages.IncomingNotification,
+                    messages.Request, messages.Response):
+            message = cls(headers, {}, {})
+            self.assertFalse(hasattr(message, "__dict__"), cls)
+
+    def test_amqp_message_has_no_dict(self):
+        """
+        Tests that AMQP message stores only body, headers and properties
+        """
+        message = messages.AMQPMessage("{}", {}, "application/json")
+        self.assertFalse(hasattr(message, "__dict__"))
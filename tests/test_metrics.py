@@ -0,0 +1,220 @@
+import urllib2
+import unittest
+
+import mock
+
+from tavrida import exceptions
+from tavrida import instrumentation
+from tavrida import messages
+from tavrida import metrics
+
+
+class HdrHistogramTestCase(unittest.TestCase):
+
+    def test_empty_histogram(self):
+        """
+        Tests that quantiles of empty histogram are zeros
+        """
+        histogram = metrics.HdrHistogram(1000)
+        self.assertEqual(histogram.get_quantiles([0.5, 0.99]), [0, 0])
+        self.assertEqual(histogram.count, 0)
+
+    def test_small_values_are_exact(self):
+        """
+        Tests that values below sub bucket count are recorded exactly
+        """
+        histogram = metrics.HdrHistogram(1000)
+        for value in range(1, 101):
+            histogram.record(value)
+        self.assertEqual(histogram.value_at_quantile(0.5), 50)
+        self.assertEqual(histogram.value_at_quantile(0.99), 99)
+        self.assertEqual(histogram.value_at_quantile(1), 100)
+        self.assertEqual(histogram.sum, 5050)
+        self.assertEqual(histogram.min, 1)
+        self.assertEqual(histogram.max, 100)
+
+    def test_relative_error_is_bounded(self):
+        """
+        Tests that large values are recorded with two significant figures
+        """
+        histogram = metrics.HdrHistogram(metrics.MAX_LATENCY)
+        for value in range(1, 100001):
+            histogram.record(value * 37)
+        for quantile in (0.5, 0.9, 0.99, 0.999):
+            expected = quantile * 100000 * 37
+            actual = histogram.value_at_quantile(quantile)
+            self.assertLess(abs(actual - expected) / expected, 0.01)
+
+    def test_values_are_clamped(self):
+        """
+        Tests that values out of range are recorded as range bounds
+        """
+        histogram = metrics.HdrHistogram(1000)
+        histogram.record(-5)
+        histogram.record(10 ** 9)
+        self.assertEqual(histogram.min, 0)
+        self.assertEqual(histogram.max, 1000)
+        self.assertEqual(histogram.value_at_quantile(1), 1000)
+
+
+class MetricsRegistryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(MetricsRegistryTestCase, self).setUp()
+        self.registry = metrics.MetricsRegistry()
+
+    def test_counter_is_rendered(self):
+        """
+        Tests that counter is rendered in Prometheus text format with
+        escaped labels
+        """
+        counter = self.registry.counter("requests_total", "Requests",
+                                        ["entry_point"])
+        counter.labels('a"b').inc()
+        counter.labels('a"b').inc(2)
+        self.assertEqual(self.registry.render(),
+                         '# HELP requests_total Requests\n'
+                         '# TYPE requests_total counter\n'
+                         'requests_total{entry_point="a\\"b"} 3\n')
+
+    def test_histogram_is_rendered_as_summary(self):
+        """
+        Tests that histogram is rendered as summary in exported units
+        """
+        histogram = self.registry.histogram("latency_seconds", "Latency",
+                                            ["entry_point"], divisor=1000)
+        histogram.labels("srv.method").record(20)
+        rendered = self.registry.render()
+        self.assertIn("# TYPE latency_seconds summary\n", rendered)
+        self.assertIn('latency_seconds{entry_point="srv.method",'
+                      'quantile="0.99"} 0.02\n', rendered)
+        self.assertIn('latency_seconds_sum{entry_point="srv.method"} 0.02\n',
+                      rendered)
+        self.assertIn('latency_seconds_count{entry_point="srv.method"} 1\n',
+                      rendered)
+
+    def test_wrong_labels(self):
+        """
+        Tests that child can't be created with wrong number of labels
+        """
+        counter = self.registry.counter("requests_total", "Requests",
+                                        ["entry_point"])
+        self.assertRaises(ValueError, counter.labels, "a", "b")
+
+    def test_duplicate_metric(self):
+        """
+        Tests that metric name can't be registered twice
+        """
+        self.registry.counter("requests_total", "Requests")
+        self.assertRaises(ValueError, self.registry.counter,
+                          "requests_total", "Requests")
+
+
+class MetricsObserverTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(MetricsObserverTestCase, self).setUp()
+        self.registry = metrics.MetricsRegistry()
+        self.observer = metrics.MetricsObserver(self.registry)
+        self.headers = {"message_type": "request",
+                        "source": "client.method",
+                        "destination": "srv.method"}
+
+    def _get(self, name, entry_point="srv.method"):
+        child = self.registry.get(name).labels(entry_point)
+        if isinstance(child, metrics.HdrHistogram):
+            return child.count
+        return child.value
+
+    def _process(self, amqp_message, error=None):
+        self.observer.on_stage_start(instrumentation.PROCESSING,
+                                     amqp_message)
+        message = mock.MagicMock()
+        message.headers = amqp_message.headers
+        self.observer.on_stage_start(instrumentation.HANDLER, message)
+        self.observer.on_stage_end(instrumentation.HANDLER, message, 0.002,
+                                   error)
+        self.observer.on_stage_end(instrumentation.PROCESSING, amqp_message,
+                                   0.003, error)
+
+    def test_handled_message(self):
+        """
+        Tests that handled message is counted and its latency and size are
+        recorded
+        """
+        self._process(messages.AMQPMessage("x" * 10, self.headers))
+        self.assertEqual(self._get("tavrida_messages_received_total"), 1)
+        self.assertEqual(self._get("tavrida_messages_handled_total"), 1)
+        self.assertEqual(self._get("tavrida_handler_errors_total"), 0)
+        handler = self.registry.get("tavrida_handler_seconds")
+        self.assertEqual(handler.labels("srv.method").max, 2000)
+        size = self.registry.get("tavrida_incoming_message_bytes")
+        self.assertEqual(size.labels("srv.method").sum, 10)
+        self.assertEqual(self._get("tavrida_processing_seconds"), 1)
+
+    def test_nacked_message(self):
+        """
+        Tests that handler error and nack are counted
+        """
+        class Nackable(Exception, exceptions.NackableException):
+            pass
+
+        self._process(messages.AMQPMessage("x", self.headers), Nackable())
+        self.assertEqual(self._get("tavrida_handler_errors_total"), 1)
+        self.assertEqual(self._get("tavrida_messages_nacked_total"), 1)
+        self.assertEqual(self._get("tavrida_messages_handled_total"), 0)
+
+    def test_notification_is_counted_by_source(self):
+        """
+        Tests that notification is counted by entry point of publisher
+        """
+        self.headers.update(message_type="notification", destination="")
+        self._process(messages.AMQPMessage("x", self.headers))
+        self.assertEqual(self._get("tavrida_messages_received_total",
+                                   "client.method"), 1)
+
+    def test_local_message_size_is_not_recorded(self):
+        """
+        Tests that size of message delivered locally is not recorded
+        """
+        self._process(messages.LocalAMQPMessage({}, self.headers))
+        self.assertEqual(self._get("tavrida_messages_received_total"), 1)
+        self.assertEqual(self._get("tavrida_incoming_message_bytes"), 0)
+
+    def test_outgoing_size(self):
+        """
+        Tests that size of published message is recorded by its source
+        """
+        message = messages.AMQPMessage("x" * 5, self.headers)
+        self.observer.on_stage_end(instrumentation.PUBLISH, message, 0.001)
+        self.observer.on_stage_end(instrumentation.PUBLISH, None, 0.001)
+        size = self.registry.get("tavrida_outgoing_message_bytes")
+        self.assertEqual(size.labels("client.method").sum, 5)
+
+
+class MetricsHTTPServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(MetricsHTTPServerTestCase, self).setUp()
+        self.registry = metrics.MetricsRegistry()
+        self.registry.counter("requests_total", "Requests").labels().inc()
+        self.server = metrics.MetricsHTTPServer(self.registry, 0)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+    def test_metrics_are_served(self):
+        """
+        Tests that metrics are served at /metrics in text format
+        """
+        response = urllib2.urlopen("http://127.0.0.1:%s/metrics" %
+                                   self.server.port)
+        self.assertEqual(response.info()["Content-Type"],
+                         metrics.CONTENT_TYPE)
+        self.assertEqual(response.read(), self.registry.render())
+
+    def test_unknown_path(self):
+        """
+        Tests that other paths are not found
+        """
+        self.assertRaises(urllib2.HTTPError, urllib2.urlopen,
+                          "http://127.0.0.1:%s/" % self.server.port)
@@ -3,6 +3,8 @@ import unittest
 import mock
 
 from tavrida import entry_point
+from tavrida import exceptions
+from tavrida import messages
 from tavrida import postprocessor
 from tavrida import steps
 
@@ -41,6 +43,104 @@ class PostprocessorTestCase(unittest.TestCase):
             step.process.assert_called_once_with(message)
         send_mock.assert_called_once_with(first_step.process())
 
+    @mock.patch.object(postprocessor.PostProcessor, "_send")
+    def test_local_message_is_not_serialized(self, send_mock):
+        """
+        Tests that message for local service is passed to local dispatcher
+        after local steps, bypassing serialization and driver
+        """
+        local = mock.MagicMock()
+        local.is_local.return_value = True
+        self.postprocessor._local_dispatcher = local
+        first_step = mock.MagicMock()
+        self.postprocessor._steps = [first_step]
+        local_step = mock.MagicMock()
+        local_step.process.return_value.headers = {}
+        self.postprocessor._local_steps = [local_step]
+        message = mock.MagicMock()
+
+        self.postprocessor.process(message)
+
+        local_step.process.assert_called_once_with(message)
+        local.dispatch.assert_called_once_with(local_step.process(),
+                                               mock.ANY)
+        self.assertFalse(first_step.process.called)
+        self.assertFalse(send_mock.called)
+
+    def test_local_steps_validate_and_log_message(self):
+        """
+        Tests that local message is validated and logged as outgoing one
+        """
+        self.assertEqual(
+            [type(step) for step in self.postprocessor._local_steps],
+            [steps.CreateLocalAMQPMiddleware,
+             steps.ValidateMessageMiddleware,
+             steps.LogOutgoingAMQPMessageMiddleware])
+
+    def test_invalid_local_message_is_not_dispatched(self):
+        """
+        Tests that local message with invalid headers is rejected before
+        dispatch, as message sent via broker
+        """
+        local = mock.MagicMock()
+        local.is_local.return_value = True
+        self.postprocessor._local_dispatcher = local
+        headers = {
+            "source": "src_service.src_method",
+            "destination": "dst_service.dst_method",
+            "reply_to": "",
+            "correlation_id": "123",
+            "request_id": "456",
+            "message_id": "789",
+            "message_type": "request"
+        }
+        message = messages.Request(headers, {}, {})
+        message.headers["message_type"] = "wrong"
+
+        self.assertRaises(exceptions.UnsuitableFieldValue,
+                          self.postprocessor.process, message)
+        self.assertFalse(local.dispatch.called)
+
+    @mock.patch.object(postprocessor.PostProcessor, "_send")
+    def test_local_fallback_sends_message_via_driver(self, send_mock):
+        """
+        Tests that fallback given to local dispatcher sends message via
+        regular steps and driver
+        """
+        local = mock.MagicMock()
+        local.is_local.return_value = True
+        self.postprocessor._local_dispatcher = local
+        first_step = mock.MagicMock()
+        self.postprocessor._steps = [first_step]
+        local_step = mock.MagicMock()
+        local_step.process.return_value.headers = {}
+        self.postprocessor._local_steps = [local_step]
+        message = mock.MagicMock()
+
+        self.postprocessor.process(message)
+        fallback = local.dispatch.call_args[0][1]
+        fallback()
+
+        first_step.process.assert_called_once_with(message)
+        send_mock.assert_called_once_with(first_step.process())
+
+    @mock.patch.object(postprocessor.PostProcessor, "_send")
+    def test_remote_message_is_sent_with_local_dispatcher(self, send_mock):
+        """
+        Tests that message for remote service is sent via driver if local
+        dispatcher is set
+        """
+        local = mock.MagicMock()
+        local.is_local.return_value = False
+        self.postprocessor._local_dispatcher = local
+        self.postprocessor._steps = []
+        message = mock.MagicMock()
+
+        self.postprocessor.process(message)
+
+        self.assertFalse(local.dispatch.called)
+        send_mock.assert_called_once_with(message)
+
     @mock.patch.object(entry_point, "EntryPointFactory")
     def test_send_notification(self, ep_factory):
         """
@@ -109,6 +209,24 @@ class PostprocessorTestCase(unittest.TestCase):
         self.driver.publish_message.assert_called_once_with(exchange, rk,
                                                             message)
 
+    def test_send_response_to_reply_queue(self):
+        """
+        Tests that response to request with reply queue is sent to the
+        queue via default exchange
+        """
+
+        message = mock.MagicMock()
+        message.headers = {
+            "message_type": "response",
+            "destination": "some_value",
+            "reply_queue": "tavrida_reply_123"
+        }
+        self.postprocessor._send(message)
+
+        self.assertFalse(self.discovery.get_remote.called)
+        self.driver.publish_message.assert_called_once_with(
+            "", "tavrida_reply_123", message)
+
     @mock.patch.object(entry_point, "EntryPointFactory")
     def test_send_request(self, ep_factory):
         """
@@ -131,3 +249,91 @@ class PostprocessorTestCase(unittest.TestCase):
         rk = ep.to_routing_key()
         self.driver.publish_message.assert_called_once_with(exchange, rk,
                                                             message)
+
+    @mock.patch.object(postprocessor.PostProcessor, "_get_destination")
+    def test_process_batch_publishes_all_messages_at_once(self, dst_mock):
+        """
+        Tests that all messages of batch are processed by steps and passed
+        to driver in one call
+        """
+        step = mock.MagicMock()
+        step.process.side_effect = lambda msg: msg
+        self.postprocessor._steps = [step]
+        dst_mock.return_value = ("exchange", "rk")
+        msgs = [mock.MagicMock(), mock.MagicMock()]
+
+        self.postprocessor.process_batch(msgs)
+
+        self.assertEqual(step.process.call_count, 2)
+        self.driver.publish_messages.assert_called_once_with(
+            [("exchange", "rk", msgs[0]), ("exchange", "rk", msgs[1])])
+        self.assertFalse(self.driver.publish_message.called)
+
+
+class CompressingPostprocessorTestCase(unittest.TestCase):
+
+    def test_compression_step_is_last(self):
+        """
+        Tests that compression step is added after logging if compressor is
+        given
+        """
+        postproc = postprocessor.PostProcessor(
+            mock.MagicMock(), mock.MagicMock(), compressor=mock.MagicMock(),
+            compression_threshold=1024)
+        self.assertIsInstance(postproc._steps[-1],
+                              steps.CompressMessageMiddleware)
+
+    def test_no_compression_by_default(self):
+        """
+        Tests that messages are not compressed by default
+        """
+        postproc = postprocessor.PostProcessor(mock.MagicMock(),
+                                               mock.MagicMock())
+        self.assertFalse(any(isinstance(step, steps.CompressMessageMiddleware)
+                             for step in postproc._steps))
+
+
+class BatchPostprocessorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(BatchPostprocessorTestCase, self).setUp()
+        self.postprocessor = mock.MagicMock()
+        self.batch = postprocessor.BatchPostProcessor(self.postprocessor,
+                                                      max_size=2,
+                                                      max_delay=None)
+
+    def test_flush_by_size(self):
+        """
+        Tests that batch is flushed when it reaches max size
+        """
+        msgs = [mock.MagicMock(), mock.MagicMock()]
+        self.batch.process(msgs[0])
+        self.assertFalse(self.postprocessor.process_batch.called)
+        self.batch.process(msgs[1])
+        self.postprocessor.process_batch.assert_called_once_with(msgs)
+        self.assertEqual(len(self.batch), 0)
+
+    @mock.patch.object(postprocessor.time, "time")
+    def test_flush_by_time(self, time_mock):
+        """
+        Tests that batch is flushed when the oldest message is older than
+        max delay
+        """
+        self.batch._max_size = 100
+        self.batch._max_delay = 1.0
+        msgs = [mock.MagicMock(), mock.MagicMock()]
+        time_mock.return_value = 10.0
+        self.batch.process(msgs[0])
+        self.assertFalse(self.postprocessor.process_batch.called)
+        time_mock.return_value = 11.5
+        self.batch.process(msgs[1])
+        self.postprocessor.process_batch.assert_called_once_with(msgs)
+
+    def test_discard(self):
+        """
+        Tests that discarded messages are not sent
+        """
+        self.batch.process(mock.MagicMock())
+        self.batch.discard()
+        self.batch.flush()
+        self.postprocessor.process_batch.assert_called_once_with([])
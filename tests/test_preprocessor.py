@@ -15,15 +15,20 @@ class PreprocessorTestCase(unittest.TestCase):
         self.preprocessor = preprocessor.PreProcessor(self.router,
                                                       self.service_list)
 
-    def test_first_two_steps_in_list(self):
+    def test_first_steps_in_list(self):
         """
-        Tests that the first step is ValidateMessageMiddleware and the second
-        is CreateMessageMiddleware
+        Tests that the first step is ValidateMessageMiddleware, the second
+        is DecompressMessageMiddleware, AMQP message is logged before
+        CreateMessageMiddleware
         """
 
         self.assertIsInstance(self.preprocessor._steps[0],
                               steps.ValidateMessageMiddleware)
         self.assertIsInstance(self.preprocessor._steps[1],
+                              steps.DecompressMessageMiddleware)
+        self.assertIsInstance(self.preprocessor._steps[2],
+                              steps.LogIncomingAMQPMessageMiddleware)
+        self.assertIsInstance(self.preprocessor._steps[3],
                               steps.CreateMessageMiddleware)
 
     def test_process_runs_middlewares_and_router(self):
@@ -0,0 +1,141 @@
+import threading
+import unittest
+
+import mock
+
+from tavrida import exceptions
+from tavrida import messages
+from tavrida import replies
+
+
+class ReplyFutureTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(ReplyFutureTestCase, self).setUp()
+        self.future = replies.ReplyFuture("123")
+
+    def test_result(self):
+        """
+        Tests that result is returned when future is resolved in other
+        thread
+        """
+        threading.Timer(0.01, self.future.set_result,
+                        [{"key": "value"}]).start()
+        self.assertEqual(self.future.result(timeout=5), {"key": "value"})
+        self.assertTrue(self.future.done())
+
+    def test_remote_error_is_raised(self):
+        """
+        Tests that exception the future is resolved with is raised
+        """
+        error = exceptions.RemoteError(error_class="ValueError",
+                                       message="bad", code=1234)
+        self.future.set_exception(error)
+        self.assertRaises(exceptions.RemoteError, self.future.result, 0)
+        self.assertIs(self.future.exception(0), error)
+        self.assertEqual(error.code, 1234)
+
+    def test_timeout(self):
+        """
+        Tests that ReplyTimeout is raised if there is no reply in timeout
+        """
+        self.assertRaises(exceptions.ReplyTimeout, self.future.result, 0.01)
+        self.assertFalse(self.future.done())
+
+    def test_callback(self):
+        """
+        Tests that callback is called on resolution and immediately if
+        future is already resolved
+        """
+        callback = mock.MagicMock()
+        self.future.add_done_callback(callback)
+        self.future.set_result({})
+        self.future.set_result({"ignored": True})
+        self.future.add_done_callback(callback)
+        self.assertEqual(callback.call_args_list,
+                         [mock.call(self.future), mock.call(self.future)])
+        self.assertEqual(self.future.result(0), {})
+
+
+class ReplyConsumerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(ReplyConsumerTestCase, self).setUp()
+        self.driver = mock.MagicMock()
+        self.consumer = replies.ReplyConsumer(self.driver, "replies")
+        headers = {
+            "source": "client",
+            "destination": "service.method",
+            "reply_to": "client",
+            "correlation_id": "123",
+            "reply_queue": "replies"
+        }
+        self.request = messages.Request(headers, {}, {"param": 1})
+
+    def _amqp(self, message):
+        return messages.AMQPMessage.create_from_message(message)
+
+    def test_reader_is_created_for_queue(self):
+        """
+        Tests that consumer reads reply queue via driver
+        """
+        self.driver.create_reply_reader.assert_called_once_with(
+            "replies", self.consumer)
+
+    def test_response_resolves_future(self):
+        """
+        Tests that response resolves future of request with its payload
+        """
+        future = self.consumer.expect(self.request.request_id)
+        response = messages.Response.create_by_request(self.request,
+                                                       {"result": 2})
+        self.consumer.process(self._amqp(response))
+        self.assertEqual(future.result(0), {"result": 2})
+        self.assertEqual(self.consumer.pending_count, 0)
+
+    def test_timings_of_reply(self):
+        """
+        Tests that future gets latency decomposition of request
+        """
+        future = self.consumer.expect(self.request.request_id)
+        self.assertIsNone(future.timings)
+        response = messages.Response.create_by_request(self.request, {})
+        self.consumer.process(self._amqp(response))
+        self.assertEqual(future.timings.correlation_id, "123")
+
+    def test_error_resolves_future_with_remote_error(self):
+        """
+        Tests that error resolves future with RemoteError of remote class
+        and code
+        """
+        future = self.consumer.expect(self.request.request_id)
+        error = messages.Error.create_by_request(
+            self.request, exceptions.ServiceNotFound(entry_point="ep"))
+        self.consumer.process(self._amqp(error))
+        exception = future.exception(0)
+        self.assertIsInstance(exception, exceptions.RemoteError)
+        self.assertEqual(exception.code,
+                         exceptions.ServiceNotFound._service_error_code)
+        self.assertEqual(exception.error_class,
+                         "tavrida.exceptions.ServiceNotFound")
+
+    def test_forgotten_reply_is_dropped(self):
+        """
+        Tests that reply to request that nobody waits for is ignored
+        """
+        future = self.consumer.expect(self.request.request_id)
+        self.consumer.forget(self.request.request_id)
+        response = messages.Response.create_by_request(self.request, {})
+        self.consumer.process(self._amqp(response))
+        self.assertFalse(future.done())
+
+    def test_stop_fails_pending_requests(self):
+        """
+        Tests that requests waiting for replies fail when consumer stops
+        """
+        self.consumer.start()
+        future = self.consumer.expect(self.request.request_id)
+        self.consumer.stop()
+        reader = self.driver.create_reply_reader()
+        reader.request_stop.assert_called_once_with()
+        self.assertRaises(exceptions.ReplyConsumerIsStopped, future.result, 0)
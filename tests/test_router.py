@@ -3,6 +3,7 @@ import unittest
 import mock
 
 from tavrida import exceptions
+from tavrida import instrumentation
 from tavrida import messages
 from tavrida import router
 from tavrida import service
@@ -374,3 +375,167 @@ class RouterTestCase(unittest.TestCase):
         self.router.process(message, service_list)
         process_mock.assert_called_once_with(message, get_cls_mock(),
                                              service_list)
+
+
+class RoutingTableTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(RoutingTableTestCase, self).setUp()
+        self.router = router.Router()
+
+        class A(service.ServiceController):
+            get_dispatcher = mock.MagicMock()
+            service_name = "service_a"
+
+        self.service_cls = A
+        self.service = A(mock.MagicMock())
+        self.router.register("service_a", A)
+        self.router.register("remote", A)
+
+    def tearDown(self):
+        super(RoutingTableTestCase, self).tearDown()
+        self.router._services = []
+
+    def test_request_is_routed_to_bound_service(self):
+        """
+        Tests that request is passed to dispatcher of the service registered
+        for destination
+        """
+        table = self.router.compile([self.service])
+        message = mock.MagicMock(spec=messages.IncomingRequest)
+        message.source = mock.MagicMock()
+        message.destination = mock.MagicMock()
+        message.destination.service = "service_a"
+        table.process(message)
+        self.service_cls.get_dispatcher().process.assert_called_once_with(
+            message, self.service)
+
+    def test_routing_is_observed(self):
+        """
+        Tests that lookup of service is observed as routing stage apart from
+        dispatching
+        """
+        observer = mock.MagicMock()
+        instrumentation.register_observer(observer)
+        self.addCleanup(instrumentation.unregister_observer, observer)
+        table = self.router.compile([self.service])
+        message = mock.MagicMock(spec=messages.IncomingRequest)
+        message.destination = mock.MagicMock()
+        message.destination.service = "service_a"
+        table.process(message)
+        observer.on_stage_end.assert_called_once_with(
+            instrumentation.ROUTING, message, mock.ANY, None)
+        self.assertTrue(self.service_cls.get_dispatcher().process.called)
+
+    def test_response_is_routed_by_source_and_destination(self):
+        """
+        Tests that response is routed only if destination is service name of
+        the class registered for source
+        """
+        table = self.router.compile([self.service])
+        message = mock.MagicMock(spec=messages.IncomingResponse)
+        message.source = mock.MagicMock()
+        message.destination = mock.MagicMock()
+        message.source.service = "remote"
+        message.destination.service = "other"
+        self.assertRaises(exceptions.ServiceNotFound, table.process, message)
+
+        message.destination.service = "service_a"
+        table.process(message)
+        self.service_cls.get_dispatcher().process.assert_called_once_with(
+            message, self.service)
+
+    def test_notification_without_subscribers(self):
+        """
+        Tests that notification without subscribers is ignored
+        """
+        table = self.router.compile([self.service])
+        message = mock.MagicMock(spec=messages.IncomingNotification)
+        message.source = mock.MagicMock()
+        message.destination = mock.MagicMock()
+        message.source.service = "unknown"
+        table.process(message)
+        self.assertFalse(self.service_cls.get_dispatcher().process.called)
+
+    def test_duplicated_registration(self):
+        """
+        Tests that request for service registered for several classes fails
+        """
+        self.router.register("service_a", mock.MagicMock())
+        table = self.router.compile([self.service])
+        message = mock.MagicMock(spec=messages.IncomingRequest)
+        message.source = mock.MagicMock()
+        message.destination = mock.MagicMock()
+        message.destination.service = "service_a"
+        self.assertRaises(exceptions.DuplicatedServiceRegistration,
+                          table.process, message)
+
+    def test_service_is_not_instantiated(self):
+        """
+        Tests that routing to registered but not instantiated service fails
+        """
+        table = self.router.compile([])
+        message = mock.MagicMock(spec=messages.IncomingRequest)
+        message.source = mock.MagicMock()
+        message.destination = mock.MagicMock()
+        message.destination.service = "service_a"
+        self.assertRaises(exceptions.UnknownService, table.process, message)
+
+    def test_request_is_routed_to_provider_of_service(self):
+        """
+        Tests that request is routed to the class that handles requests of
+        the service if service name is also registered by its caller
+        """
+        class B(service.ServiceController):
+            get_dispatcher = mock.MagicMock()
+            service_name = "remote"
+
+        B.get_dispatcher().get_request_entry_services.return_value = [
+            "remote"]
+        self.router.register("remote", B)
+        provider = B(mock.MagicMock())
+        table = self.router.compile([self.service, provider])
+        message = mock.MagicMock(spec=messages.IncomingRequest)
+        message.source = mock.MagicMock()
+        message.destination = mock.MagicMock()
+        message.destination.service = "remote"
+        table.process(message)
+        B.get_dispatcher().process.assert_called_once_with(message, provider)
+
+    def test_is_local(self):
+        """
+        Tests that request to instantiated service and response to it are
+        local, notifications are never local
+        """
+        table = self.router.compile([self.service])
+        request = mock.MagicMock(spec=messages.Request)
+        request.message_type = "request"
+        request.destination = mock.MagicMock()
+        request.destination.service = "service_a"
+        self.assertTrue(table.is_local(request))
+        request.destination.service = "unknown"
+        self.assertFalse(table.is_local(request))
+
+        response = mock.MagicMock(spec=messages.Response)
+        response.message_type = "response"
+        response.source = mock.MagicMock()
+        response.destination = mock.MagicMock()
+        response.source.service = "remote"
+        response.destination.service = "service_a"
+        self.assertTrue(table.is_local(response))
+
+        notification = mock.MagicMock(spec=messages.Notification)
+        notification.message_type = "notification"
+        self.assertFalse(table.is_local(notification))
+
+    def test_not_instantiated_service_is_not_local(self):
+        """
+        Tests that message to registered but not instantiated service is
+        sent via broker
+        """
+        table = self.router.compile([])
+        request = mock.MagicMock(spec=messages.Request)
+        request.message_type = "request"
+        request.destination = mock.MagicMock()
+        request.destination.service = "service_a"
+        self.assertFalse(table.is_local(request))
@@ -0,0 +1,124 @@
+import unittest
+
+import mock
+
+from tavrida import exceptions
+from tavrida import messages
+from tavrida import serialization
+
+
+class CodecRegistryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(CodecRegistryTestCase, self).setUp()
+        self.registry = serialization.CodecRegistry()
+        self.registry.register(serialization.JSONCodec)
+
+    def test_json_is_default_decoder(self):
+        """
+        Tests that message without content type is decoded as JSON
+        """
+        self.assertIsInstance(self.registry.get_decoder(None),
+                              serialization.JSONCodec)
+
+    def test_unknown_content_type(self):
+        """
+        Tests that unknown content type can't be decoded
+        """
+        self.assertRaises(exceptions.UnknownContentType,
+                          self.registry.get_decoder, "application/xml")
+
+    def test_unavailable_codec_is_not_registered(self):
+        """
+        Tests that codec without installed library is not registered
+        """
+        codec_cls = mock.MagicMock()
+        codec_cls.is_available.return_value = False
+        codec_cls.name = "fake"
+        self.assertFalse(self.registry.register(codec_cls))
+        self.assertRaises(exceptions.CodecIsNotAvailable,
+                          self.registry.get_codec, "fake")
+
+    def test_first_codec_decodes_content_type(self):
+        """
+        Tests that codec registered later doesn't replace decoder of its
+        content type
+        """
+        codec = mock.MagicMock()
+        codec_cls = mock.MagicMock(return_value=codec)
+        codec.name = "fastjson"
+        codec.content_type = "application/json"
+        self.registry.register(codec_cls)
+        self.assertIsInstance(self.registry.get_decoder("application/json"),
+                              serialization.JSONCodec)
+        self.assertIs(self.registry.get_codec("fastjson"), codec)
+
+    def test_set_decoder(self):
+        """
+        Tests that decoder of content type can be replaced explicitly
+        """
+        codec = mock.MagicMock()
+        codec_cls = mock.MagicMock(return_value=codec)
+        codec.name = "fastjson"
+        codec.content_type = "application/json"
+        self.registry.register(codec_cls)
+        self.registry.set_decoder("fastjson")
+        self.assertIs(self.registry.get_decoder("application/json"), codec)
+
+
+class DefaultRegistryTestCase(unittest.TestCase):
+
+    def tearDown(self):
+        super(DefaultRegistryTestCase, self).tearDown()
+        reload(serialization)
+
+    def test_ujson_doesnt_replace_json_decoder(self):
+        """
+        Tests that with ujson installed JSON messages are still decoded by
+        JSONCodec and fastjson is available for encoding
+        """
+        with mock.patch.dict("sys.modules", {"ujson": mock.MagicMock()}):
+            reload(serialization)
+        decoder = serialization.get_decoder("application/json")
+        self.assertIs(type(decoder), serialization.JSONCodec)
+        self.assertIs(serialization.get_decoder(None), decoder)
+        self.assertIsInstance(serialization.get_codec("fastjson"),
+                              serialization.FastJSONCodec)
+
+
+class AMQPMessageCodecTestCase(unittest.TestCase):
+
+    def _message(self):
+        headers = {
+            "source": "src_service.src_method",
+            "destination": "dst_service.dst_method",
+            "reply_to": "",
+            "correlation_id": "123"
+        }
+        return messages.Message(headers, {"key": 1}, {"param": u"value"})
+
+    def test_json_roundtrip(self):
+        """
+        Tests that message body is encoded to JSON by default and content
+        type is set
+        """
+        amqp_message = messages.AMQPMessage.create_from_message(
+            self._message())
+        self.assertEqual(amqp_message.content_type, "application/json")
+        self.assertEqual(amqp_message.body_deserialize(),
+                         {"payload": {"param": u"value"},
+                          "context": {"key": 1}})
+
+    @unittest.skipIf(serialization.msgpack is None,
+                     "msgpack is not installed")
+    def test_msgpack_roundtrip(self):
+        """
+        Tests that message encoded by msgpack is decoded by content type
+        """
+        codec = serialization.get_codec("msgpack")
+        amqp_message = messages.AMQPMessage.create_from_message(
+            self._message(), codec)
+        received = messages.AMQPMessage(amqp_message.body, {},
+                                        amqp_message.content_type)
+        self.assertEqual(received.body_deserialize()["payload"],
+                         {"param": u"value"})
@@ -1,4 +1,3 @@
-import copy
 import unittest
 
 import mock
@@ -117,6 +116,17 @@ class ServiceTestCase(unittest.TestCase):
         res = self.service._filter_redundant_parameters("method", {"x": "x"})
         self.assertDictEqual(res, {"x": "x"})
 
+    def test_handler_is_resolved_once(self):
+        """
+        Tests that bound handler and its parameter names are cached
+        """
+        self.service.method = mock.MagicMock()
+        self.service.method._arg_names = ["request", "proxy", "x"]
+        handler, arg_names = self.service._get_handler("method")
+        self.service.method = mock.MagicMock()
+        self.assertIs(self.service._get_handler("method")[0], handler)
+        self.assertEqual(arg_names, ("x",))
+
     @mock.patch.object(service.ServiceController,
                        "_filter_redundant_parameters")
     def test_handle_request_call_positive(self, filter_mock):
@@ -276,89 +286,74 @@ class ServiceTestCase(unittest.TestCase):
                           self.service._process_request,
                           method, request, proxy)
 
-    @mock.patch.object(copy, "copy")
     @mock.patch.object(service.ServiceController, "_process_request")
-    def test_route_request_call(self, process_mock, copy_mock):
+    def test_route_request_call(self, process_mock):
         """
         Tests routing request call to corresponding handler
         """
         message = mock.MagicMock(spec=messages.IncomingRequestCall)
-        message.update_context = mock.MagicMock()
-        message.payload = mock.MagicMock()
+        message.update_context_by_payload = mock.MagicMock()
         method = "method"
         proxy = mock.MagicMock()
 
         res = self.service._route_message_by_type(method, message, proxy)
-        copy_mock.assert_called_once_with(message.payload)
-        message.update_context.assert_called_once_with(copy_mock())
+        message.update_context_by_payload.assert_called_once_with()
         self.assertEqual(res, process_mock())
 
-    @mock.patch.object(copy, "copy")
     @mock.patch.object(service.ServiceController, "_process_request")
-    def test_route_request_cast(self, process_mock, copy_mock):
+    def test_route_request_cast(self, process_mock):
         """
         Tests routing request cast to corresponding handler
         """
         message = mock.MagicMock(spec=messages.IncomingRequestCast)
-        message.update_context = mock.MagicMock()
-        message.payload = mock.MagicMock()
+        message.update_context_by_payload = mock.MagicMock()
         method = "method"
         proxy = mock.MagicMock()
 
         res = self.service._route_message_by_type(method, message, proxy)
-        copy_mock.assert_called_once_with(message.payload)
-        message.update_context.assert_called_once_with(copy_mock())
+        message.update_context_by_payload.assert_called_once_with()
         self.assertEqual(res, process_mock())
 
-    @mock.patch.object(copy, "copy")
     @mock.patch.object(service.ServiceController, "_process_response")
-    def test_route_response(self, process_mock, copy_mock):
+    def test_route_response(self, process_mock):
         """
         Tests routing response to corresponding handler
         """
         message = mock.MagicMock(spec=messages.IncomingResponse)
-        message.update_context = mock.MagicMock()
-        message.payload = mock.MagicMock()
+        message.update_context_by_payload = mock.MagicMock()
         method = "method"
         proxy = mock.MagicMock()
 
         res = self.service._route_message_by_type(method, message, proxy)
-        copy_mock.assert_called_once_with(message.payload)
-        message.update_context.assert_called_once_with(copy_mock())
+        message.update_context_by_payload.assert_called_once_with()
         self.assertEqual(res, process_mock())
 
-    @mock.patch.object(copy, "copy")
     @mock.patch.object(service.ServiceController, "_process_notification")
-    def test_route_notification(self, process_mock, copy_mock):
+    def test_route_notification(self, process_mock):
         """
         Tests routing notification to corresponding handler
         """
         message = mock.MagicMock(spec=messages.IncomingNotification)
-        message.update_context = mock.MagicMock()
-        message.payload = mock.MagicMock()
+        message.update_context_by_payload = mock.MagicMock()
         method = "method"
         proxy = mock.MagicMock()
 
         res = self.service._route_message_by_type(method, message, proxy)
-        copy_mock.assert_called_once_with(message.payload)
-        message.update_context.assert_called_once_with(copy_mock())
+        message.update_context_by_payload.assert_called_once_with()
         self.assertEqual(res, process_mock())
 
-    @mock.patch.object(copy, "copy")
     @mock.patch.object(service.ServiceController, "_process_error")
-    def test_route_error(self, process_mock, copy_mock):
+    def test_route_error(self, process_mock):
         """
         Tests routing error to corresponding handler
         """
         message = mock.MagicMock(spec=messages.IncomingError)
-        message.update_context = mock.MagicMock()
-        message.payload = mock.MagicMock()
+        message.update_context_by_payload = mock.MagicMock()
         method = "method"
         proxy = mock.MagicMock()
 
         res = self.service._route_message_by_type(method, message, proxy)
-        copy_mock.assert_called_once_with(message.payload)
-        message.update_context.assert_called_once_with(copy_mock())
+        message.update_context_by_payload.assert_called_once_with()
         self.assertEqual(res, process_mock())
 
     @mock.patch.object(service.ServiceController, "_send")
@@ -476,3 +471,62 @@ class ServiceTestCase(unittest.TestCase):
         self.service.process(method, message, proxy)
         route_mock.assert_not_called()
         send_mock.call_count = 1
+
+
+@unittest.skipIf(utils.asyncio is None, "asyncio is not available")
+class CoroutineServiceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(CoroutineServiceTestCase, self).setUp()
+        self.postprocessor = mock.MagicMock()
+        self.service = service.ServiceController(self.postprocessor)
+        self.loop = utils.asyncio.get_event_loop()
+
+    @mock.patch.object(service.ServiceController,
+                       "_filter_redundant_parameters")
+    @mock.patch.object(service.ServiceController, "_send")
+    def test_coroutine_handler_response_is_sent(self, send_mock, filter_mock):
+        """
+        Tests that response of coroutine handler is sent when it is done
+        """
+        handler_future = utils.asyncio.Future()
+        self.service.method = mock.MagicMock(return_value=handler_future)
+        request = mock.MagicMock(spec=messages.IncomingRequestCall)
+        request.payload = {}
+        filter_mock.return_value = {}
+
+        res = self.service._process_request("method", request,
+                                            mock.MagicMock())
+        self.assertTrue(utils.is_awaitable(res))
+        self.assertFalse(send_mock.called)
+
+        handler_future.set_result({"param": "value"})
+        self.loop.run_until_complete(res)
+
+        request.make_response.assert_called_once_with(param="value")
+        send_mock.assert_called_once_with(request.make_response())
+
+    @mock.patch.object(service.ServiceController,
+                       "_filter_redundant_parameters")
+    @mock.patch.object(service.ServiceController, "_send")
+    def test_coroutine_handler_error_is_sent(self, send_mock, filter_mock):
+        """
+        Tests that exception of coroutine handler is sent as error
+        """
+        handler_future = utils.asyncio.Future()
+        self.service.method = mock.MagicMock(return_value=handler_future)
+        request = mock.MagicMock(spec=messages.IncomingRequestCall)
+        request.payload = {}
+        request.correlation_id = "123"
+        request.request_id = "456"
+        request.destination = mock.MagicMock()
+        request.reply_to = mock.MagicMock()
+        request.source = mock.MagicMock()
+        filter_mock.return_value = {}
+
+        res = self.service._process_request("method", request,
+                                            mock.MagicMock())
+        handler_future.set_exception(ValueError())
+        self.loop.run_until_complete(res)
+
+        self.assertIsInstance(send_mock.call_args[0][0], messages.Error)
@@ -1,7 +1,10 @@
 import logging
 import mock
+import threading
 import unittest
 
+from tavrida import compression
+from tavrida import exceptions
 from tavrida import messages
 from tavrida import steps
 
@@ -43,10 +46,84 @@ class CreateAMQPTestCase(unittest.TestCase):
     def test_process(self, create_mock):
         message = mock.MagicMock()
         res = self.step.process(message)
-        create_mock.assert_called_once_with(message)
+        create_mock.assert_called_once_with(message, None)
         self.assertEqual(res, create_mock())
 
 
+class CompressionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(CompressionTestCase, self).setUp()
+        self.compressor = compression.get_compressor("zlib")
+        self.step = steps.CompressMessageMiddleware(self.compressor, 100)
+
+    def test_small_body_is_not_compressed(self):
+        """
+        Tests that body smaller than threshold is sent as is
+        """
+        message = messages.AMQPMessage("x" * 99, {})
+        res = self.step.process(message)
+        self.assertEqual(res.body, "x" * 99)
+        self.assertIsNone(res.content_encoding)
+
+    def test_large_body_roundtrip(self):
+        """
+        Tests that large body is compressed, marked by content encoding and
+        restored by decompression step
+        """
+        body = "x" * 1000
+        message = self.step.process(messages.AMQPMessage(body, {}))
+        self.assertEqual(message.content_encoding, "zlib")
+        self.assertLess(len(message.body), len(body))
+
+        res = steps.DecompressMessageMiddleware().process(message)
+        self.assertEqual(res.body, body)
+        self.assertIsNone(res.content_encoding)
+
+    def test_unknown_content_encoding(self):
+        """
+        Tests that message compressed by unknown algorithm is not processed
+        """
+        message = messages.AMQPMessage("body", {}, content_encoding="rar")
+        self.assertRaises(exceptions.UnknownContentEncoding,
+                          steps.DecompressMessageMiddleware().process,
+                          message)
+
+
+class ZstdCompressorTestCase(unittest.TestCase):
+
+    @mock.patch.object(compression, "zstandard")
+    def test_contexts_are_not_shared_between_threads(self, zstandard_mock):
+        """
+        Tests that every thread compresses and decompresses with its own
+        zstandard contexts
+        """
+        zstandard_mock.ZstdCompressor.side_effect = (
+            lambda level: mock.MagicMock())
+        zstandard_mock.ZstdDecompressor.side_effect = mock.MagicMock
+        compressor = compression.ZstdCompressor(level=5)
+        contexts = []
+
+        def compress():
+            compressor.compress("data")
+            compressor.compress("data")
+            compressor.decompress("data")
+            contexts.append((compressor._get_compressor(),
+                             compressor._get_decompressor()))
+
+        threads = [threading.Thread(target=compress) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+            thread.join()
+
+        self.assertEqual(zstandard_mock.ZstdCompressor.call_count, 2)
+        zstandard_mock.ZstdCompressor.assert_called_with(level=5)
+        self.assertEqual(zstandard_mock.ZstdDecompressor.call_count, 2)
+        self.assertIsNot(contexts[0][0], contexts[1][0])
+        self.assertIsNot(contexts[0][1], contexts[1][1])
+        self.assertEqual(contexts[0][0].compress.call_count, 2)
+
+
 class LoggingMiddlewareTestCase(unittest.TestCase):
 
     def setUp(self):
@@ -0,0 +1,181 @@
+import signal
+import unittest
+
+import mock
+
+from tavrida import instrumentation
+from tavrida import server
+from tavrida import supervisor
+
+
+class SupervisorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(SupervisorTestCase, self).setUp()
+        self.target = mock.MagicMock()
+        self.supervisor = supervisor.Supervisor(self.target, 2,
+                                                restart_delay=0,
+                                                drain_timeout=1)
+        process_patcher = mock.patch("multiprocessing.Process")
+        self.process_mock = process_patcher.start()
+        self.addCleanup(process_patcher.stop)
+
+    def test_workers_are_spawned(self):
+        """
+        Tests that supervisor starts given number of worker processes
+        """
+        self.supervisor._spawn(0)
+        self.supervisor._spawn(1)
+        self.assertEqual(self.process_mock.call_args[1]["args"], (1,))
+        self.assertEqual(len(self.supervisor.workers), 2)
+        self.assertEqual(self.process_mock().start.call_count, 2)
+
+    def test_crashed_worker_is_restarted(self):
+        """
+        Tests that dead worker is replaced by a new process
+        """
+        dead, alive, new = (mock.MagicMock(), mock.MagicMock(),
+                            mock.MagicMock())
+        dead.is_alive.return_value = False
+        dead.exitcode = 1
+        alive.is_alive.return_value = True
+        self.process_mock.side_effect = [dead, alive, new]
+        self.supervisor._spawn(0)
+        self.supervisor._spawn(1)
+
+        self.supervisor._check_workers()
+
+        self.assertIs(self.supervisor.workers[0], new)
+        self.assertIs(self.supervisor.workers[1], alive)
+        new.start.assert_called_once_with()
+
+    def test_cleanly_exited_worker_is_not_restarted(self):
+        """
+        Tests that worker that exited with code 0 is forgotten and not
+        restarted
+        """
+        finished = self.process_mock()
+        finished.is_alive.return_value = False
+        finished.exitcode = 0
+        self.supervisor._spawn(0)
+
+        self.supervisor._check_workers()
+
+        self.assertEqual(self.supervisor.workers, {})
+        self.assertEqual(finished.start.call_count, 1)
+
+    @mock.patch("time.time")
+    def test_crash_loop_backs_off_and_gives_up(self, time_mock):
+        """
+        Tests that worker that crashes right after start is restarted with
+        growing delay and is not restarted after max_failures crashes
+        """
+        sup = supervisor.Supervisor(self.target, 1, restart_delay=1,
+                                    max_restart_delay=60, max_failures=3)
+        crashed = self.process_mock()
+        crashed.is_alive.return_value = False
+        crashed.exitcode = 1
+        time_mock.return_value = 0
+        sup._spawn(0)
+
+        restarts = []
+        for now in range(11):
+            time_mock.return_value = now
+            spawned = self.process_mock().start.call_count
+            sup._check_workers()
+            if self.process_mock().start.call_count > spawned:
+                restarts.append(now)
+
+        # crashes noticed at 0, 2, 5 are restarted after 1, 2, 4 seconds,
+        # the fourth crash noticed at 10 is not
+        self.assertEqual(restarts, [1, 4, 9])
+        self.assertEqual(sup.workers, {})
+
+    @mock.patch("time.time")
+    def test_failures_are_reset_after_stable_run(self, time_mock):
+        """
+        Tests that crash of worker which worked longer than
+        max_restart_delay is restarted after initial delay
+        """
+        sup = supervisor.Supervisor(self.target, 1, restart_delay=1,
+                                    max_restart_delay=60, max_failures=3)
+        crashed = self.process_mock()
+        crashed.is_alive.return_value = False
+        crashed.exitcode = -9
+        sup._failures[0] = 3
+        time_mock.return_value = 0
+        sup._spawn(0)
+
+        time_mock.return_value = 100
+        sup._check_workers()
+        time_mock.return_value = 101
+        sup._check_workers()
+
+        self.assertEqual(sup._failures[0], 1)
+        self.assertEqual(crashed.start.call_count, 2)
+
+    @mock.patch("os.kill")
+    def test_drain_sends_sigterm(self, kill_mock):
+        """
+        Tests that supervisor sends SIGTERM to alive workers and waits for
+        them
+        """
+        process = self.process_mock()
+        process.pid = 42
+        process.is_alive.side_effect = [True, False]
+        self.supervisor._spawn(0)
+
+        self.supervisor._drain()
+
+        kill_mock.assert_called_once_with(42, signal.SIGTERM)
+        self.assertTrue(process.join.called)
+
+    @mock.patch("os.kill")
+    def test_hanging_worker_is_killed(self, kill_mock):
+        """
+        Tests that worker that is not stopped in drain timeout is killed
+        """
+        process = self.process_mock()
+        process.pid = 42
+        process.is_alive.return_value = True
+        self.supervisor._spawn(0)
+
+        self.supervisor._drain()
+
+        kill_mock.assert_called_with(42, signal.SIGKILL)
+
+
+class ServerWorkersTestCase(unittest.TestCase):
+
+    @mock.patch.object(server.Server, "_get_supervisor")
+    @mock.patch.object(server.Server, "_create_amqp_structures")
+    @mock.patch.object(server.Server, "_instantiate_services")
+    def test_structures_are_created_once(self, instantiate_mock,
+                                         create_mock, supervisor_mock):
+        """
+        Tests that in multi-process mode server creates AMQP structures
+        before forking and doesn't instantiate services in supervisor
+        """
+        srv = server.Server(mock.MagicMock(), "queue", "exchange", [])
+        srv.run(workers=3)
+        create_mock.assert_called_once_with()
+        self.assertFalse(instantiate_mock.called)
+        supervisor_mock.assert_called_once_with(3)
+        supervisor_mock().run.assert_called_once_with()
+
+    @mock.patch("tavrida.metrics.MetricsHTTPServer")
+    def test_worker_serves_metrics_on_own_port(self, http_server_mock):
+        """
+        Tests that worker N serves metrics on metrics_port + N and stops
+        serving when listening is finished
+        """
+        srv = server.Server(mock.MagicMock(), "queue", "exchange", [],
+                            metrics_port=9100)
+        srv._driver = mock.MagicMock()
+        with mock.patch.object(srv, "_get_preprocessor"):
+            srv._listen(2)
+        http_server_mock.assert_called_once_with(srv.metrics, 9102,
+                                                 "127.0.0.1")
+        http_server_mock().start.assert_called_once_with()
+        http_server_mock().stop.assert_called_once_with()
+        self.assertEqual(instrumentation.get_observers(), ())
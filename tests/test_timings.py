@@ -0,0 +1,134 @@
+import unittest
+
+import mock
+
+from tavrida import instrumentation
+from tavrida import messages
+from tavrida import service
+from tavrida import timings
+
+
+class TimingsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(TimingsTestCase, self).setUp()
+        self.headers = {
+            "source": "src_service.src_method",
+            "destination": "dst_service.dst_method",
+            "reply_to": "src_service.on_method",
+            "correlation_id": "123",
+            "request_id": "456",
+            "message_id": "789",
+            "message_type": "request",
+            timings.SENT_AT: 1000000L,
+            timings.RECEIVED_AT: 1003000L
+        }
+        clock_patcher = mock.patch.object(timings, "clock",
+                                          return_value=1.01)
+        clock_patcher.start()
+        self.addCleanup(clock_patcher.stop)
+
+    def test_stamp_is_integer(self):
+        """
+        Tests that timestamp is stored in microseconds as long, so it could
+        be sent in AMQP headers
+        """
+        headers = {}
+        timings.stamp(headers, timings.SENT_AT)
+        self.assertEqual(headers[timings.SENT_AT], 1010000)
+        self.assertIsInstance(headers[timings.SENT_AT], long)
+
+    def test_stamp_request_removes_inherited_stamps(self):
+        """
+        Tests that request doesn't carry timestamps of incoming message its
+        headers are copied from
+        """
+        self.headers[timings.HANDLER_STARTED_AT] = 1L
+        timings.stamp_request(self.headers)
+        self.assertEqual(self.headers[timings.SENT_AT], 1010000)
+        self.assertNotIn(timings.RECEIVED_AT, self.headers)
+        self.assertNotIn(timings.HANDLER_STARTED_AT, self.headers)
+
+    def test_response_returns_request_stamps(self):
+        """
+        Tests that response carries send and receive time of request
+        """
+        request = messages.IncomingRequestCall(self.headers, {}, {})
+        response = messages.Response.create_by_request(request, {})
+        self.assertEqual(response.headers[timings.REQUEST_SENT_AT], 1000000)
+        self.assertEqual(response.headers[timings.REQUEST_RECEIVED_AT],
+                         1003000)
+        self.assertEqual(response.headers[timings.SENT_AT], 1010000)
+
+    def test_get_timings(self):
+        """
+        Tests latency decomposition by headers of received response
+        """
+        headers = {"correlation_id": "123", "request_id": "456",
+                   timings.REQUEST_SENT_AT: 1000000L,
+                   timings.REQUEST_RECEIVED_AT: 1250000L,
+                   timings.HANDLER_STARTED_AT: 1300000L,
+                   timings.HANDLER_FINISHED_AT: 1800000L,
+                   timings.SENT_AT: 1900000L,
+                   timings.RECEIVED_AT: 2000000L}
+        self.assertEqual(timings.get_timings(headers),
+                         timings.Timings("123", "456", 0.25, 0.05, 0.5, 0.1,
+                                         1.0))
+
+    def test_missing_stamps(self):
+        """
+        Tests that durations are None if timestamps are missing
+        """
+        result = timings.get_timings({timings.SENT_AT: 1L,
+                                      timings.RECEIVED_AT: 2L})
+        self.assertEqual(result.return_trip, 0.000001)
+        self.assertIsNone(result.queue_wait)
+        self.assertIsNone(result.handler)
+
+    @mock.patch.object(service.ServiceController, "_send")
+    def test_handler_stamps_are_sent_in_response(self, send_mock):
+        """
+        Tests that service stamps handler start and end and sends them in
+        response
+        """
+        srv = service.ServiceController(mock.MagicMock())
+        srv.method = lambda request, proxy: request.make_response(res=1)
+        request = messages.IncomingRequestCall(self.headers, {}, {})
+        srv._process_request("method", request, mock.MagicMock())
+        response = send_mock.call_args[0][0]
+        self.assertEqual(response.headers[timings.HANDLER_STARTED_AT],
+                         1010000)
+        self.assertEqual(response.headers[timings.HANDLER_FINISHED_AT],
+                         1010000)
+
+
+class TimingsCollectorTestCase(unittest.TestCase):
+
+    def _process(self, collector, correlation_id, message_type="response"):
+        message = mock.MagicMock()
+        message.headers = {"correlation_id": correlation_id,
+                           "message_type": message_type}
+        collector.on_stage_start(instrumentation.PROCESSING, message)
+
+    def test_replies_are_collected(self):
+        """
+        Tests that timings of responses and errors are kept by
+        correlation_id
+        """
+        collector = timings.TimingsCollector()
+        self._process(collector, "1")
+        self._process(collector, "2", "error")
+        self._process(collector, "3", "request")
+        self.assertEqual(collector.get("1").correlation_id, "1")
+        self.assertEqual([t.correlation_id for t in collector.get_all()],
+                         ["1", "2"])
+
+    def test_capacity(self):
+        """
+        Tests that the oldest timings are dropped
+        """
+        collector = timings.TimingsCollector(capacity=2)
+        for correlation_id in ("1", "2", "3"):
+            self._process(collector, correlation_id)
+        self.assertIsNone(collector.get("1"))
+        self.assertEqual(len(collector.get_all()), 2)
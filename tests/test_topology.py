@@ -0,0 +1,161 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from tavrida import config
+from tavrida import dispatcher
+from tavrida import entry_point
+from tavrida import server
+from tavrida import topology
+from tavrida.amqp_driver import memory
+
+
+class TopologyTestCase(unittest.TestCase):
+
+    def test_duplicates_are_ignored(self):
+        """
+        Tests that the same structure is added only once
+        """
+        plan = topology.Topology()
+        plan.add_exchange("exchange")
+        plan.add_exchange("exchange")
+        plan.add_queue("queue")
+        plan.add_queue("queue")
+        plan.add_binding("queue", "exchange", "rk.#")
+        plan.add_binding("queue", "exchange", "rk.#")
+        self.assertEqual(plan.exchanges, [("exchange", "topic")])
+        self.assertEqual(plan.queues, ["queue"])
+        self.assertEqual(plan.bindings, [("queue", "exchange", "rk.#")])
+        self.assertEqual(len(plan), 3)
+
+    def test_fingerprint_does_not_depend_on_order(self):
+        """
+        Tests that topologies with the same structures have equal
+        fingerprints
+        """
+        first = topology.Topology()
+        first.add_exchange("a")
+        first.add_exchange("b")
+        second = topology.Topology()
+        second.add_exchange("b")
+        second.add_exchange("a")
+        self.assertEqual(first.fingerprint("host"),
+                         second.fingerprint("host"))
+        self.assertNotEqual(first.fingerprint("host"),
+                            first.fingerprint("other_host"))
+
+
+class TopologyCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(TopologyCacheTestCase, self).setUp()
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.cache = topology.TopologyCache(os.path.join(self.dir, "cache"))
+
+    def test_saved_fingerprint_is_found(self):
+        """
+        Tests that cache contains only the saved fingerprint
+        """
+        self.assertFalse(self.cache.contains("fingerprint"))
+        self.cache.save("fingerprint")
+        self.assertTrue(self.cache.contains("fingerprint"))
+        self.assertFalse(self.cache.contains("other"))
+        self.cache.clear()
+        self.assertFalse(self.cache.contains("fingerprint"))
+
+
+class ServerTopologyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(ServerTopologyTestCase, self).setUp()
+        disp = dispatcher.Dispatcher()
+        disp.register(entry_point.EntryPoint("service", "method"),
+                      "request", "handler")
+        disp.register(entry_point.EntryPoint("service", "other"),
+                      "request", "other_handler")
+        disp.register(entry_point.EntryPoint("remote", "event"),
+                      "notification", "on_event")
+        discovery = mock.MagicMock()
+        discovery.get_all_exchanges.return_value = {
+            "remote": ["remote_exchange"],
+            "remote_publisher": ["remote_notifications"],
+            "local_publisher": ["service_notifications"]
+        }
+        discovery.get_remote_publisher.return_value = "remote_notifications"
+        self.service_cls = mock.MagicMock()
+        self.service_cls.get_dispatcher.return_value = disp
+        self.service_cls.get_discovery.return_value = discovery
+        self.config = mock.MagicMock()
+        self.config.memory_engine = False
+        self.server = server.Server(self.config, "queue", "exchange",
+                                    [self.service_cls, self.service_cls])
+        self.server._driver = mock.MagicMock()
+
+    def test_plan_contains_unique_structures(self):
+        """
+        Tests that planner collects exchanges, queue and bindings of all
+        services without duplicates
+        """
+        plan = self.server._plan_amqp_structures()
+        self.assertEqual(sorted(plan.exchanges),
+                         [("exchange", "topic"),
+                          ("remote_exchange", "topic"),
+                          ("remote_notifications", "topic"),
+                          ("service_notifications", "topic")])
+        self.assertEqual(plan.queues, ["queue"])
+        self.assertEqual(plan.bindings,
+                         [("queue", "exchange", "service.#"),
+                          ("queue", "remote_notifications",
+                           "remote.event.#")])
+        self.assertEqual(
+            self.service_cls.get_discovery().get_all_exchanges.call_count, 2)
+
+    def test_structures_are_declared_once(self):
+        """
+        Tests that all structures are declared by one driver call
+        """
+        self.server._create_amqp_structures()
+        self.server._driver.declare_topology.assert_called_once_with(
+            mock.ANY)
+
+    def test_cached_topology_is_not_declared(self):
+        """
+        Tests that declaration is skipped if cache contains fingerprint of
+        the same topology
+        """
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.server._topology_cache = os.path.join(tmp_dir, "cache")
+
+        self.server._create_amqp_structures()
+        self.server._create_amqp_structures()
+
+        self.assertEqual(self.server._driver.declare_topology.call_count, 1)
+
+    def test_memory_engine_ignores_topology_cache(self):
+        """
+        Tests that in-process broker structures are declared even if cache
+        contains fingerprint saved by another process
+        """
+        memory.reset_brokers()
+        self.addCleanup(memory.reset_brokers)
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        cache_path = os.path.join(tmp_dir, "cache")
+        conf = config.ConnectionConfig(
+            "host", config.Credentials("user", "password"),
+            memory_engine=True)
+        srv = server.Server(conf, "queue", "exchange", [self.service_cls],
+                            topology_cache=cache_path)
+        cache = topology.TopologyCache(cache_path)
+        cache.save(srv._get_topology_fingerprint(
+            srv._plan_amqp_structures()))
+
+        srv._create_amqp_structures()
+
+        broker = memory.get_broker(conf.virtual_host)
+        self.assertIsNotNone(broker.get_queue("queue"))
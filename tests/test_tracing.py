@@ -0,0 +1,206 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from tavrida import instrumentation
+from tavrida import messages
+from tavrida import tracing
+from tavrida import utils
+
+
+class ListExporter(tracing.SpanExporter):
+
+    def __init__(self):
+        super(ListExporter, self).__init__()
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+
+class TracerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(TracerTestCase, self).setUp()
+        self.exporter = ListExporter()
+        self.tracer = tracing.Tracer(self.exporter)
+        self.headers = {
+            "source": "src_service.src_method",
+            "destination": "dst_service.dst_method",
+            "reply_to": "src_service.on_method",
+            "correlation_id": "123",
+            "request_id": "456",
+            "message_id": "789",
+            "message_type": "request"
+        }
+
+    def _run(self, stage, message, func=lambda: None, observers=None):
+        return instrumentation.run_stage(observers or (self.tracer,), stage,
+                                         message, func, ())
+
+    def test_send_span_id_is_sent_in_header(self):
+        """
+        Tests that published message carries id of its send span
+        """
+        message = messages.AMQPMessage("body", self.headers)
+        self._run(instrumentation.PUBLISH, message)
+        span = self.exporter.spans[0]
+        self.assertEqual(span.kind, tracing.SEND)
+        self.assertEqual(span.trace_id, "123")
+        self.assertEqual(span.name, "dst_service.dst_method")
+        self.assertIsNone(span.parent_id)
+        self.assertEqual(self.headers[tracing.SPAN_ID_HEADER], span.span_id)
+
+    def test_spans_are_nested(self):
+        """
+        Tests that receive span is child of send span of message, handle
+        span and publication of nested request are children of spans
+        active in thread
+        """
+        self.headers[tracing.SPAN_ID_HEADER] = "sender"
+        incoming = messages.AMQPMessage("body", self.headers)
+        nested = messages.AMQPMessage("body", dict(self.headers))
+
+        def handle():
+            self._run(instrumentation.PUBLISH, nested)
+
+        def process():
+            self._run(instrumentation.VALIDATION, incoming)
+            self._run(instrumentation.HANDLER, incoming, handle)
+
+        self._run(instrumentation.PROCESSING, incoming, process)
+
+        send, handler, receive = self.exporter.spans
+        self.assertEqual(receive.parent_id, "sender")
+        self.assertEqual(handler.parent_id, receive.span_id)
+        self.assertEqual(send.parent_id, handler.span_id)
+        self.assertEqual(nested.headers[tracing.SPAN_ID_HEADER],
+                         send.span_id)
+        self.assertEqual(receive.kind, tracing.RECEIVE)
+        self.assertEqual(handler.kind, tracing.HANDLE)
+
+    @unittest.skipIf(utils.asyncio is None, "asyncio is not available")
+    def test_coroutine_handler_span(self):
+        """
+        Tests that span of coroutine handler is open until coroutine is
+        done, its nested publications are its children and spans of other
+        messages handled meanwhile are not
+        """
+        loop = utils.asyncio.get_event_loop()
+        incoming = messages.AMQPMessage("body", self.headers)
+        nested = messages.AMQPMessage("body", dict(self.headers))
+        other = messages.AMQPMessage("body", dict(self.headers))
+
+        @utils.asyncio.coroutine
+        def handle():
+            yield utils.asyncio.From(utils.asyncio.sleep(0, loop=loop))
+            self._run(instrumentation.PUBLISH, nested)
+
+        instrumentation.register_observer(self.tracer)
+        self.addCleanup(instrumentation.unregister_observer, self.tracer)
+        future = instrumentation.observe_awaitable(
+            instrumentation.PROCESSING, incoming,
+            lambda: instrumentation.observe_awaitable(
+                instrumentation.HANDLER, incoming, handle, ()), ())
+        self._run(instrumentation.PROCESSING, other)
+        self.assertEqual(len(self.exporter.spans), 1)
+        loop.run_until_complete(future)
+
+        other_span, send, handler, receive = self.exporter.spans
+        self.assertIsNone(other_span.parent_id)
+        self.assertEqual(send.parent_id, handler.span_id)
+        self.assertEqual(handler.parent_id, receive.span_id)
+        self.assertEqual(receive.kind, tracing.RECEIVE)
+        self.assertGreaterEqual(handler.duration, 0)
+
+    def test_error_is_recorded(self):
+        """
+        Tests that span of failed stage has class of exception
+        """
+        def fail():
+            raise ValueError()
+
+        self.assertRaises(ValueError, self._run, instrumentation.HANDLER,
+                          messages.AMQPMessage("body", self.headers), fail)
+        self.assertEqual(self.exporter.spans[0].error,
+                         "exceptions.ValueError")
+
+    def test_not_sampled_trace(self):
+        """
+        Tests that spans of not sampled traces are not exported and
+        message gets no span header
+        """
+        tracer = tracing.Tracer(self.exporter, tracing.Sampler(0))
+        message = messages.AMQPMessage("body", self.headers)
+        self._run(instrumentation.PUBLISH, message, observers=(tracer,))
+        self.assertEqual(self.exporter.spans, [])
+        self.assertNotIn(tracing.SPAN_ID_HEADER, self.headers)
+
+    def test_batch_publication_is_not_traced(self):
+        """
+        Tests that publication of batch has no span
+        """
+        self._run(instrumentation.PUBLISH, None)
+        self.assertEqual(self.exporter.spans, [])
+
+    def test_exporter_errors_are_ignored(self):
+        """
+        Tests that exception of exporter doesn't break processing
+        """
+        self.exporter.export = mock.MagicMock(side_effect=IOError())
+        self._run(instrumentation.HANDLER,
+                  messages.AMQPMessage("body", self.headers))
+        self.assertTrue(self.exporter.export.called)
+
+
+class SamplerTestCase(unittest.TestCase):
+
+    def test_decision_depends_on_trace_id(self):
+        """
+        Tests that sampler makes the same decision for the same trace and
+        samples about given share of traces
+        """
+        sampler = tracing.Sampler(0.25)
+        trace_ids = [str(i) for i in range(4000)]
+        sampled = [sampler.is_sampled(trace_id) for trace_id in trace_ids]
+        self.assertEqual(sampled,
+                         [tracing.Sampler(0.25).is_sampled(trace_id)
+                          for trace_id in trace_ids])
+        self.assertAlmostEqual(sum(sampled) / 4000.0, 0.25, delta=0.03)
+
+
+class FileExporterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super(FileExporterTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, "spans.json")
+
+    def test_spans_are_appended_as_json_lines(self):
+        """
+        Tests that every span is written as JSON line
+        """
+        tracer = tracing.enable(self.path)
+        self.assertIn(tracer, instrumentation.get_observers())
+        headers = {"correlation_id": "123", "message_type": "request",
+                   "destination": "service.method"}
+        instrumentation.observe(instrumentation.HANDLER,
+                                messages.AMQPMessage("body", headers),
+                                lambda: None, ())
+        instrumentation.observe(instrumentation.HANDLER,
+                                messages.AMQPMessage("body", headers),
+                                lambda: None, ())
+        tracing.disable(tracer)
+
+        self.assertNotIn(tracer, instrumentation.get_observers())
+        with open(self.path) as spans_file:
+            spans = [json.loads(line) for line in spans_file]
+        self.assertEqual(len(spans), 2)
+        self.assertEqual(spans[0]["trace_id"], "123")
+        self.assertEqual(spans[0]["name"], "service.method")
+        self.assertEqual(spans[0]["kind"], tracing.HANDLE)